@@ -1,9 +1,6 @@
 from flask import Flask, render_template, request, jsonify, send_file, Response
 import os
 import json
-import base64
-from io import BytesIO
-from PIL import Image
 import logging
 import requests
 import time
@@ -12,7 +9,12 @@ from googletrans import Translator
 import re
 
 # 导入您的检索系统 - 修改这里的导入路径
-from main import EnhancedDatabaseImageRetrievalSystem
+from main import EnhancedDatabaseImageRetrievalSystem, IndexBuildCancelled
+from thumbnail_store import ThumbnailStore
+from result_cache import SearchResultCache
+from index_monitor import IndexHealthMonitor
+from job_manager import JobManager
+from image_watcher import ImageWatcher
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +27,26 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY', '')
 OPENROUTER_MODEL = os.getenv('OPENROUTER_MODEL', 'anthropic/claude-sonnet-4')
 CLIP_MODEL = os.getenv('CLIP_MODEL', 'ViT-B/32')
+CLIP_PREPROCESS_WORKERS = int(os.getenv('CLIP_PREPROCESS_WORKERS', '0'))  # 构建索引时的图片预处理进程数
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', './embedding_cache')  # 图片特征缓存目录，置空则禁用
+VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'chromadb')  # 向量库后端: chromadb / numpy
+NUMPY_INDEX_DIR = os.getenv('NUMPY_INDEX_DIR', './numpy_index')  # numpy后端存储目录
+VECTOR_ANN = os.getenv('VECTOR_ANN', '') or None  # numpy后端近似索引: 置空为精确检索, ivf为倒排索引
+VECTOR_CODEC = os.getenv('VECTOR_CODEC', '') or None  # numpy后端向量压缩: 置空为不压缩, pq / int8
+BATCH_SEARCH_MAX_QUERIES = int(os.getenv('BATCH_SEARCH_MAX_QUERIES', '500'))  # /api/search/batch单次最多查询数
+BATCH_SEARCH_MAX_TOP_K = int(os.getenv('BATCH_SEARCH_MAX_TOP_K', '100'))  # /api/search/batch每个查询最多返回的结果数
+THUMBNAIL_DIR = os.getenv('THUMBNAIL_DIR', './thumbnails')  # 缩略图目录
+PRECOMPUTE_THUMBNAILS = os.getenv('PRECOMPUTE_THUMBNAILS', 'true').lower() == 'true'  # 构建索引时顺带生成缩略图
+THUMBNAIL_MAX_AGE = int(os.getenv('THUMBNAIL_MAX_AGE', str(365 * 24 * 3600)))  # 带版本号的缩略图URL的缓存时间（秒）
+MICRO_BATCH_MAX_SIZE = int(os.getenv('MICRO_BATCH_MAX_SIZE', '16'))  # 并发查询编码合并的最大批大小，0为不合并
+MICRO_BATCH_MAX_WAIT_MS = float(os.getenv('MICRO_BATCH_MAX_WAIT_MS', '5'))  # 请求合并的最长等待时间（毫秒）
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1024'))  # 基础/智能搜索结果缓存条数，0为禁用
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', '300'))  # 搜索结果缓存有效期（秒）
+INDEX_CHECK_INTERVAL = float(os.getenv('INDEX_CHECK_INTERVAL', '300'))  # 后台索引健康检查间隔（秒）
+IMAGE_WATCHER = os.getenv('IMAGE_WATCHER', 'false').lower() == 'true'  # 监听scraper_data新增/删除图片并增量写入索引
+IMAGE_WATCHER_INTERVAL = float(os.getenv('IMAGE_WATCHER_INTERVAL', '30'))  # 目录轮询间隔（秒），inotify模式下为兜底扫描间隔
+IMAGE_WATCHER_BATCH_SIZE = int(os.getenv('IMAGE_WATCHER_BATCH_SIZE', '16'))  # 新图片编码与写入批大小
+IMAGE_WATCHER_UNMATCHED_MAX_AGE = float(os.getenv('IMAGE_WATCHER_UNMATCHED_MAX_AGE', '600'))  # 暂无数据库记录的图片最长重试时间（秒）
 
 # 外部API配置
 PEXELS_API_KEY = os.getenv('PEXELS_API_KEY', '')
@@ -35,6 +57,16 @@ PIXABAY_API_KEY = os.getenv('PIXABAY_API_KEY', '')
 retrieval_system = None
 system_initialized = False
 last_index_check = None
+index_monitor = None  # 后台索引健康检查线程，检索系统初始化后启动
+image_watcher = None  # 图片目录监听线程（IMAGE_WATCHER=true时启动）
+job_manager = JobManager()  # 索引重建/同步后台任务
+
+# 缩略图存储，以及搜索结果中出现过的 图片ID -> 路径（缩略图路由据此免查向量库）
+thumbnail_store = ThumbnailStore(THUMBNAIL_DIR)
+thumbnail_image_paths = {}
+
+# 搜索结果缓存，键中含向量库版本，索引重建或增量同步后自动失效
+search_result_cache = SearchResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
 
 def search_pixabay(query, page=1, per_page=20):
     """搜索Pixabay图片"""
@@ -85,76 +117,9 @@ def search_pixabay(query, page=1, per_page=20):
     
     return results
 
-def safe_image_to_jpeg_base64(image_path, max_size=(300, 300), quality=85):
-    """
-    安全地将图片转换为JPEG格式的base64编码
-    处理各种图片格式和模式
-    """
-    try:
-        with Image.open(image_path) as img:
-            # 获取原始模式
-            original_mode = img.mode
-            logger.debug(f"处理图片 {image_path}, 原始模式: {original_mode}")
-            
-            # 根据不同的图片模式进行处理
-            if original_mode in ('RGBA', 'LA'):
-                # 有Alpha通道的图片，需要合成到白色背景
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if original_mode == 'RGBA':
-                    # 使用Alpha通道进行合成
-                    background.paste(img, mask=img.split()[-1])
-                else:  # LA mode
-                    # 灰度+Alpha，先转换为RGBA
-                    img_rgba = img.convert('RGBA')
-                    background.paste(img_rgba, mask=img_rgba.split()[-1])
-                processed_img = background
-                
-            elif original_mode == 'P':
-                # 调色板模式
-                if 'transparency' in img.info:
-                    # 有透明度信息，转换为RGBA再合成
-                    img_rgba = img.convert('RGBA')
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img_rgba, mask=img_rgba.split()[-1])
-                    processed_img = background
-                else:
-                    # 无透明度，直接转换为RGB
-                    processed_img = img.convert('RGB')
-                    
-            elif original_mode in ('L', '1'):
-                # 灰度或二值图像，转换为RGB
-                processed_img = img.convert('RGB')
-                
-            elif original_mode == 'CMYK':
-                # CMYK模式转换为RGB
-                processed_img = img.convert('RGB')
-                
-            elif original_mode == 'RGB':
-                # 已经是RGB，直接使用
-                processed_img = img.copy()
-                
-            else:
-                # 其他未知模式，强制转换为RGB
-                logger.warning(f"未知图片模式 {original_mode}，强制转换为RGB")
-                processed_img = img.convert('RGB')
-            
-            # 压缩尺寸
-            processed_img.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # 保存为JPEG格式的base64
-            buffer = BytesIO()
-            processed_img.save(buffer, format='JPEG', quality=quality, optimize=True)
-            img_str = base64.b64encode(buffer.getvalue()).decode()
-            
-            return f"data:image/jpeg;base64,{img_str}"
-            
-    except Exception as e:
-        logger.error(f"图片处理失败 {image_path}: {e}")
-        return None
-
 def init_retrieval_system():
     """延迟初始化检索系统"""
-    global retrieval_system, system_initialized
+    global retrieval_system, system_initialized, index_monitor, image_watcher
     
     if system_initialized and retrieval_system is not None:
         logger.info("检索系统已初始化，跳过重复初始化")
@@ -166,18 +131,50 @@ def init_retrieval_system():
             clip_model=CLIP_MODEL,
             chromadb_port=6600,
             openrouter_api_key=OPENROUTER_API_KEY,
-            openrouter_model=OPENROUTER_MODEL
+            openrouter_model=OPENROUTER_MODEL,
+            preprocess_workers=CLIP_PREPROCESS_WORKERS,
+            embedding_cache_dir=EMBEDDING_CACHE_DIR or None,
+            vector_backend=VECTOR_BACKEND,
+            numpy_index_dir=NUMPY_INDEX_DIR,
+            vector_ann=VECTOR_ANN,
+            vector_codec=VECTOR_CODEC,
+            thumbnail_dir=THUMBNAIL_DIR if PRECOMPUTE_THUMBNAILS else None,
+            micro_batch_size=MICRO_BATCH_MAX_SIZE,
+            micro_batch_wait_ms=MICRO_BATCH_MAX_WAIT_MS
         )
         
         system_initialized = True
         logger.info("✅ 检索系统初始化完成")
         
+        # MySQL计数等一致性检查移到后台线程，请求只读快照
+        index_monitor = IndexHealthMonitor(check_and_manage_index, INDEX_CHECK_INTERVAL)
+        index_monitor.start()
+        
+        # 新图片落盘后增量写入索引，索引任务进行中时暂缓
+        if IMAGE_WATCHER:
+            image_watcher = ImageWatcher(
+                f'{retrieval_system.db_processor.image_path_prefix}scraper_data/',
+                retrieval_system.db_processor.refresh_file_catalog,
+                sync_watched_files,
+                interval_seconds=IMAGE_WATCHER_INTERVAL,
+                unmatched_max_age_seconds=IMAGE_WATCHER_UNMATCHED_MAX_AGE,
+                is_busy=lambda: job_manager.active_job() is not None
+            )
+            image_watcher.start()
+        
     except Exception as e:
         logger.error(f"检索系统初始化失败: {e}")
         raise
     
     return retrieval_system
 
+def sync_watched_files(added_paths, removed_paths):
+    """把目录监听发现的新增/删除图片同步到在线集合"""
+    result = retrieval_system.sync_image_files(added_paths, removed_paths, batch_size=IMAGE_WATCHER_BATCH_SIZE)
+    if (result['added'] or result['deleted']) and index_monitor is not None:
+        index_monitor.refresh()
+    return result
+
 def check_and_manage_index():
     """检查并管理索引状态"""
     global retrieval_system, last_index_check
@@ -186,15 +183,18 @@ def check_and_manage_index():
         retrieval_system = init_retrieval_system()
     
     try:
+        # 其他进程（如命令行全量重建）可能已切换在线集合
+        retrieval_system.sync_live_collection()
+        
         # 检查索引状态
         status = retrieval_system.check_index_status()
         
         # 记录检查时间
         last_index_check = time.time()
+        indexed_count = status.get('indexed_count', 0)
         
         if status.get('need_rebuild', False):
             update_info = status.get('update_info', {})
-            indexed_count = status.get('indexed_count', 0)
             database_count = status.get('database_count', 0)
             
             logger.info(f"📊 索引状态检查:")
@@ -245,47 +245,98 @@ def check_and_manage_index():
         return {'error': str(e)}
 
 def auto_rebuild_index():
-    """自动重建索引"""
-    global retrieval_system
-    
+    """自动重建索引（以后台任务运行）"""
     try:
         logger.info("🔄 开始自动重建索引...")
-        
-        # 使用智能索引管理
-        rebuild_result = retrieval_system.smart_index_management(
-            force_rebuild=True,
-            limit=183247
-        )
-        
-        if rebuild_result:
-            final_status = retrieval_system.check_index_status()
-            indexed_count = final_status.get('indexed_count', 0)
-            
-            logger.info(f"✅ 自动重建完成: {indexed_count:,} 条记录")
-            return {
-                'status': 'rebuilt', 
-                'indexed_count': indexed_count,
-                'message': f"自动重建完成，索引了 {indexed_count:,} 条记录"
-            }
-        else:
-            logger.error("❌ 自动重建失败")
-            return {'error': '自动重建失败'}
-            
+        job = start_index_job(mode='full', force=True)
+    except RuntimeError:
+        job = job_manager.active_job()
     except Exception as e:
         logger.error(f"自动重建索引失败: {e}")
         return {'error': str(e)}
+    
+    return {
+        'status': 'rebuilding',
+        'job_id': job.id if job else None,
+        'message': "正在后台构建索引"
+    }
 
-def ensure_data_ready():
-    """确保数据就绪（智能检查）"""
-    global retrieval_system, last_index_check
+def start_index_job(mode: str = 'auto', force: bool = False, limit: int = 183247):
+    """
+    启动索引重建/增量同步后台任务
+    Raises:
+        RuntimeError: 已有任务在运行
+    """
+    system = init_retrieval_system()
+    
+    def run(job):
+        def progress_callback(progress):
+            job.update(progress)
+            if job.cancel_requested:
+                raise IndexBuildCancelled(f"任务 {job.id} 已取消")
+        
+        if mode == 'incremental':
+            logger.info("🔄 开始增量同步索引...")
+            return system.incremental_sync(progress_callback=progress_callback)
+        
+        logger.info(f"🔄 开始重建索引 (force={force}, limit={limit}, mode={mode})...")
+        rebuild_result = system.smart_index_management(
+            force_rebuild=force or mode == 'full',
+            limit=limit,
+            incremental=mode != 'full',
+            interactive=False,
+            progress_callback=progress_callback
+        )
+        if not rebuild_result:
+            raise RuntimeError('重建失败')
+        
+        final_status = system.check_index_status()
+        return {
+            'indexed_count': final_status.get('indexed_count', 0),
+            'database_count': final_status.get('database_count', 0)
+        }
     
-    # 如果最近检查过且时间不长，跳过检查
-    if last_index_check and (time.time() - last_index_check) < 300:  # 5分钟内
-        logger.debug("最近已检查过索引状态，跳过重复检查")
-        return {'status': 'cached'}
+    def on_finish(job):
+        # 失败时不立即重新检查，避免初次构建反复失败时频繁重试
+        if job.status == 'succeeded' and index_monitor is not None:
+            index_monitor.refresh()
+    
+    return job_manager.submit(
+        'incremental_sync' if mode == 'incremental' else 'rebuild', run,
+        params={'mode': mode, 'force': force, 'limit': limit},
+        on_finish=on_finish
+    )
+
+def ensure_data_ready():
+    """确保数据就绪（读取后台检查线程发布的最近快照，不阻塞在MySQL上）"""
+    if index_monitor is None:
+        init_retrieval_system()
     
-    # 执行索引检查和管理
-    return check_and_manage_index()
+    snapshot = index_monitor.snapshot
+    if snapshot is None:
+        # 首次检查尚未完成（或正在初次构建索引），先放行请求
+        return {'status': 'checking'}
+    return snapshot
+
+def parse_positive_int(value, name, default=None, maximum=None):
+    """
+    解析请求中的正整数参数（未提供时返回default）
+    Raises:
+        ValueError: 不是正整数或超过上限（路由中返回400）
+    """
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f'{name} 必须是正整数')
+    try:
+        parsed = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} 必须是正整数')
+    if parsed < 1:
+        raise ValueError(f'{name} 必须是正整数')
+    if maximum is not None and parsed > maximum:
+        raise ValueError(f'{name} 不能超过 {maximum}')
+    return parsed
 
 @app.route('/')
 def index():
@@ -317,7 +368,13 @@ def system_info():
                     'unsplash': bool(UNSPLASH_ACCESS_KEY),
                     'pixabay': bool(PIXABAY_API_KEY),
                 },
-                'index_status': index_status  # 添加索引状态信息
+                'index_status': index_status,  # 添加索引状态信息
+                'text_cache': info.get('text_cache'),
+                'micro_batching': info.get('micro_batching'),
+                'result_cache': search_result_cache.get_stats(),
+                'index_monitor': index_monitor.get_stats(),
+                'image_watcher': image_watcher.get_stats() if image_watcher is not None else None,
+                'thumbnails': {**thumbnail_store.get_stats(), **thumbnail_store.get_disk_stats()},
             }
         })
     except Exception as e:
@@ -348,47 +405,89 @@ def check_index_status_api():
 
 @app.route('/api/rebuild_index', methods=['POST'])
 def rebuild_index_api():
-    """重建索引API"""
+    """重建索引API：启动后台任务并立即返回任务ID，进度通过 /api/jobs/<job_id> 查询"""
     try:
         data = request.get_json() or {}
         force = data.get('force', False)
         limit = data.get('limit', 183247)
+        mode = data.get('mode', 'auto')  # auto / incremental / full
         
-        system = init_retrieval_system()
-        
-        logger.info(f"🔄 开始手动重建索引 (force={force}, limit={limit})...")
-        
-        # 使用智能索引管理
-        rebuild_result = system.smart_index_management(
-            force_rebuild=force,
-            limit=limit
-        )
-        
-        if rebuild_result:
-            final_status = system.check_index_status()
-            indexed_count = final_status.get('indexed_count', 0)
-            
+        if mode not in ('auto', 'incremental', 'full'):
             return jsonify({
-                'success': True,
-                'data': {
-                    'message': f"索引重建完成，索引了 {indexed_count:,} 条记录",
-                    'indexed_count': indexed_count,
-                    'status': final_status
-                }
-            })
-        else:
+                'success': False,
+                'error': f'不支持的模式: {mode}'
+            }), 400
+        
+        try:
+            job = start_index_job(mode=mode, force=force, limit=limit)
+        except RuntimeError as e:
+            active = job_manager.active_job()
             return jsonify({
                 'success': False,
-                'error': '重建失败'
-            })
+                'error': str(e),
+                'job_id': active.id if active else None
+            }), 409
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'message': f"索引任务已启动 (mode={mode})",
+                'job_id': job.id,
+                'status_url': f"/api/jobs/{job.id}"
+            }
+        }), 202
             
     except Exception as e:
-        logger.error(f"手动重建索引失败: {e}")
+        logger.error(f"启动索引任务失败: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         })
 
+@app.route('/api/jobs')
+def list_jobs_api():
+    """列出最近的后台任务"""
+    return jsonify({
+        'success': True,
+        'data': job_manager.list_jobs()
+    })
+
+@app.route('/api/jobs/<job_id>')
+def get_job_api(job_id):
+    """查询后台任务的阶段、进度、速度、预计剩余时间与错误数"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'data': job.to_dict()
+    })
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_api(job_id):
+    """取消后台任务（在下一个编码批次后停止，构建检查点保留，可再次启动续建）"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'error': '任务不存在'
+        }), 404
+    
+    if not job.cancel():
+        return jsonify({
+            'success': False,
+            'error': f'任务已结束: {job.status}'
+        }), 409
+    
+    return jsonify({
+        'success': True,
+        'data': job.to_dict()
+    })
+
 @app.route('/api/search/intelligent', methods=['POST'])
 def intelligent_search():
     """智能搜索"""
@@ -421,6 +520,12 @@ def intelligent_search():
                 'error': 'LLM功能未启用'
             })
         
+        cache_key = (search_result_cache.normalize(query), int(top_k))
+        cache_version = (system.chromadb.collection_name, system.chromadb.version)
+        cached = search_result_cache.get('intelligent', cache_key, cache_version)
+        if cached is not None:
+            return jsonify({'success': True, 'data': dict(cached, query=query)})
+        
         logger.info(f"执行智能搜索: {query}")
         results = system.search_by_text_intelligent(query, top_k)
         
@@ -430,14 +535,19 @@ def intelligent_search():
             formatted_result = format_search_result(result)
             formatted_results.append(formatted_result)
         
+        response_data = {
+            'query': query,
+            'results': formatted_results,
+            'query_analysis': results[0].get('query_analysis', {}) if results else {},
+            'search_type': 'intelligent'
+        }
+        # 空结果可能来自检索异常，不缓存
+        if formatted_results:
+            search_result_cache.put('intelligent', cache_key, cache_version, response_data)
+        
         return jsonify({
             'success': True,
-            'data': {
-                'query': query,
-                'results': formatted_results,
-                'query_analysis': results[0].get('query_analysis', {}) if results else {},
-                'search_type': 'intelligent'
-            }
+            'data': response_data
         })
         
     except Exception as e:
@@ -464,6 +574,10 @@ def basic_search():
         data = request.get_json()
         query = data.get('query', '').strip()
         top_k = data.get('top_k', 9)
+        try:
+            nprobe = parse_positive_int(data.get('nprobe'), 'nprobe')  # 可选，近似索引探测簇数量
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         if not query:
             return jsonify({
@@ -473,8 +587,14 @@ def basic_search():
         
         system = init_retrieval_system()
         
+        cache_key = (search_result_cache.normalize(query), int(top_k), nprobe)
+        cache_version = (system.chromadb.collection_name, system.chromadb.version)
+        cached = search_result_cache.get('basic', cache_key, cache_version)
+        if cached is not None:
+            return jsonify({'success': True, 'data': dict(cached, query=query)})
+        
         logger.info(f"执行基础搜索: {query}")
-        results = system.search_by_text(query, top_k)
+        results = system.search_by_text(query, top_k, nprobe=nprobe)
         
         # 转换结果格式
         formatted_results = []
@@ -482,17 +602,81 @@ def basic_search():
             formatted_result = format_search_result(result)
             formatted_results.append(formatted_result)
         
+        response_data = {
+            'query': query,
+            'results': formatted_results,
+            'search_type': 'basic'
+        }
+        # 空结果可能来自检索异常，不缓存
+        if formatted_results:
+            search_result_cache.put('basic', cache_key, cache_version, response_data)
+        
+        return jsonify({
+            'success': True,
+            'data': response_data
+        })
+        
+    except Exception as e:
+        logger.error(f"基础搜索失败: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        })
+
+@app.route('/api/search/batch', methods=['POST'])
+def batch_search():
+    """批量文本搜索：一次请求提交多个查询，共享一次批量编码和检索"""
+    try:
+        data_status = ensure_data_ready()
+        if data_status.get('needs_user_action'):
+            return jsonify({
+                'success': False,
+                'error': f"数据库有更新，{data_status.get('message', '建议重建索引')}",
+                'needs_rebuild': True,
+                'rebuild_info': data_status.get('status')
+            })
+        
+        data = request.get_json() or {}
+        queries = [str(query).strip() for query in data.get('queries', []) if str(query).strip()]
+        try:
+            top_k = parse_positive_int(data.get('top_k'), 'top_k', default=9, maximum=BATCH_SEARCH_MAX_TOP_K)
+            nprobe = parse_positive_int(data.get('nprobe'), 'nprobe')
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        if not queries:
+            return jsonify({
+                'success': False,
+                'error': '查询列表不能为空'
+            })
+        
+        if len(queries) > BATCH_SEARCH_MAX_QUERIES:
+            return jsonify({
+                'success': False,
+                'error': f'单次最多 {BATCH_SEARCH_MAX_QUERIES} 个查询'
+            })
+        
+        system = init_retrieval_system()
+        
+        logger.info(f"执行批量搜索: {len(queries)} 个查询")
+        batch_results = system.search_by_texts(queries, top_k, nprobe=nprobe)
+        
         return jsonify({
             'success': True,
             'data': {
-                'query': query,
-                'results': formatted_results,
-                'search_type': 'basic'
+                'results': [
+                    {
+                        'query': query,
+                        'results': [format_search_result(result) for result in results]
+                    }
+                    for query, results in zip(queries, batch_results)
+                ],
+                'search_type': 'batch'
             }
         })
         
     except Exception as e:
-        logger.error(f"基础搜索失败: {e}")
+        logger.error(f"批量搜索失败: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
@@ -722,6 +906,10 @@ def image_search():
         
         file = request.files['image']
         top_k = int(request.form.get('top_k', 9))
+        try:
+            nprobe = parse_positive_int(request.form.get('nprobe'), 'nprobe')  # 可选，近似索引探测簇数量
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
         
         if file.filename == '':
             return jsonify({
@@ -737,7 +925,7 @@ def image_search():
             system = init_retrieval_system()
             
             logger.info(f"执行以图搜图: {file.filename}")
-            results = system.search_by_image(temp_path, top_k)
+            results = system.search_by_image(temp_path, top_k, nprobe=nprobe)
             
             # 转换结果格式
             formatted_results = []
@@ -846,15 +1034,26 @@ def serve_image(image_path):
         logger.error(f"图片服务失败: {e}")
         return "Image error", 500
 
+def thumbnail_url_for(image_id, image_path):
+    """生成带版本号的缩略图URL，原图不存在时返回None"""
+    if image_id in ('', None) or not image_path:
+        return None
+    
+    key = thumbnail_store.key_for(image_path)
+    if key is None:
+        return None
+    
+    if len(thumbnail_image_paths) > 100000:
+        thumbnail_image_paths.clear()
+    thumbnail_image_paths[str(image_id)] = image_path
+    return f"/api/thumb/{image_id}?v={key}"
+
 def format_search_result(result):
     """格式化搜索结果"""
     try:
-        # 获取图片的base64编码用于前端显示
+        # 缩略图以URL形式返回，由/api/thumb提供并由浏览器缓存
         image_path = result.get('image_path', '')
-        image_base64 = None
-        
-        if image_path and os.path.exists(image_path):
-            image_base64 = safe_image_to_jpeg_base64(image_path)
+        thumbnail_url = thumbnail_url_for(result.get('id', ''), image_path)
         
         # 获取显示标签
         display_tags = (
@@ -872,8 +1071,8 @@ def format_search_result(result):
             'id': result.get('id', ''),
             'filename': result.get('filename', ''),
             'image_path': image_path,
-            'image_base64': image_base64,
-            'image_exists': os.path.exists(image_path) if image_path else False,
+            'thumbnail_url': thumbnail_url,
+            'image_exists': thumbnail_url is not None,
             'display_tags': str(display_tags),
             'similarity': result.get('similarity', 0),
             'original_url': result.get('original_url', ''),
@@ -888,6 +1087,36 @@ def format_search_result(result):
             'similarity': result.get('similarity', 0)
         }
 
+@app.route('/api/thumb/<int:image_id>')
+def serve_thumbnail(image_id):
+    """提供缩略图服务（支持ETag条件请求）"""
+    try:
+        image_path = thumbnail_image_paths.get(str(image_id))
+        if image_path is None:
+            system = init_retrieval_system()
+            results = system.chromadb.get_images_by_ids([image_id], include=['metadatas'])
+            if not results or not results['metadatas']:
+                return "Image not found", 404
+            image_path = results['metadatas'][0].get('image_path', '')
+            thumbnail_image_paths[str(image_id)] = image_path
+        
+        thumbnail = thumbnail_store.get(image_path)
+        if thumbnail is None:
+            return "Image not found", 404
+        
+        thumb_path, key = thumbnail
+        # URL带有与内容对应的版本号时可长期缓存，否则要求每次用ETag校验
+        max_age = THUMBNAIL_MAX_AGE if request.args.get('v') == key else 0
+        response = send_file(thumb_path, mimetype='image/jpeg', conditional=True,
+                             etag=key, max_age=max_age)
+        if max_age == 0:
+            response.cache_control.no_cache = True
+        return response
+        
+    except Exception as e:
+        logger.error(f"缩略图服务失败: {e}")
+        return "Image error", 500
+
 @app.route('/api/search/similar_by_path', methods=['POST'])
 def search_similar_by_path():
     """基于图片路径搜索相似图片"""
@@ -913,18 +1142,20 @@ def search_similar_by_path():
                 'error': '图片路径不能为空'
             })
         
-        if not os.path.exists(image_path):
-            return jsonify({
-                'success': False,
-                'error': '图片文件不存在'
-            })
-        
         system = init_retrieval_system()
         
         logger.info(f"执行相似图搜索: {os.path.basename(image_path)}")
         
         search_count = top_k + 1 if exclude_self else top_k
-        results = system.search_by_image(image_path, search_count)
+        # 已索引的路径直接使用存储的向量，否则读取图片重新编码
+        results = system.search_by_indexed_path(image_path, search_count)
+        if results is None:
+            if not os.path.exists(image_path):
+                return jsonify({
+                    'success': False,
+                    'error': '图片文件不存在'
+                })
+            results = system.search_by_image(image_path, search_count)
         
         # 排除自身
         if exclude_self and results:
@@ -993,10 +1224,8 @@ def search_similar_by_id():
         
         # 从ChromaDB中查找对应的图片路径
         try:
-            collection = system.chromadb.collection
-            
-            results = collection.get(
-                where={"id": int(image_id)},
+            results = system.chromadb.get_images_by_ids(
+                [int(image_id)],
                 include=['metadatas']
             )
             
@@ -1008,16 +1237,18 @@ def search_similar_by_id():
             
             image_path = results['metadatas'][0].get('image_path', '')
             
-            if not image_path or not os.path.exists(image_path):
-                return jsonify({
-                    'success': False,
-                    'error': f'ID {image_id} 对应的图片文件不存在'
-                })
-            
             logger.info(f"基于ID {image_id} 执行相似图搜索: {os.path.basename(image_path)}")
             
             search_count = top_k + 1 if exclude_self else top_k
-            similar_results = system.search_by_image(image_path, search_count)
+            # 直接使用向量库中存储的向量，无需重新读取图片和运行CLIP
+            similar_results = system.search_by_vector_id(int(image_id), search_count)
+            if similar_results is None:
+                if not image_path or not os.path.exists(image_path):
+                    return jsonify({
+                        'success': False,
+                        'error': f'ID {image_id} 对应的图片文件不存在'
+                    })
+                similar_results = system.search_by_image(image_path, search_count)
             
             # 排除自身
             if exclude_self and similar_results:
@@ -1068,9 +1299,8 @@ def get_image_info(image_id):
         system = init_retrieval_system()
         
         # 从ChromaDB中查找图片信息
-        collection = system.chromadb.collection
-        results = collection.get(
-            where={"id": int(image_id)},
+        results = system.chromadb.get_images_by_ids(
+            [int(image_id)],
             include=['metadatas', 'documents']
         )
         
@@ -1094,13 +1324,9 @@ def get_image_info(image_id):
             'clip_model': metadata.get('clip_model', ''),
             'created_at': metadata.get('created_at', ''),
             'document': document,
-            'image_exists': os.path.exists(metadata.get('image_path', '')) if metadata.get('image_path') else False
+            'thumbnail_url': thumbnail_url_for(metadata.get('id', ''), metadata.get('image_path', ''))
         }
-        
-        # 添加图片base64编码
-        image_path = metadata.get('image_path', '')
-        if image_path and os.path.exists(image_path):
-            image_info['image_base64'] = safe_image_to_jpeg_base64(image_path)
+        image_info['image_exists'] = image_info['thumbnail_url'] is not None
         
         return jsonify({
             'success': True,
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IVF近似检索召回率报告
+以 NumpyVectorStore 精确检索结果为基准，统计不同 nprobe 下的 recall@k 与查询延迟
+
+用法:
+    python benchmarks/bench_ann_recall.py --rows 200000 --nprobe 1 4 8 16 32
+    python benchmarks/bench_ann_recall.py --index-dir ./numpy_index
+
+评估已有索引时只读取向量与元数据，IVF在临时目录中训练与保存，不会改动集合目录下线上使用的 ivf_* 文件；
+不指定 --collection 时按别名文件解析当前在线的集合
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import NumpyVectorStore, IVFIndex
+from collection_alias import DEFAULT_ALIAS_FILE, load_live_collection_name
+
+def make_clustered_vectors(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """构造带簇结构的单位向量（近似CLIP特征分布）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    vectors = centers[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def build_synthetic_store(index_dir: str, args) -> NumpyVectorStore:
+    """写入合成数据并训练IVF"""
+    vectors = make_clustered_vectors(args.rows, args.dim, args.clusters)
+    store = NumpyVectorStore(index_dir, "bench", ann="ivf", nlist=args.nlist,
+                             ann_min_train_size=args.rows + 1)
+
+    start = time.perf_counter()
+    for i in range(0, args.rows, 50000):
+        end = min(i + 50000, args.rows)
+        store.add_images(
+            vectors[i:end],
+            [{'id': j, 'image_path': f"/synthetic/{j}.jpg"} for j in range(i, end)],
+            [''] * (end - i),
+            [f"img_{j}" for j in range(i, end)]
+        )
+    print(f"📥 写入 {args.rows:,} 条向量, 耗时 {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    store.build_ann_index()
+    print(f"🧭 IVF训练 nlist={store.ann.nlist}, 耗时 {time.perf_counter() - start:.1f}s")
+    return store
+
+def sample_queries(store: NumpyVectorStore, count: int, seed: int = 1) -> np.ndarray:
+    """从库内向量加噪声生成查询"""
+    rng = np.random.default_rng(seed)
+    rows = np.flatnonzero(store._valid)
+    picked = rng.choice(rows, min(count, len(rows)), replace=False)
+    queries = np.asarray(store._vectors[picked], dtype=np.float32)
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def timed_search(store: NumpyVectorStore, queries: np.ndarray, top_k: int, **kwargs):
+    """执行查询，返回 (结果ID列表, 每次耗时毫秒)"""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        result = store.search_similar_images(query, top_k, **kwargs)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(result['ids'][0])
+    return results, np.asarray(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description="IVF近似检索召回率报告")
+    parser.add_argument('--index-dir', help='已有numpy索引目录，不指定则使用合成数据')
+    parser.add_argument('--collection', help='已有索引的集合名，默认按别名文件解析当前在线的集合')
+    parser.add_argument('--base-collection', default='local_db_image_collection', help='别名文件中的基础集合名')
+    parser.add_argument('--alias-file', default=DEFAULT_ALIAS_FILE, help='集合别名文件')
+    parser.add_argument('--rows', type=int, default=200000, help='合成数据行数')
+    parser.add_argument('--dim', type=int, default=512, help='合成数据维度')
+    parser.add_argument('--clusters', type=int, default=200, help='合成数据的真实簇数量')
+    parser.add_argument('--nlist', type=int, default=None, help='IVF簇数量，默认自动')
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=9)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp(prefix="bench_ann_")
+    try:
+        if args.index_dir:
+            collection = args.collection or load_live_collection_name(
+                args.base_collection, backend="numpy", alias_file=args.alias_file)
+            if not os.path.isdir(os.path.join(args.index_dir, collection)):
+                sys.exit(f"❌ 集合目录不存在: {os.path.join(args.index_dir, collection)}")
+
+            # 不启用集合自带的IVF，训练结果写入临时目录
+            store = NumpyVectorStore(args.index_dir, collection)
+            store.ann = IVFIndex(temp_dir, args.nlist, store.default_nprobe)
+            if store.get_collection_info()['count'] == 0:
+                sys.exit(f"❌ 集合 {collection} 中没有向量")
+
+            start = time.perf_counter()
+            store.build_ann_index()
+            print(f"🧭 IVF训练 nlist={store.ann.nlist}, 耗时 {time.perf_counter() - start:.1f}s")
+        else:
+            store = build_synthetic_store(temp_dir, args)
+
+        queries = sample_queries(store, args.queries)
+        exact_ids, exact_latency = timed_search(store, queries, args.top_k, exact=True)
+
+        print(f"\n📊 recall@{args.top_k}（{len(queries)} 个查询, {store.get_collection_info()['count']:,} 条向量）")
+        print(f"{'方式':>12} {'recall':>8} {'平均ms':>8} {'p99ms':>8}")
+        print(f"{'exact':>12} {1.0:>8.4f} {exact_latency.mean():>8.2f} {np.percentile(exact_latency, 99):>8.2f}")
+
+        for nprobe in args.nprobe:
+            ann_ids, latency = timed_search(store, queries, args.top_k, nprobe=nprobe)
+            recall = np.mean([
+                len(set(found) & set(truth)) / max(len(truth), 1)
+                for found, truth in zip(ann_ids, exact_ids)
+            ])
+            print(f"{f'nprobe={nprobe}':>12} {recall:>8.4f} {latency.mean():>8.2f} "
+                  f"{np.percentile(latency, 99):>8.2f}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据清洗基准测试
+对比 _clean_data 旧版逐行apply（路径解析、标签合并、逐条os.path.exists）
+与 data_cleaning 中整列实现（目录清单判断存在性）的耗时，并校验两者输出一致
+
+用法:
+    python benchmarks/bench_clean_data.py --rows 200000
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_catalog import FileCatalog
+from data_cleaning import merge_tag_columns, resolve_image_paths, url_basenames, check_paths_exist
+
+TAG_FIELDS = ['ai_tags', 'tags']
+
+def make_synthetic_frame(rows: int, scraper_base: str, exists_ratio: float) -> pd.DataFrame:
+    """构造与work_copy428查询结果结构一致的合成数据，并在临时目录中创建部分图片文件"""
+    rng = np.random.default_rng(0)
+    ids = np.arange(1, rows + 1)
+    brands = np.array(['cherytiggo2', 'cherytiggo4', 'byd', 'geely', 'tesla'])
+    brand_col = brands[ids % len(brands)]
+    filenames = [f"{i:08d}.jpg" for i in ids]
+
+    ai_tag_choices = np.array([
+        '["SUV", "自然光线", "城市"]', '["轿车", "夜景"]', '[]', '["SUV", "", "户外"]',
+        '{"场景": "城市", "光线": ""}', '[1, 2, "三"]', '[broken', 'null', '', None
+    ], dtype=object)
+    tag_choices = np.array(['家庭出游', '  商务  ', 'None', '["露营"]', None], dtype=object)
+
+    df = pd.DataFrame({
+        'id': ids,
+        'image_url': [f"/scraper_data/{b}/{f}" for b, f in zip(brand_col, filenames)],
+        'ai_tags': ai_tag_choices[rng.integers(0, len(ai_tag_choices), rows)],
+        'tags': tag_choices[rng.integers(0, len(tag_choices), rows)],
+    })
+
+    # 只创建部分图片文件，其余记录对应缺失文件
+    for brand in brands:
+        os.makedirs(os.path.join(scraper_base, brand), exist_ok=True)
+    for b, f in zip(brand_col, filenames):
+        if rng.random() < exists_ratio:
+            open(os.path.join(scraper_base, b, f), 'wb').close()
+
+    return df
+
+def legacy_clean(df, file_mapping, image_path_prefix):
+    """旧版实现：逐行apply"""
+    def process_image_path(image_url):
+        if pd.isna(image_url) or image_url == '':
+            return ''
+        clean_url = str(image_url).strip()
+        filename = os.path.basename(clean_url)
+        if filename in file_mapping:
+            return file_mapping[filename]
+        if clean_url.startswith('/scraper_data/'):
+            return clean_url.replace('/scraper_data/', f'{image_path_prefix}scraper_data/')
+        else:
+            return os.path.join(image_path_prefix, clean_url.lstrip('/'))
+
+    def process_and_merge_tags(row):
+        combined_tags = []
+        for field in TAG_FIELDS:
+            if field in row and pd.notna(row[field]) and str(row[field]).strip():
+                field_value = str(row[field]).strip()
+                if field_value.lower() in ['null', 'none', '']:
+                    continue
+                try:
+                    if field_value.startswith('[') or field_value.startswith('{'):
+                        parsed = json.loads(field_value)
+                        if isinstance(parsed, list):
+                            parsed_tags = ', '.join(str(tag) for tag in parsed if tag)
+                        elif isinstance(parsed, dict):
+                            parsed_tags = ', '.join(f"{k}: {v}" for k, v in parsed.items() if v)
+                        else:
+                            parsed_tags = str(parsed)
+                        if parsed_tags:
+                            combined_tags.append(parsed_tags)
+                    else:
+                        combined_tags.append(field_value)
+                except (json.JSONDecodeError, Exception):
+                    combined_tags.append(field_value)
+        return ' | '.join(combined_tags) if combined_tags else '无标签信息'
+
+    def path_exists_check(path):
+        try:
+            return os.path.exists(path) if path else False
+        except:
+            return False
+
+    df = df.copy()
+    df['full_image_path'] = df['image_url'].apply(process_image_path)
+    df['processed_tags'] = df.apply(process_and_merge_tags, axis=1)
+    df['filename'] = df['image_url'].apply(lambda x: os.path.basename(x) if x else '')
+    df['file_exists'] = df['full_image_path'].apply(path_exists_check)
+    return df
+
+def vectorized_clean(df, catalog, image_path_prefix):
+    """新版实现：整列计算"""
+    df = df.copy()
+    df['full_image_path'] = resolve_image_paths(df['image_url'], catalog.file_mapping, image_path_prefix)
+    df['processed_tags'] = merge_tag_columns(df, TAG_FIELDS)
+    df['filename'] = url_basenames(df['image_url'])
+    df['file_exists'] = check_paths_exist(df['full_image_path'], catalog)
+    return df
+
+def main():
+    parser = argparse.ArgumentParser(description="数据清洗基准测试")
+    parser.add_argument('--rows', type=int, default=200000, help='合成数据行数')
+    parser.add_argument('--exists-ratio', type=float, default=0.9,
+                        help='图片文件实际存在的记录比例（这些文件会在临时目录中真实创建）')
+    args = parser.parse_args()
+
+    image_path_prefix = tempfile.mkdtemp(prefix='bench_clean_') + '/'
+    try:
+        print(f"📊 构造 {args.rows:,} 行合成数据...")
+        df = make_synthetic_frame(args.rows, f'{image_path_prefix}scraper_data/', args.exists_ratio)
+        catalog = FileCatalog(f'{image_path_prefix}scraper_data/').scan()
+        file_mapping = catalog.file_mapping
+
+        start = time.perf_counter()
+        legacy = legacy_clean(df, file_mapping, image_path_prefix)
+        legacy_seconds = time.perf_counter() - start
+        print(f"🐢 旧版逐行apply: 耗时 {legacy_seconds:.2f}s")
+
+        start = time.perf_counter()
+        vectorized = vectorized_clean(df, catalog, image_path_prefix)
+        vectorized_seconds = time.perf_counter() - start
+        print(f"✅ 整列实现: 耗时 {vectorized_seconds:.2f}s（stat {catalog.stat_calls:,} 次）")
+
+        columns = ['full_image_path', 'processed_tags', 'filename', 'file_exists']
+        mismatched = [c for c in columns if not legacy[c].astype(object).equals(vectorized[c].astype(object))]
+        if mismatched:
+            print(f"❌ 输出不一致的列: {mismatched}")
+            sys.exit(1)
+        print(f"✅ 输出一致: {columns}")
+
+        if vectorized_seconds > 0:
+            print(f"🚀 加速比: 约 {legacy_seconds / vectorized_seconds:.1f}x")
+    finally:
+        shutil.rmtree(image_path_prefix, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
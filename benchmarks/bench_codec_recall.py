@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+压缩编码评估
+对比 PQ / int8 编码在 NumpyVectorStore 中的每向量内存、recall@k（相对精确检索）与查询延迟
+
+用法:
+    python benchmarks/bench_codec_recall.py --rows 100000 --pq-m 64 128 256
+    python benchmarks/bench_codec_recall.py --index-dir ./numpy_index --collection local_db_image_collection
+
+评估已有索引时只读取向量与元数据，各编码的参数与编码文件写在临时目录中，
+不会改动集合目录下线上使用的 pq_* / int8_* 文件
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import NumpyVectorStore, ProductQuantizer, ScalarQuantizer
+from bench_ann_recall import sample_queries, timed_search
+
+def make_low_rank_vectors(rows: int, dim: int, clusters: int, rank: int, seed: int = 0) -> np.ndarray:
+    """
+    构造低内在维度的带簇单位向量
+    CLIP特征集中在远低于512维的子空间中，各向同性噪声会低估量化编码的效果
+    """
+    rng = np.random.default_rng(seed)
+    basis = np.linalg.qr(rng.standard_normal((dim, rank)))[0].T.astype(np.float32)
+    centers = rng.standard_normal((clusters, rank)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    latent = centers[labels] + 0.5 * rng.standard_normal((rows, rank)).astype(np.float32)
+    vectors = latent @ basis + 0.02 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def evaluate(store: NumpyVectorStore, queries: np.ndarray, exact_ids, top_k: int, label: str):
+    """训练当前编码并输出一行报告"""
+    start = time.perf_counter()
+    store.build_codec()
+    train_seconds = time.perf_counter() - start
+
+    found_ids, latency = timed_search(store, queries, top_k)
+    recall = np.mean([
+        len(set(found) & set(truth)) / max(len(truth), 1)
+        for found, truth in zip(found_ids, exact_ids)
+    ])
+    raw_bytes = store._vectors.shape[1] * 4
+    code_bytes = store.codec.code_size
+    print(f"{label:>22} {code_bytes:>6}B {raw_bytes / code_bytes:>6.1f}x {recall:>8.4f} "
+          f"{latency.mean():>8.2f} {np.percentile(latency, 99):>8.2f} {train_seconds:>8.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="压缩编码评估")
+    parser.add_argument('--index-dir', help='已有numpy索引目录，不指定则使用合成数据')
+    parser.add_argument('--collection', default='local_db_image_collection', help='已有索引的集合名')
+    parser.add_argument('--rows', type=int, default=100000, help='合成数据行数')
+    parser.add_argument('--dim', type=int, default=512, help='合成数据维度')
+    parser.add_argument('--clusters', type=int, default=200, help='合成数据的真实簇数量')
+    parser.add_argument('--rank', type=int, default=64, help='合成数据的内在维度')
+    parser.add_argument('--pq-m', type=int, nargs='+', default=[64, 128, 256], help='PQ子空间数量')
+    parser.add_argument('--rerank-factor', type=int, nargs='+', default=[1, 10],
+                        help='粗排候选倍数，1表示不重排')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=9)
+    args = parser.parse_args()
+
+    temp_dir = None
+    codec_dir = tempfile.mkdtemp(prefix="bench_codec_codes_")
+    if args.index_dir:
+        index_dir = args.index_dir
+        collection = args.collection
+    else:
+        temp_dir = index_dir = tempfile.mkdtemp(prefix="bench_codec_")
+        collection = "bench"
+        vectors = make_low_rank_vectors(args.rows, args.dim, args.clusters, args.rank)
+        writer = NumpyVectorStore(index_dir, collection)
+        for i in range(0, args.rows, 50000):
+            end = min(i + 50000, args.rows)
+            writer.add_images(
+                vectors[i:end],
+                [{'id': j, 'image_path': f"/synthetic/{j}.jpg"} for j in range(i, end)],
+                [''] * (end - i),
+                [f"img_{j}" for j in range(i, end)]
+            )
+        del vectors
+
+    try:
+        # 不启用集合自带的编码，评估用的编码写入临时目录
+        store = NumpyVectorStore(index_dir, collection)
+        queries = sample_queries(store, args.queries)
+        exact_ids, exact_latency = timed_search(store, queries, args.top_k, exact=True)
+
+        print(f"\n📊 recall@{args.top_k}（{len(queries)} 个查询, {store.get_collection_info()['count']:,} 条向量）")
+        print(f"{'编码':>22} {'每向量':>7} {'压缩比':>7} {'recall':>8} {'平均ms':>8} {'p99ms':>8} {'训练s':>8}")
+        print(f"{'float32 exact':>22} {store._vectors.shape[1] * 4:>6}B {1.0:>6.1f}x {1.0:>8.4f} "
+              f"{exact_latency.mean():>8.2f} {np.percentile(exact_latency, 99):>8.2f} {0.0:>8.1f}")
+
+        for rerank_factor in args.rerank_factor:
+            store.rerank_factor = rerank_factor
+            suffix = f" rerank x{rerank_factor}" if rerank_factor > 1 else " adc"
+
+            store.codec = ScalarQuantizer(codec_dir)
+            evaluate(store, queries, exact_ids, args.top_k, f"int8{suffix}")
+            store.codec.reset()
+
+            for m in args.pq_m:
+                store.codec = ProductQuantizer(codec_dir, m)
+                evaluate(store, queries, exact_ids, args.top_k, f"pq m={m}{suffix}")
+                store.codec.reset()
+    finally:
+        shutil.rmtree(codec_dir, ignore_errors=True)
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引记录组装基准测试
+对比 build_index 中旧版逐条过滤 (valid_df[valid_df['full_image_path'] == path])
+与 assemble_index_records 路径索引关联的耗时
+
+用法:
+    python benchmarks/bench_index_records.py --rows 200000
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import assemble_index_records
+
+def make_synthetic_frame(rows: int) -> pd.DataFrame:
+    """构造与_clean_data输出结构一致的合成数据"""
+    ids = np.arange(1, rows + 1)
+    brands = np.array(['cherytiggo2', 'cherytiggo4', 'byd', 'geely', 'tesla'])
+    brand_col = brands[ids % len(brands)]
+    filenames = [f"{i:08d}.jpg" for i in ids]
+    
+    return pd.DataFrame({
+        'id': ids,
+        'image_url': [f"/scraper_data/{b}/{f}" for b, f in zip(brand_col, filenames)],
+        'ai_tags': ['["SUV", "自然光线", "城市"]'] * rows,
+        'tags': ['家庭出游'] * rows,
+        'full_image_path': [f"/home/ai/scraper_data/{b}/{f}" for b, f in zip(brand_col, filenames)],
+        'processed_tags': ['SUV, 自然光线, 城市 | 家庭出游'] * rows,
+        'filename': filenames,
+    })
+
+def legacy_assemble(valid_df, features, valid_paths, clip_model):
+    """旧版实现：每个路径全表过滤一次"""
+    embeddings, metadatas, documents, ids = [], [], [], []
+    used_ids, used_paths = set(), set()
+    
+    for i, path in enumerate(valid_paths):
+        if path in used_paths:
+            continue
+        matching_rows = valid_df[valid_df['full_image_path'] == path]
+        if len(matching_rows) == 0:
+            continue
+        row = matching_rows.iloc[0]
+        vector_id = f"img_{row['id']}"
+        embeddings.append(features[i].tolist())
+        metadatas.append({
+            'id': int(row['id']),
+            'image_path': path,
+            'original_url': row['image_url'],
+            'filename': row['filename'],
+            'original_ai_tags': str(row.get('ai_tags', '')),
+            'original_tags': str(row.get('tags', '')),
+            'combined_tags': str(row['processed_tags']),
+            'display_tags': str(row['processed_tags']),
+            'created_at': datetime.now().isoformat(),
+            'clip_model': clip_model
+        })
+        documents.append(f"图片: {row['filename']}, 标签: {row['processed_tags']}")
+        ids.append(vector_id)
+        used_ids.add(vector_id)
+        used_paths.add(path)
+    
+    return embeddings, metadatas, documents, ids
+
+def main():
+    parser = argparse.ArgumentParser(description="索引记录组装基准测试")
+    parser.add_argument('--rows', type=int, default=200000, help='合成数据行数')
+    parser.add_argument('--dim', type=int, default=16,
+                        help='特征维度（关联耗时与维度无关，默认取小值以控制内存）')
+    parser.add_argument('--legacy-sample', type=int, default=2000,
+                        help='旧版实现实测的路径数，其余按线性外推')
+    args = parser.parse_args()
+    
+    print(f"📊 构造 {args.rows:,} 行合成数据...")
+    valid_df = make_synthetic_frame(args.rows)
+    rng = np.random.default_rng(0)
+    features = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    # 编码器输出顺序与数据行顺序不一致
+    order = rng.permutation(args.rows)
+    valid_paths = valid_df['full_image_path'].to_numpy()[order].tolist()
+    features = features[order]
+    
+    start = time.perf_counter()
+    result = assemble_index_records(valid_df, features, valid_paths, 'ViT-B/32')
+    indexed_seconds = time.perf_counter() - start
+    print(f"✅ 路径索引关联: {len(result[0]):,} 条记录, 耗时 {indexed_seconds:.2f}s")
+    
+    sample = min(args.legacy_sample, args.rows)
+    start = time.perf_counter()
+    legacy_assemble(valid_df, features[:sample], valid_paths[:sample], 'ViT-B/32')
+    legacy_sample_seconds = time.perf_counter() - start
+    legacy_estimate = legacy_sample_seconds / max(sample, 1) * args.rows
+    print(f"🐢 旧版逐条过滤: 实测 {sample:,} 条耗时 {legacy_sample_seconds:.2f}s, "
+          f"外推 {args.rows:,} 条约 {legacy_estimate:.0f}s")
+    
+    if indexed_seconds > 0:
+        print(f"🚀 加速比: 约 {legacy_estimate / indexed_seconds:.0f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在线集合别名
+全量重建写入带版本号的新集合（<集合名>_v<n>）后切换，当前在线的集合名记录在
+collection_alias.json（键为 "<后端>:<基础集合名>"），检索系统与一致性检测共用。
+被替换下来的上一版本记录在 "<后端>:<基础集合名>:previous"，保留到下一次切换时才删除。
+"""
+
+import os
+import json
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ALIAS_FILE = "collection_alias.json"
+
+def _load_aliases(alias_file: str) -> dict:
+    if not os.path.exists(alias_file):
+        return {}
+    with open(alias_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def load_live_collection_name(base_name: str, backend: str = "chromadb",
+                              alias_file: str = DEFAULT_ALIAS_FILE) -> str:
+    """读取当前在线的集合名（没有记录时为基础集合名）"""
+    try:
+        live = _load_aliases(alias_file).get(f"{backend}:{base_name}")
+        if live:
+            return live
+    except Exception as e:
+        logger.warning(f"加载集合别名失败: {e}")
+    return base_name
+
+def load_previous_collection_name(base_name: str, backend: str = "chromadb",
+                                  alias_file: str = DEFAULT_ALIAS_FILE) -> Optional[str]:
+    """读取上一次切换前的在线集合名（保留供尚未跟随切换的进程继续查询）"""
+    try:
+        return _load_aliases(alias_file).get(f"{backend}:{base_name}:previous")
+    except Exception as e:
+        logger.warning(f"加载集合别名失败: {e}")
+        return None
+
+def save_live_collection_name(base_name: str, live_collection: str, backend: str = "chromadb",
+                              alias_file: str = DEFAULT_ALIAS_FILE,
+                              previous_collection: Optional[str] = None):
+    """原子地更新别名文件（同时记录被替换下来的集合名）"""
+    try:
+        aliases = _load_aliases(alias_file)
+    except Exception as e:
+        logger.warning(f"加载集合别名失败: {e}")
+        aliases = {}
+
+    aliases[f"{backend}:{base_name}"] = live_collection
+    if previous_collection is not None:
+        aliases[f"{backend}:{base_name}:previous"] = previous_collection
+    tmp_file = f"{alias_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(aliases, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, alias_file)
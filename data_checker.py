@@ -8,8 +8,10 @@
 import os
 import json
 import pandas as pd
-import pymysql
 import chromadb
+from mysql_pool import get_pool, iter_keyset_pages
+from file_catalog import FileCatalog
+from collection_alias import load_live_collection_name
 from typing import Dict, Set, List, Tuple
 from datetime import datetime
 import logging
@@ -36,11 +38,18 @@ class DataConsistencyChecker:
         # ChromaDB配置
         self.chromadb_host = "localhost"
         self.chromadb_port = 6600
-        self.collection_name = "local_db_image_collection"
+        self.collection_name = "local_db_image_collection"  # 基础集合名，在线集合见collection_alias.json
         
         # 路径配置
         self.image_path_prefix = "/home/ai/"
         
+        # 与MySQLDataProcessor共用的进程内连接池
+        self.pool = get_pool(self.db_config)
+        
+        # 图片目录清单（存在性检查、文件系统扫描），缓存与MySQLDataProcessor共用
+        self.file_catalog = FileCatalog(f'{self.image_path_prefix}scraper_data/',
+                                        cache_file="file_catalog.json.gz")
+        
         # 数据存储
         self.mysql_data = {}
         self.chromadb_data = {}
@@ -48,28 +57,25 @@ class DataConsistencyChecker:
         
         print("🚀 数据一致性检测器初始化完成")
     
-    def connect_mysql(self) -> pymysql.Connection:
-        """连接MySQL数据库"""
-        try:
-            connection = pymysql.connect(**self.db_config)
-            logger.info("✅ MySQL连接成功")
-            return connection
-        except Exception as e:
-            logger.error(f"❌ MySQL连接失败: {e}")
-            raise
+    def connect_mysql(self):
+        """从连接池借出MySQL连接（上下文管理器，退出时归还）"""
+        return self.pool.connection()
     
     def connect_chromadb(self):
         """连接ChromaDB"""
         try:
             client = chromadb.HttpClient(host=self.chromadb_host, port=self.chromadb_port)
             
+            # 全量重建后在线集合为带版本号的新集合，按别名文件解析
+            live_collection = load_live_collection_name(self.collection_name)
+            
             # 检查集合是否存在
             try:
-                collection = client.get_collection(self.collection_name)
-                logger.info("✅ ChromaDB连接成功，找到现有集合")
+                collection = client.get_collection(live_collection)
+                logger.info(f"✅ ChromaDB连接成功，找到现有集合 {live_collection}")
             except Exception:
                 logger.warning("⚠️ ChromaDB集合不存在，尝试创建...")
-                collection = client.create_collection(self.collection_name)
+                collection = client.create_collection(live_collection)
                 logger.info("✅ ChromaDB集合创建成功")
             
             return client, collection
@@ -81,48 +87,52 @@ class DataConsistencyChecker:
         """扫描MySQL数据"""
         print("\n📊 扫描MySQL数据...")
         
-        connection = self.connect_mysql()
+        # 按主键分页流式读取，不一次性fetchall整张表
+        where_clause = ("image_url IS NOT NULL AND image_url != '' "
+                        "AND (ai_tags IS NOT NULL OR tags IS NOT NULL)")
+        pages = iter_keyset_pages(self.pool, ['id', 'image_url', 'ai_tags', 'tags'],
+                                  "work_copy428", where_clause)
         
-        try:
-            sql = """
-                SELECT id, image_url, ai_tags, tags
-                FROM work_copy428 
-                WHERE image_url IS NOT NULL AND image_url != ''
-                AND (ai_tags IS NOT NULL OR tags IS NOT NULL)
-                ORDER BY id
-            """
-            
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-                results = cursor.fetchall()
-            
-            # 处理数据
-            mysql_records = {}
-            valid_files = 0
-            invalid_files = 0
-            
-            print(f"   处理 {len(results)} 条MySQL记录...")
+        # 文件存在性由目录清单批量判断，清单外的路径才并发stat
+        self.file_catalog.scan()
+        
+        # 处理数据
+        mysql_records = {}
+        valid_files = 0
+        invalid_files = 0
+        i = 0
+        
+        print("   处理MySQL记录...")
+        
+        for page in pages:
+            # 尝试多种路径构建方式
+            page_paths = [
+                [
+                    os.path.join(self.image_path_prefix, image_url.lstrip('/')),
+                    image_url.replace('/scraper_data/', f'{self.image_path_prefix}scraper_data/'),
+                ]
+                for _, image_url, _, _ in page
+            ]
+            found = self.file_catalog.exists_many(paths[0] for paths in page_paths)
+            found.update(self.file_catalog.exists_many(
+                paths[1] for paths in page_paths if not found[paths[0]] and paths[1] not in found
+            ))
             
-            for i, record in enumerate(results):
+            for record, possible_paths in zip(page, page_paths):
                 if i % 10000 == 0:
-                    print(f"   进度: {i}/{len(results)}")
-                    
+                    print(f"   进度: {i}")
+                i += 1
+                
                 record_id, image_url, ai_tags, tags = record
                 
                 # 构建完整路径
                 filename = os.path.basename(image_url)
                 
-                # 尝试多种路径构建方式
-                possible_paths = [
-                    os.path.join(self.image_path_prefix, image_url.lstrip('/')),
-                    image_url.replace('/scraper_data/', f'{self.image_path_prefix}scraper_data/'),
-                ]
-                
                 # 检查文件是否存在
                 file_exists = False
                 actual_path = None
                 for path in possible_paths:
-                    if os.path.exists(path):
+                    if found.get(path):
                         file_exists = True
                         actual_path = path
                         break
@@ -133,7 +143,7 @@ class DataConsistencyChecker:
                     invalid_files += 1
                     # 如果文件不存在，使用第一个可能的路径
                     actual_path = possible_paths[0]
-                
+            
                 mysql_records[record_id] = {
                     'id': record_id,
                     'image_url': image_url,
@@ -144,25 +154,22 @@ class DataConsistencyChecker:
                     'tags': tags,
                     'has_tags': bool((ai_tags and str(ai_tags).strip()) or (tags and str(tags).strip()))
                 }
-            
-            self.mysql_data = {
-                'records': mysql_records,
-                'total_count': len(mysql_records),
-                'valid_files': valid_files,
-                'invalid_files': invalid_files,
-                'id_range': (min(mysql_records.keys()), max(mysql_records.keys())) if mysql_records else (0, 0)
-            }
-            
-            print(f"   📈 MySQL统计:")
-            print(f"      总记录: {self.mysql_data['total_count']:,}")
-            print(f"      文件存在: {valid_files:,}")
-            print(f"      文件缺失: {invalid_files:,}")
-            print(f"      ID范围: {self.mysql_data['id_range']}")
-            
-            return self.mysql_data
-            
-        finally:
-            connection.close()
+        
+        self.mysql_data = {
+            'records': mysql_records,
+            'total_count': len(mysql_records),
+            'valid_files': valid_files,
+            'invalid_files': invalid_files,
+            'id_range': (min(mysql_records.keys()), max(mysql_records.keys())) if mysql_records else (0, 0)
+        }
+        
+        print(f"   📈 MySQL统计:")
+        print(f"      总记录: {self.mysql_data['total_count']:,}")
+        print(f"      文件存在: {valid_files:,}")
+        print(f"      文件缺失: {invalid_files:,}")
+        print(f"      ID范围: {self.mysql_data['id_range']}")
+        
+        return self.mysql_data
     
     def scan_chromadb_data(self) -> Dict:
         """扫描ChromaDB数据 - 修复版"""
@@ -295,34 +302,26 @@ class DataConsistencyChecker:
             self.file_system_data = {'files': {}, 'total_count': 0, 'brands': {}}
             return self.file_system_data
         
+        print(f"   扫描路径: {scraper_base}")
+        
+        # 目录清单已记录文件大小，只重新扫描修改时间变化的品牌目录
+        self.file_catalog.scan()
+        
         file_mapping = {}
-        total_files = 0
-        brand_stats = {}
+        brand_stats = {brand: 0 for brand in self.file_catalog.brands}
         
-        print(f"   扫描路径: {scraper_base}")
+        for brand_dir, filename, full_path, size, _ in self.file_catalog.iter_files():
+            file_mapping[filename] = {
+                'full_path': full_path,
+                'brand': brand_dir,
+                'size': size
+            }
+            brand_stats[brand_dir] += 1
+        total_files = sum(brand_stats.values())
         
-        for brand_dir in os.listdir(scraper_base):
-            brand_path = os.path.join(scraper_base, brand_dir)
-            if os.path.isdir(brand_path):
-                try:
-                    brand_files = 0
-                    for filename in os.listdir(brand_path):
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                            full_path = os.path.join(brand_path, filename)
-                            file_mapping[filename] = {
-                                'full_path': full_path,
-                                'brand': brand_dir,
-                                'size': os.path.getsize(full_path)
-                            }
-                            brand_files += 1
-                            total_files += 1
-                    
-                    brand_stats[brand_dir] = brand_files
-                    if brand_files > 0:
-                        print(f"      {brand_dir}: {brand_files:,} 个文件")
-                        
-                except Exception as e:
-                    logger.warning(f"读取目录 {brand_dir} 失败: {e}")
+        for brand_dir, brand_files in brand_stats.items():
+            if brand_files > 0:
+                print(f"      {brand_dir}: {brand_files:,} 个文件")
         
         self.file_system_data = {
             'files': file_mapping,
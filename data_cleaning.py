@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+数据清洗的批量实现
+MySQLDataProcessor._clean_data 使用的标签合并、路径解析与存在性检查，
+以列为单位处理（str访问器、字典映射、按唯一值计算），不再逐行apply；
+存在性检查使用 file_catalog 的目录清单。
+"""
+
+import json
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+
+from file_catalog import FileCatalog
+
+NO_TAGS_TEXT = '无标签信息'
+
+# 只含不带转义字符的字符串元素的JSON数组，如 ["SUV", "城市"]
+_SIMPLE_STRING_ARRAY = r'\[\s*(?:"[^"\\\x00-\x1f]+"\s*(?:,\s*"[^"\\\x00-\x1f]+"\s*)*)?\]'
+
+def _format_tag_value(field_value: str) -> str:
+    """单个标签值的通用解析（JSON数组/对象或原值），空结果返回空串"""
+    if field_value.startswith('[') or field_value.startswith('{'):
+        try:
+            parsed = json.loads(field_value)
+        except Exception:
+            return field_value
+        if isinstance(parsed, list):
+            return ', '.join(str(tag) for tag in parsed if tag)
+        if isinstance(parsed, dict):
+            return ', '.join(f"{k}: {v}" for k, v in parsed.items() if v)
+        return str(parsed)
+    return field_value
+
+def format_tag_column(values: pd.Series) -> pd.Series:
+    """
+    将一个标签字段整列转换为展示文本，跳过的值（空、null、none、空数组）为NaN
+    标签取值重复度高，只对唯一值计算：简单字符串数组走正则快速路径，其余逐个解析
+    """
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object).astype(str).str.strip()
+
+    formatted = pd.Series(np.nan, index=uniques.index, dtype=object)
+    keep = (uniques != '') & ~uniques.str.lower().isin(['null', 'none'])
+    simple = keep & uniques.str.fullmatch(_SIMPLE_STRING_ARRAY)
+    if simple.any():
+        formatted[simple] = uniques[simple].str.findall(r'"([^"]*)"').str.join(', ')
+    rest = keep & ~simple
+    if rest.any():
+        formatted[rest] = [_format_tag_value(value) for value in uniques[rest]]
+    formatted = formatted.where(formatted != '')
+
+    # factorize对缺失值返回-1，对应追加的NaN
+    lookup = np.append(formatted.to_numpy(dtype=object), np.nan)
+    return pd.Series(lookup[codes], index=values.index, dtype=object)
+
+def merge_tag_columns(df: pd.DataFrame, tag_fields: List[str]) -> pd.Series:
+    """按字段顺序用 ' | ' 合并所有可用标签字段，全部为空时为'无标签信息'"""
+    merged = pd.Series(np.nan, index=df.index, dtype=object)
+    for field in tag_fields:
+        if field not in df.columns:
+            continue
+        part = format_tag_column(df[field]).reindex(df.index)
+        both = merged.notna() & part.notna()
+        joined = merged[both] + ' | ' + part[both]
+        merged = merged.fillna(part)
+        merged[both] = joined
+    return merged.fillna(NO_TAGS_TEXT)
+
+def url_basenames(urls: pd.Series) -> pd.Series:
+    """整列取 os.path.basename"""
+    return urls.astype(str).str.rpartition('/')[2]
+
+def resolve_image_paths(image_urls: pd.Series, file_mapping: Dict[str, str],
+                        image_path_prefix: str) -> pd.Series:
+    """
+    将image_url整列解析为本地完整路径
+    文件名在目录映射中时用映射路径；否则 /scraper_data/ 开头的替换为本地根目录，其余拼接到前缀下
+    """
+    cleaned = image_urls.fillna('').astype(str).str.strip()
+    paths = url_basenames(cleaned).map(file_mapping).astype(object)
+
+    # 只对映射表未命中的行做字符串拼接
+    unmapped = cleaned[paths.isna()]
+    if len(unmapped) > 0:
+        sep = '' if image_path_prefix.endswith('/') else '/'
+        joined = image_path_prefix + sep + unmapped.str.lstrip('/')
+        scraper = unmapped.str.startswith('/scraper_data/')
+        if scraper.any():
+            joined[scraper] = unmapped[scraper].str.replace(
+                '/scraper_data/', f'{image_path_prefix}scraper_data/', regex=False)
+        paths[joined.index] = joined
+
+    paths[image_urls.isna() | (image_urls.astype(str) == '')] = ''
+    return paths
+
+def check_paths_exist(paths: pd.Series, catalog: FileCatalog) -> pd.Series:
+    """
+    整列检查文件是否存在
+    按唯一值查询目录清单，只有清单覆盖范围外的路径才会（并发）stat，空路径为False
+    """
+    found = catalog.exists_many(paths.unique())
+    return paths.map(found).astype(bool)
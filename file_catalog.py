@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片文件目录
+用 os.scandir 遍历 scraper_data/<品牌>/ 得到文件名映射与完整路径集合，
+文件存在性由集合成员判断：位于已遍历品牌目录下的图片路径不再stat，
+其余路径（目录外、非图片扩展名）用线程池并发stat。
+清单（文件名、大小、修改时间）可持久化为gzip压缩的JSON，下次启动只重新扫描
+修改时间发生变化的品牌目录。
+MySQLDataProcessor 与 DataConsistencyChecker 共用。
+"""
+
+import os
+import gzip
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+CATALOG_FORMAT_VERSION = 1
+
+# 目录修改时间距扫描时刻小于该值时不信任缓存（同一时间粒度内的后续修改无法从mtime区分）
+RACY_MTIME_SECONDS = 2.0
+
+class FileCatalog:
+    """scraper_data 目录下的图片文件清单"""
+
+    def __init__(self, scraper_base: str, cache_file: Optional[str] = None, max_workers: int = 16):
+        """
+        Args:
+            scraper_base: 图片根目录（其下每个子目录为一个品牌）
+            cache_file: 清单持久化文件（.json.gz），为None时每次全量扫描
+            max_workers: 目录外路径并发stat的线程数
+        """
+        self.scraper_base = scraper_base
+        self.cache_file = cache_file
+        self.max_workers = max_workers
+
+        # 品牌 -> {'mtime_ns': 目录修改时间, 'files': {文件名: (大小, 修改时间)}}
+        self.brands = {}
+        self.file_mapping = {}  # 文件名 -> 完整路径
+        self.paths = set()
+        self.scanned_dirs = set()
+        self.scanned = False
+        self.stat_calls = 0
+        self.last_scan = {}
+
+    def _brand_path(self, brand: str) -> str:
+        return os.path.join(self.scraper_base, brand)
+
+    def _load_cache(self) -> Dict:
+        if not self.cache_file or not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with gzip.open(self.cache_file, 'rt', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"读取文件清单缓存失败，将全量扫描: {e}")
+            return {}
+        if data.get('version') != CATALOG_FORMAT_VERSION or data.get('scraper_base') != self.scraper_base:
+            return {}
+        # 文件以 [文件名, 大小, 修改时间] 列表存储
+        return {
+            brand: {
+                'mtime_ns': entry['mtime_ns'],
+                'files': {name: (size, mtime) for name, size, mtime in entry['files']}
+            }
+            for brand, entry in data.get('brands', {}).items()
+        }
+
+    def save(self):
+        """写入清单缓存（临时文件 + os.replace）"""
+        if not self.cache_file:
+            return
+        data = {
+            'version': CATALOG_FORMAT_VERSION,
+            'scraper_base': self.scraper_base,
+            'saved_at': time.time(),
+            'brands': {
+                brand: {
+                    'mtime_ns': entry['mtime_ns'],
+                    'files': [[name, size, mtime] for name, (size, mtime) in entry['files'].items()]
+                }
+                for brand, entry in self.brands.items()
+            }
+        }
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with gzip.open(tmp_file, 'wt', encoding='utf-8', compresslevel=6) as f:
+                json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            logger.warning(f"保存文件清单缓存失败: {e}")
+
+    def _scan_brand(self, brand_path: str) -> Dict[str, Tuple[int, float]]:
+        files = {}
+        with os.scandir(brand_path) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue  # 遍历期间被删除
+                    files[entry.name] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def scan(self) -> 'FileCatalog':
+        """
+        遍历品牌目录，重建文件名映射与路径集合
+        已有缓存（内存或持久化文件）时，目录修改时间未变的品牌直接复用，不再列目录、不再stat文件
+        """
+        started = time.monotonic()
+        cached = self.brands if self.brands else self._load_cache()
+        brands = {}
+        rescanned = 0
+
+        try:
+            brand_entries = [entry for entry in os.scandir(self.scraper_base) if entry.is_dir()]
+        except OSError as e:
+            logger.warning(f"读取目录 {self.scraper_base} 失败: {e}")
+            brand_entries = []
+
+        now_ns = time.time_ns()
+        for brand_entry in brand_entries:
+            brand = brand_entry.name
+            try:
+                mtime_ns = brand_entry.stat().st_mtime_ns
+                previous = cached.get(brand)
+                if previous is not None and previous['mtime_ns'] == mtime_ns:
+                    files = previous['files']
+                else:
+                    files = self._scan_brand(self._brand_path(brand))
+                    rescanned += 1
+                if now_ns - mtime_ns < RACY_MTIME_SECONDS * 1e9:
+                    mtime_ns = None  # 下次扫描强制重新列目录
+                brands[brand] = {'mtime_ns': mtime_ns, 'files': files}
+            except OSError as e:
+                logger.warning(f"读取目录 {brand} 失败: {e}")
+
+        changed = rescanned > 0 or brands.keys() != cached.keys() or any(
+            entry['mtime_ns'] != cached[brand]['mtime_ns'] for brand, entry in brands.items()
+        )
+        self._set_brands(brands)
+        self.last_scan = {
+            'brands': len(brands),
+            'rescanned_brands': rescanned,
+            'files': len(self.paths),
+            'seconds': round(time.monotonic() - started, 3)
+        }
+        logger.info(f"文件清单: {len(brands)} 个品牌目录（重新扫描 {rescanned} 个），"
+                    f"{len(self.paths)} 个文件，耗时 {self.last_scan['seconds']}s")
+        if changed:
+            self.save()
+        return self
+
+    def _set_brands(self, brands: Dict):
+        file_mapping = {}
+        paths = set()
+        for brand, entry in brands.items():
+            brand_path = self._brand_path(brand)
+            for name in entry['files']:
+                full_path = os.path.join(brand_path, name)
+                file_mapping[name] = full_path
+                paths.add(full_path)
+
+        self.brands = brands
+        self.file_mapping = file_mapping
+        self.paths = paths
+        self.scanned_dirs = {self._brand_path(brand) for brand in brands}
+        self.scanned = True
+
+    def iter_files(self) -> Iterator[Tuple[str, str, str, int, float]]:
+        """遍历清单中的文件: (品牌, 文件名, 完整路径, 大小, 修改时间)"""
+        for brand, entry in self.brands.items():
+            brand_path = self._brand_path(brand)
+            for name, (size, mtime) in entry['files'].items():
+                yield brand, name, os.path.join(brand_path, name), size, mtime
+
+    def _covered(self, path: str) -> bool:
+        """路径是否在遍历范围内（可直接由集合判断存在与否）"""
+        return path.lower().endswith(IMAGE_EXTENSIONS) and os.path.dirname(path) in self.scanned_dirs
+
+    def exists(self, path: str) -> bool:
+        """判断单个文件是否存在"""
+        return self.exists_many([path]).get(path, False)
+
+    def exists_many(self, paths: Iterable[str]) -> Dict[str, bool]:
+        """
+        批量判断文件是否存在
+        Returns:
+            路径 -> 是否存在（空路径为False）
+        """
+        result = {}
+        unknown = []
+        for path in set(paths):
+            if not path:
+                result[path] = False
+            elif path in self.paths:
+                result[path] = True
+            elif self._covered(path):
+                result[path] = False
+            else:
+                unknown.append(path)
+
+        if unknown:
+            self.stat_calls += len(unknown)
+            if len(unknown) == 1:
+                result[unknown[0]] = os.path.exists(unknown[0])
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unknown))) as executor:
+                    result.update(zip(unknown, executor.map(os.path.exists, unknown)))
+
+        return result
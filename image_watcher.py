@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片目录监听
+后台线程监听 scraper_data/<品牌>/ 下图片的新增与删除，小批量编码后写入在线集合，
+新图片无需等待全量重建即可被检索到。
+Linux上用inotify（ctypes调用libc，无第三方依赖）提前唤醒，其余平台或inotify不可用时
+按固定间隔轮询；NFS等网络文件系统收不到其他主机上的inotify事件，因此始终保留轮询兜底。
+变化一律由目录清单（file_catalog，只重新扫描修改时间变化的品牌目录）前后比对得出。
+爬虫可能先写图片、后提交数据库记录，暂时匹配不到记录的文件按固定间隔重试，超过最长等待时间后放弃
+（之后由增量同步补齐）。
+"""
+
+import os
+import time
+import select
+import ctypes
+import ctypes.util
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+
+class InotifyWaker:
+    """inotify唤醒器：目录中有文件变化时唤醒等待方，不解析具体事件"""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watched = set()
+
+    def watch(self, path: str) -> bool:
+        """添加目录监听（已监听的目录直接返回）"""
+        if path in self.watched:
+            return True
+        if self._add_watch(self.fd, os.fsencode(path), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            logger.warning(f"监听目录 {path} 失败: {os.strerror(errno)}")
+            return False
+        self.watched.add(path)
+        return True
+
+    def wait(self, timeout: float) -> bool:
+        """等待事件，有事件返回True（并清空事件缓冲区），超时返回False"""
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return False
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+class ImageWatcher:
+    """后台图片目录监听线程"""
+
+    def __init__(self, watch_dir: str,
+                 refresh_fn: Callable[[], Tuple[List[str], List[str]]],
+                 sync_fn: Callable[[List[str], List[str]], Dict],
+                 interval_seconds: float = 30.0, settle_seconds: float = 2.0,
+                 debounce_seconds: float = 1.0, max_files_per_sync: int = 256,
+                 use_inotify: bool = True, is_busy: Optional[Callable[[], bool]] = None,
+                 unmatched_retry_seconds: float = 10.0, unmatched_max_age_seconds: float = 600.0,
+                 name: str = "image-watcher"):
+        """
+        Args:
+            watch_dir: 图片根目录（scraper_data/）
+            refresh_fn: 重新扫描目录清单，返回 (新增文件路径, 删除文件路径)
+            sync_fn: 将一批新增/删除文件同步到索引的函数，结果中的unmatched_paths为暂无数据库记录的新增文件
+            interval_seconds: 轮询间隔（秒），inotify模式下为兜底扫描间隔
+            settle_seconds: 新文件修改时间距今超过该值才处理，避免读到写了一半的图片
+            debounce_seconds: inotify唤醒后再等待的时间，合并连续写入的一批文件
+            max_files_per_sync: 每次调用sync_fn的最多文件数
+            use_inotify: 是否尝试使用inotify
+            is_busy: 返回True时（如索引重建进行中）暂缓同步，变化保留到下一轮
+            unmatched_retry_seconds: 暂无数据库记录的文件的重试间隔（秒）
+            unmatched_max_age_seconds: 暂无数据库记录的文件最长重试多久（秒），超过后放弃
+            name: 后台线程名
+        """
+        self.watch_dir = watch_dir
+        self.refresh_fn = refresh_fn
+        self.sync_fn = sync_fn
+        self.interval_seconds = interval_seconds
+        self.settle_seconds = settle_seconds
+        self.debounce_seconds = debounce_seconds
+        self.max_files_per_sync = max_files_per_sync
+        self.use_inotify = use_inotify
+        self.is_busy = is_busy
+        self.unmatched_retry_seconds = unmatched_retry_seconds
+        self.unmatched_max_age_seconds = unmatched_max_age_seconds
+        self.name = name
+
+        self._waker = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+        # 已发现但尚未同步的变化
+        self._pending_added = set()
+        self._pending_removed = set()
+        # 暂无数据库记录的新增文件（仍在_pending_added中）: 路径 -> (首次未匹配时间, 下次重试时间)
+        self._unmatched = {}
+
+        self.total_rounds = 0
+        self.total_added = 0
+        self.total_deleted = 0
+        self.failed_syncs = 0
+        self.dropped_unmatched = 0
+        self.last_sync = None
+        self.last_error = None
+
+    @property
+    def mode(self) -> str:
+        return 'inotify' if self._waker is not None else 'polling'
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            if self.use_inotify:
+                try:
+                    self._waker = InotifyWaker()
+                except (OSError, AttributeError) as e:
+                    logger.info(f"inotify不可用，使用轮询: {e}")
+                    self._waker = None
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logger.info(f"👀 图片目录监听已启动: {self.watch_dir}（{self.mode}，间隔 {self.interval_seconds}s）")
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def refresh(self):
+        """请求立即扫描，不等待结果"""
+        self._wakeup.set()
+
+    def _run(self):
+        try:
+            while not self._stopped.is_set():
+                self._wakeup.clear()
+                self._update_watches()
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logger.error(f"图片目录监听出错: {e}")
+                    self.last_error = str(e)
+                self._wait()
+        finally:
+            if self._waker is not None:
+                self._waker.close()
+
+    def _update_watches(self):
+        """监听根目录与所有品牌目录（新出现的品牌目录在下一轮加入）"""
+        if self._waker is None:
+            return
+        self._waker.watch(self.watch_dir)
+        try:
+            with os.scandir(self.watch_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        self._waker.watch(entry.path)
+        except OSError as e:
+            logger.warning(f"读取目录 {self.watch_dir} 失败: {e}")
+
+    def _wait(self):
+        # 还有未落稳的新文件时提前再检查，暂无记录的文件到重试时间时再检查
+        timeout = self.interval_seconds
+        if len(self._pending_added) > len(self._unmatched):
+            timeout = min(timeout, self.settle_seconds)
+        elif self._unmatched:
+            next_retry = min(retry_at for _, retry_at in self._unmatched.values())
+            timeout = min(timeout, max(next_retry - time.monotonic(), 0))
+
+        if self._waker is None:
+            self._wakeup.wait(timeout)
+            return
+
+        deadline = time.monotonic() + timeout
+        while not self._wakeup.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            # 分段等待，stop/refresh能及时生效
+            if self._waker.wait(min(remaining, 1.0)):
+                self._stopped.wait(self.debounce_seconds)
+                return
+
+    def _settled(self, paths: List[str]) -> Tuple[List[str], List[str]]:
+        """把新增文件分为已写完的与仍在写入的，已消失的文件直接丢弃"""
+        now = time.time()
+        ready, waiting = [], []
+        for path in paths:
+            try:
+                mtime = os.stat(path).st_mtime
+            except OSError:
+                self._pending_added.discard(path)
+                self._unmatched.pop(path, None)
+                continue
+            (ready if now - mtime >= self.settle_seconds else waiting).append(path)
+        return ready, waiting
+
+    def run_once(self) -> Dict:
+        """扫描一轮并同步已落稳的变化"""
+        added, removed = self.refresh_fn()
+        self.total_rounds += 1
+
+        # 删除后又出现的文件按新增处理（同ID会先删除再写入）
+        self._pending_removed.difference_update(added)
+        self._pending_removed.update(path for path in removed if path not in self._pending_added)
+        self._pending_added.difference_update(removed)
+        self._pending_added.update(added)
+        for path in removed:
+            self._unmatched.pop(path, None)
+
+        if not self._pending_added and not self._pending_removed:
+            return {'added': 0, 'deleted': 0}
+        if self.is_busy is not None and self.is_busy():
+            logger.info(f"索引任务进行中，暂缓同步 {len(self._pending_added)} 个新增、"
+                        f"{len(self._pending_removed)} 个删除文件")
+            return {'added': 0, 'deleted': 0, 'deferred': True}
+
+        ready, _ = self._settled(sorted(self._pending_added))
+        now = time.monotonic()
+        ready = [path for path in ready if path not in self._unmatched or self._unmatched[path][1] <= now]
+        removed_paths = sorted(self._pending_removed)
+
+        added_count = 0
+        deleted_count = 0
+        synced_batches = 0
+        for i in range(0, max(len(ready), len(removed_paths)), self.max_files_per_sync):
+            if self._stopped.is_set():
+                break
+            batch_added = ready[i:i + self.max_files_per_sync]
+            batch_removed = removed_paths[i:i + self.max_files_per_sync]
+            try:
+                result = self.sync_fn(batch_added, batch_removed)
+            except Exception as e:
+                # 保留未同步的变化，下一轮重试
+                logger.error(f"同步文件变化失败: {e}")
+                self.failed_syncs += 1
+                self.last_error = str(e)
+                break
+
+            unmatched = set(result.get('unmatched_paths') or [])
+            self._pending_added.difference_update(path for path in batch_added if path not in unmatched)
+            self._pending_removed.difference_update(batch_removed)
+            for path in batch_added:
+                if path not in unmatched:
+                    self._unmatched.pop(path, None)
+            self._track_unmatched(unmatched)
+            added_count += result.get('added', 0)
+            deleted_count += result.get('deleted', 0)
+            synced_batches += 1
+
+        self.total_added += added_count
+        self.total_deleted += deleted_count
+        if synced_batches:
+            self.last_sync = {
+                'added': added_count,
+                'deleted': deleted_count,
+                'synced_at': datetime.now().isoformat()
+            }
+        return {'added': added_count, 'deleted': deleted_count}
+
+    def _track_unmatched(self, paths):
+        """记录暂无数据库记录的文件的重试时间，超过最长等待时间的不再重试"""
+        now = time.monotonic()
+        for path in paths:
+            first_seen = self._unmatched.get(path, (now, now))[0]
+            if now - first_seen >= self.unmatched_max_age_seconds:
+                logger.warning(f"图片 {path} 在 {self.unmatched_max_age_seconds:.0f}s 内没有对应的数据库记录，停止重试")
+                self._unmatched.pop(path, None)
+                self._pending_added.discard(path)
+                self.dropped_unmatched += 1
+            else:
+                self._unmatched[path] = (first_seen, now + self.unmatched_retry_seconds)
+
+    def get_stats(self) -> Dict:
+        return {
+            'watch_dir': self.watch_dir,
+            'mode': self.mode,
+            'interval_seconds': self.interval_seconds,
+            'running': self._thread is not None and not self._stopped.is_set(),
+            'total_rounds': self.total_rounds,
+            'pending_added': len(self._pending_added),
+            'pending_removed': len(self._pending_removed),
+            'pending_unmatched': len(self._unmatched),
+            'dropped_unmatched': self.dropped_unmatched,
+            'total_added': self.total_added,
+            'total_deleted': self.total_deleted,
+            'failed_syncs': self.failed_syncs,
+            'last_sync': self.last_sync,
+            'last_error': self.last_error
+        }
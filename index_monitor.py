@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引健康监控
+后台线程按固定间隔检查索引与数据库的一致性（MySQL计数、向量库计数），
+结果整体替换发布，请求线程只读取最近一次的快照，不再同步访问MySQL。
+"""
+
+import time
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+class IndexHealthMonitor:
+    """后台索引健康检查线程"""
+
+    def __init__(self, check_fn: Callable[[], Dict], interval_seconds: float = 300.0,
+                 name: str = "index-health-monitor"):
+        """
+        Args:
+            check_fn: 执行一次检查并返回状态字典的函数（在后台线程中调用）
+            interval_seconds: 两次检查之间的间隔（秒）
+            name: 后台线程名
+        """
+        self.check_fn = check_fn
+        self.interval_seconds = interval_seconds
+        self.name = name
+
+        self._snapshot = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+
+        self.total_checks = 0
+        self.failed_checks = 0
+        self.last_duration_ms = None
+
+    def start(self):
+        """启动后台线程（重复调用无副作用）"""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def refresh(self):
+        """请求立即重新检查（如索引重建或增量同步之后），不等待结果"""
+        self._wakeup.set()
+
+    @property
+    def snapshot(self) -> Optional[Dict]:
+        """最近一次检查结果，首次检查完成前为None"""
+        return self._snapshot
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            self._check_once()
+            self._wakeup.wait(self.interval_seconds)
+
+    def _check_once(self):
+        start = time.perf_counter()
+        try:
+            result = self.check_fn()
+        except Exception as e:
+            logger.error(f"索引健康检查失败: {e}")
+            result = {'error': str(e)}
+            self.failed_checks += 1
+
+        self.total_checks += 1
+        self.last_duration_ms = (time.perf_counter() - start) * 1000
+        # 整体替换引用，读取方不会看到写了一半的结果
+        self._snapshot = dict(result, checked_at=datetime.now().isoformat())
+
+    def get_stats(self) -> Dict:
+        snapshot = self._snapshot
+        return {
+            'interval_seconds': self.interval_seconds,
+            'total_checks': self.total_checks,
+            'failed_checks': self.failed_checks,
+            'last_duration_ms': self.last_duration_ms,
+            'last_checked_at': snapshot.get('checked_at') if snapshot else None
+        }
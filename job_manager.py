@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务管理
+索引重建/增量同步等长任务在后台线程中执行，请求立即返回任务ID，
+通过任务ID查询阶段、进度、速度、预计剩余时间与错误数，并可请求取消。
+"""
+
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Job:
+    """单个后台任务的状态"""
+
+    def __init__(self, kind: str, params: Optional[Dict] = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params or {}
+        self.status = 'queued'  # queued / running / succeeded / failed / cancelled
+        self.phase = None
+        self.processed = 0
+        self.total = None
+        self.indexed = 0
+        self.errors = 0
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.started_at = None
+        self.finished_at = None
+
+        self._lock = threading.Lock()
+        self._cancel_requested = threading.Event()
+        # 速度按当前阶段计算：阶段开始时间与当时的已处理数
+        self._phase_started = None
+        self._phase_start_processed = 0
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested.is_set()
+
+    def cancel(self) -> bool:
+        """请求取消，任务在下一次汇报进度时停止；已结束的任务返回False"""
+        if self.status not in ('queued', 'running'):
+            return False
+        self._cancel_requested.set()
+        return True
+
+    def update(self, progress: Dict):
+        """记录进度（字段: phase, processed, total, indexed, errors）"""
+        with self._lock:
+            phase = progress.get('phase', self.phase)
+            if phase != self.phase:
+                self.phase = phase
+                self.processed = 0
+                self.total = None
+                self._phase_started = time.monotonic()
+                self._phase_start_processed = progress.get('processed', 0)
+
+            for field in ('processed', 'total', 'indexed', 'errors'):
+                if progress.get(field) is not None:
+                    setattr(self, field, progress[field])
+
+    def _rate(self) -> Optional[float]:
+        # 调用方已持有锁
+        if self._phase_started is None:
+            return None
+        elapsed = time.monotonic() - self._phase_started
+        done = self.processed - self._phase_start_processed
+        if elapsed <= 0 or done <= 0:
+            return None
+        return done / elapsed
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            rate = self._rate()
+            eta = None
+            if rate and self.total is not None and self.status == 'running':
+                eta = max(self.total - self.processed, 0) / rate
+
+            return {
+                'job_id': self.id,
+                'kind': self.kind,
+                'params': self.params,
+                'status': self.status,
+                'phase': self.phase,
+                'processed': self.processed,
+                'total': self.total,
+                'indexed': self.indexed,
+                'errors': self.errors,
+                'items_per_second': round(rate, 2) if rate else None,
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'cancel_requested': self.cancel_requested,
+                'result': self.result,
+                'error': self.error,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at
+            }
+
+class JobManager:
+    """后台任务管理器（同一时间只运行一个任务，避免并发重建同一索引）"""
+
+    def __init__(self, max_history: int = 50):
+        """
+        Args:
+            max_history: 保留的已结束任务数量
+        """
+        self.max_history = max_history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._active = None
+
+    def submit(self, kind: str, target: Callable[[Job], Any], params: Optional[Dict] = None,
+               on_finish: Optional[Callable[[Job], None]] = None) -> Job:
+        """
+        启动后台任务
+        Args:
+            kind: 任务类型
+            target: 任务函数，参数为Job（通过job.update汇报进度），返回值记为任务结果
+            params: 任务参数（仅用于展示）
+            on_finish: 任务结束（无论成败）后的回调
+        Raises:
+            RuntimeError: 已有任务在运行
+        """
+        with self._lock:
+            if self._active is not None and self._active.status in ('queued', 'running'):
+                raise RuntimeError(f"已有任务正在运行: {self._active.id}")
+
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._active = job
+            while len(self._jobs) > self.max_history:
+                self._jobs.popitem(last=False)
+
+        thread = threading.Thread(target=self._run, args=(job, target, on_finish),
+                                  name=f"job-{job.id}", daemon=True)
+        thread.start()
+        return job
+
+    def _run(self, job: Job, target: Callable[[Job], Any], on_finish: Optional[Callable[[Job], None]]):
+        job.status = 'running'
+        job.started_at = datetime.now().isoformat()
+        logger.info(f"▶️ 任务 {job.id} ({job.kind}) 开始")
+
+        try:
+            job.result = target(job)
+            job.status = 'cancelled' if job.cancel_requested else 'succeeded'
+        except Exception as e:
+            if job.cancel_requested:
+                job.status = 'cancelled'
+            else:
+                logger.error(f"任务 {job.id} ({job.kind}) 失败: {e}")
+                job.status = 'failed'
+                job.error = str(e)
+        finally:
+            job.finished_at = datetime.now().isoformat()
+            logger.info(f"⏹️ 任务 {job.id} ({job.kind}) 结束: {job.status}")
+            if on_finish is not None:
+                try:
+                    on_finish(job)
+                except Exception as e:
+                    logger.warning(f"任务 {job.id} 结束回调失败: {e}")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_job(self) -> Optional[Job]:
+        with self._lock:
+            job = self._active
+        if job is not None and job.status in ('queued', 'running'):
+            return job
+        return None
+
+    def list_jobs(self) -> List[Dict]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
@@ -7,7 +7,7 @@ from PIL import Image
 import cv2
 import logging
 from pathlib import Path
-from typing import List, Dict, Union, Tuple, Optional
+from typing import List, Dict, Union, Tuple, Optional, Callable, Iterator
 import chromadb
 from chromadb.config import Settings
 import clip
@@ -23,6 +23,20 @@ from urllib.parse import urlparse
 import warnings
 import time
 import re
+import sqlite3
+import threading
+import queue
+import atexit
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from vector_store import NumpyVectorStore
+from thumbnail_store import ThumbnailStore
+from micro_batcher import MicroBatcher
+from mysql_pool import get_pool, iter_keyset_pages
+from file_catalog import FileCatalog
+from collection_alias import (DEFAULT_ALIAS_FILE, load_live_collection_name, load_previous_collection_name,
+                              save_live_collection_name)
+from data_cleaning import merge_tag_columns, resolve_image_paths, url_basenames, check_paths_exist
 
 # 忽略一些警告
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -304,6 +318,501 @@ class OpenRouterProcessor:
             "search_strategy": "balanced"
         }
 
+# 图片预处理子进程使用的预处理函数（由进程池initializer设置）
+_worker_preprocess = None
+_worker_thumbnail_store = None
+
+def _init_preprocess_worker(preprocess, thumbnail_store=None):
+    """进程池初始化：保存预处理函数与缩略图存储，并限制子进程torch线程数"""
+    global _worker_preprocess, _worker_thumbnail_store
+    _worker_preprocess = preprocess
+    _worker_thumbnail_store = thumbnail_store
+    torch.set_num_threads(1)
+
+def _preprocess_batch_worker(batch_paths: List[str]) -> Tuple[List[np.ndarray], List[str], List[Dict], List[Tuple]]:
+    """子进程入口：预处理一个批次"""
+    return _preprocess_image_batch(batch_paths, _worker_preprocess, _worker_thumbnail_store)
+
+def _preprocess_image_batch(batch_paths: List[str], preprocess,
+                            thumbnail_store: Optional[ThumbnailStore] = None
+                            ) -> Tuple[List[np.ndarray], List[str], List[Dict], List[Tuple]]:
+    """
+    预处理一个批次的图片（给定thumbnail_store时顺带写入缩略图）
+    Returns:
+        batch_images: 预处理后的图片数组列表
+        batch_valid_paths: 预处理成功的图片路径
+        error_details: 错误详情列表
+        batch_signatures: 与batch_valid_paths对应的 (文件大小, 修改时间ns, 内容哈希)
+    """
+    batch_images = []
+    batch_valid_paths = []
+    error_details = []
+    batch_signatures = []
+    
+    for path in batch_paths:
+        image_input, error, signature = _load_image_for_encoding(path, preprocess, thumbnail_store)
+        if error is not None:
+            error_details.append(error)
+            continue
+        batch_images.append(image_input)
+        batch_valid_paths.append(path)
+        batch_signatures.append(signature)
+    
+    return batch_images, batch_valid_paths, error_details, batch_signatures
+
+def _load_image_for_encoding(path: str, preprocess,
+                             thumbnail_store: Optional[ThumbnailStore] = None
+                             ) -> Tuple[Optional[np.ndarray], Optional[Dict], Optional[Tuple[int, int, str]]]:
+    """
+    加载、校验并预处理单张图片
+    给定thumbnail_store时复用已解码的图片生成缩略图，查询时无需再打开原图
+    文件只读取一次，内容哈希由解码用的同一份字节计算，写入特征缓存时无需再读文件
+    Returns:
+        (image_input, None, signature) 成功时返回预处理后的数组与 (文件大小, 修改时间ns, 内容哈希)
+        (None, error, None) 失败时返回错误详情
+    """
+    try:
+        if not os.path.exists(path):
+            return None, {
+                'path': path,
+                'error': 'file_not_found',
+                'message': '文件不存在'
+            }, None
+        
+        # 检查文件大小
+        try:
+            file_size = os.path.getsize(path)
+            if file_size == 0:
+                return None, {
+                    'path': path,
+                    'error': 'empty_file',
+                    'message': '文件为空'
+                }, None
+            
+            if file_size > 50 * 1024 * 1024:  # 50MB
+                return None, {
+                    'path': path,
+                    'error': 'file_too_large',
+                    'message': f'文件过大: {file_size/1024/1024:.1f}MB'
+                }, None
+        except OSError as e:
+            return None, {
+                'path': path,
+                'error': 'file_access_error',
+                'message': f'文件访问错误: {str(e)}'
+            }, None
+        
+        # 尝试加载图片
+        try:
+            with open(path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                data = f.read()
+            signature = (stat.st_size, stat.st_mtime_ns, hashlib.sha1(data).hexdigest())
+            
+            with Image.open(BytesIO(data)) as original:
+                image = original.convert('RGB')
+                
+                # 检查图片尺寸
+                width, height = image.size
+                if width < 10 or height < 10:
+                    return None, {
+                        'path': path,
+                        'error': 'invalid_dimensions',
+                        'message': f'图片尺寸过小: {width}x{height}'
+                    }, None
+                
+                if width > 10000 or height > 10000:
+                    return None, {
+                        'path': path,
+                        'error': 'dimensions_too_large', 
+                        'message': f'图片尺寸过大: {width}x{height}'
+                    }, None
+                
+                # 复用已解码的原图生成缩略图（保留透明通道以便合成白底）
+                if thumbnail_store is not None:
+                    thumbnail_store.save_image(path, original)
+            
+            # 预处理图片（转为numpy以便跨进程传输）
+            return preprocess(image).numpy(), None, signature
+            
+        except Exception as e:
+            return None, {
+                'path': path,
+                'error': 'image_processing_failed',
+                'message': f'图片处理失败: {str(e)}'
+            }, None
+            
+    except Exception as e:
+        return None, {
+            'path': path,
+            'error': 'unexpected_error',
+            'message': f'未知错误: {str(e)}'
+        }, None
+
+class EmbeddingCache:
+    """
+    图片特征的磁盘缓存
+    
+    向量保存在内存映射的.npy矩阵中，SQLite索引记录
+    路径 -> (文件大小, 修改时间, 内容哈希, 行号)。
+    按CLIP模型分目录存放，切换模型不会读到旧模型的向量。
+    同一缓存目录只应有一个写入进程。
+    """
+    
+    def __init__(self, cache_dir: str, model_name: str, feature_dim: int,
+                 dtype: str = 'float16', initial_capacity: int = 4096):
+        """
+        初始化特征缓存
+        Args:
+            cache_dir: 缓存根目录
+            model_name: CLIP模型名称（用于命名空间隔离）
+            feature_dim: 特征维度
+            dtype: 向量存储精度 float16 / float32
+            initial_capacity: 初始行容量
+        """
+        self.model_name = model_name
+        self.feature_dim = feature_dim
+        self.dtype = np.dtype(dtype)
+        
+        model_slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.cache_dir = Path(cache_dir) / model_slug
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.cache_dir / f"vectors_{self.dtype.name}.npy"
+        self.index_path = self.cache_dir / "index.sqlite"
+        
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        
+        self._conn = sqlite3.connect(str(self.index_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                row INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries(content_hash)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_size ON entries(size)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        
+        self._check_meta()
+        self.count = int(self._get_meta('count', 0))
+        
+        if self.vectors_path.exists():
+            self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+        else:
+            self._vectors = np.lib.format.open_memmap(
+                self.vectors_path, mode='w+', dtype=self.dtype,
+                shape=(initial_capacity, feature_dim)
+            )
+        
+        logger.info(f"特征缓存: {self.cache_dir} ({self.count} 条, {self.dtype.name})")
+    
+    def _get_meta(self, key: str, default=None):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    
+    def _set_meta(self, key: str, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+    
+    def _check_meta(self):
+        """校验缓存与当前模型、维度是否一致，不一致则清空"""
+        stored_model = self._get_meta('model_name')
+        stored_dim = self._get_meta('feature_dim')
+        stored_dtype = self._get_meta('dtype')
+        
+        if stored_model is None:
+            self._set_meta('model_name', self.model_name)
+            self._set_meta('feature_dim', self.feature_dim)
+            self._set_meta('dtype', self.dtype.name)
+            self._conn.commit()
+            return
+        
+        if (stored_model != self.model_name or int(stored_dim) != self.feature_dim
+                or stored_dtype != self.dtype.name):
+            logger.warning(f"特征缓存与当前配置不匹配 ({stored_model}/{stored_dim}/{stored_dtype})，清空缓存")
+            self._conn.execute("DELETE FROM entries")
+            self._set_meta('model_name', self.model_name)
+            self._set_meta('feature_dim', self.feature_dim)
+            self._set_meta('dtype', self.dtype.name)
+            self._set_meta('count', 0)
+            self._conn.commit()
+            for stale_path in self.cache_dir.glob("vectors_*.npy"):
+                stale_path.unlink()
+    
+    @staticmethod
+    def _file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+        """计算文件内容哈希"""
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _read_row(self, row: int) -> np.ndarray:
+        feature = np.asarray(self._vectors[row], dtype=np.float32)
+        norm = np.linalg.norm(feature)
+        return feature / norm if norm > 0 else feature
+    
+    def lookup(self, paths: List[str]) -> Dict[str, np.ndarray]:
+        """
+        批量查询缓存
+        
+        文件大小和修改时间一致时直接命中；不一致时按内容哈希查找
+        （文件被移动或重新写入但内容未变）。内容相同则大小必然相同，
+        没有同样大小的缓存条目时不读文件算哈希，直接视为未命中（绝大多数新图片），
+        未命中的图片在解码时顺带计算哈希，由store写入。
+        Returns:
+            命中的 路径 -> 特征向量
+        """
+        hits = {}
+        
+        with self._lock:
+            for path in paths:
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                
+                entry = self._conn.execute(
+                    "SELECT size, mtime_ns, row FROM entries WHERE path = ?", (path,)
+                ).fetchone()
+                
+                if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                    hits[path] = self._read_row(entry[2])
+                    continue
+                
+                # 签名不一致，有同样大小的条目时才按内容哈希查找
+                same_size = self._conn.execute(
+                    "SELECT 1 FROM entries WHERE size = ? LIMIT 1", (stat.st_size,)
+                ).fetchone()
+                if not same_size:
+                    continue
+                
+                try:
+                    content_hash = self._file_hash(path)
+                except OSError:
+                    continue
+                
+                hash_entry = self._conn.execute(
+                    "SELECT row FROM entries WHERE content_hash = ? AND size = ? LIMIT 1",
+                    (content_hash, stat.st_size)
+                ).fetchone()
+                
+                if hash_entry:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (path, size, mtime_ns, content_hash, row) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (path, stat.st_size, stat.st_mtime_ns, content_hash, hash_entry[0])
+                    )
+                    hits[path] = self._read_row(hash_entry[0])
+            
+            self._conn.commit()
+            self.hits += len(hits)
+            self.misses += len(paths) - len(hits)
+        
+        return hits
+    
+    def _ensure_capacity(self, required_rows: int):
+        """容量不足时按倍数扩容向量文件"""
+        capacity = self._vectors.shape[0]
+        if required_rows <= capacity:
+            return
+        
+        new_capacity = capacity
+        while new_capacity < required_rows:
+            new_capacity *= 2
+        
+        tmp_path = self.vectors_path.with_suffix('.tmp.npy')
+        new_vectors = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=self.dtype,
+            shape=(new_capacity, self.feature_dim)
+        )
+        new_vectors[:self.count] = self._vectors[:self.count]
+        new_vectors.flush()
+        del new_vectors
+        
+        self._vectors.flush()
+        del self._vectors
+        os.replace(tmp_path, self.vectors_path)
+        self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+        logger.info(f"特征缓存扩容: {capacity} -> {new_capacity} 行")
+    
+    def store(self, paths: List[str], features: List[np.ndarray],
+              signatures: Optional[Dict[str, Tuple[int, int, str]]] = None):
+        """
+        写入新编码的特征
+        Args:
+            signatures: 路径 -> (文件大小, 修改时间ns, 内容哈希)，解码时已计算；缺失的路径重新stat并读文件计算
+        """
+        if not paths:
+            return
+        
+        signatures = signatures or {}
+        with self._lock:
+            records = []
+            for path, feature in zip(paths, features):
+                signature = signatures.get(path)
+                try:
+                    if signature is None:
+                        stat = os.stat(path)
+                        signature = (stat.st_size, stat.st_mtime_ns, self._file_hash(path))
+                except OSError:
+                    continue
+                records.append((path, signature, feature))
+            
+            if not records:
+                return
+            
+            self._ensure_capacity(self.count + len(records))
+            
+            for path, (size, mtime_ns, content_hash), feature in records:
+                row = self.count
+                self._vectors[row] = feature.astype(self.dtype)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (path, size, mtime_ns, content_hash, row) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (path, size, mtime_ns, content_hash, row)
+                )
+                self.count += 1
+            
+            self._vectors.flush()
+            self._set_meta('count', self.count)
+            self._conn.commit()
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        total = self.hits + self.misses
+        return {
+            'cache_dir': str(self.cache_dir),
+            'entries': self.count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+    
+    def close(self):
+        """刷新并关闭缓存"""
+        with self._lock:
+            self._vectors.flush()
+            self._conn.close()
+
+class TextEmbeddingCache:
+    """
+    文本特征的LRU缓存（线程安全）
+    
+    键为规范化后的查询文本（合并空白、小写，与CLIP分词器的预处理一致），
+    可选持久化为npz文件，重启后恢复。
+    """
+    
+    def __init__(self, max_entries: int = 4096, persist_path: Optional[str] = None,
+                 model_name: str = ""):
+        """
+        初始化文本特征缓存
+        Args:
+            max_entries: 最大缓存条数
+            persist_path: 持久化文件路径，None表示仅在内存中缓存
+            model_name: CLIP模型名称，持久化文件中的模型不一致时丢弃
+        """
+        self.max_entries = max_entries
+        self.persist_path = Path(persist_path) if persist_path else None
+        self.model_name = model_name
+        
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        
+        if self.persist_path is not None:
+            self._load()
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(str(text).split()).lower()
+    
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """查询缓存，命中时返回副本"""
+        key = self.normalize(text)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector.copy()
+    
+    def put(self, text: str, vector: np.ndarray):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        key = self.normalize(text)
+        with self._lock:
+            self._entries[key] = np.array(vector, dtype=np.float32)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+    
+    def __contains__(self, text: str) -> bool:
+        with self._lock:
+            return self.normalize(text) in self._entries
+    
+    def _load(self):
+        """从持久化文件恢复"""
+        if not self.persist_path.exists():
+            return
+        
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                if str(data['model_name']) != self.model_name:
+                    logger.info(f"文本特征缓存模型不一致，忽略: {self.persist_path}")
+                    return
+                texts = data['texts'].tolist()
+                vectors = data['vectors']
+            
+            for text, vector in zip(texts[-self.max_entries:], vectors[-self.max_entries:]):
+                self._entries[text] = vector
+            logger.info(f"📦 已加载文本特征缓存: {len(self._entries)} 条")
+        except Exception as e:
+            logger.warning(f"⚠️ 文本特征缓存加载失败: {e}")
+    
+    def save(self):
+        """持久化到磁盘（按LRU顺序，最近使用的在后）"""
+        if self.persist_path is None:
+            return
+        
+        with self._lock:
+            if not self._dirty or not self._entries:
+                return
+            texts = list(self._entries.keys())
+            vectors = np.stack(list(self._entries.values()))
+            self._dirty = False
+        
+        try:
+            self.persist_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.persist_path.with_suffix('.tmp.npz')
+            np.savez(tmp_path, model_name=np.array(self.model_name),
+                     texts=np.array(texts), vectors=vectors)
+            os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            logger.warning(f"⚠️ 文本特征缓存保存失败: {e}")
+    
+    def get_stats(self) -> Dict:
+        """获取缓存统计"""
+        total = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'persist_path': str(self.persist_path) if self.persist_path else None,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
 class CLIPImageEncoder:
     """CLIP图像和文本编码器 - 增强版"""
     
@@ -312,17 +821,33 @@ class CLIPImageEncoder:
         "RN50", "RN101", "RN50x4", "RN50x16", "RN50x64"
     ]
     
-    def __init__(self, model_name: str = "ViT-B/32"):
+    def __init__(self, model_name: str = "ViT-B/32", num_workers: int = 0,
+                 prefetch_batches: Optional[int] = None,
+                 embedding_cache_dir: Optional[str] = None,
+                 thumbnail_dir: Optional[str] = None,
+                 text_cache_size: int = 4096,
+                 micro_batch_size: int = 0,
+                 micro_batch_wait_ms: float = 5.0):
         """
         初始化CLIP模型
         Args:
             model_name: CLIP模型名称
+            num_workers: 批量编码时解码/预处理的进程数，0表示在主线程串行处理
+            prefetch_batches: 并行预处理时最多预取的批次数，默认为进程数的2倍
+            embedding_cache_dir: 图片特征磁盘缓存目录，None表示不使用缓存
+            thumbnail_dir: 批量编码时顺带生成缩略图的目录，None表示不生成
+            text_cache_size: 文本特征LRU缓存条数，0表示不缓存；
+                设置了embedding_cache_dir时缓存会持久化到该目录
+            micro_batch_size: 并发的单条文本/图片编码请求合并成批的最大条数，0或1表示不合并
+            micro_batch_wait_ms: 收到第一条请求后等待更多请求的最长时间（毫秒）
         """
         if model_name not in self.SUPPORTED_MODELS:
             logger.warning(f"模型 {model_name} 可能不受支持，支持的模型: {self.SUPPORTED_MODELS}")
         
         self.model_name = model_name
         self.device = device
+        self.num_workers = max(0, int(num_workers or 0))
+        self.prefetch_batches = prefetch_batches
         
         try:
             self.model, self.preprocess = clip.load(model_name, device=self.device)
@@ -340,6 +865,37 @@ class CLIPImageEncoder:
         except Exception as e:
             logger.error(f"模型加载失败: {e}")
             raise
+        
+        # 图片特征缓存（可选）
+        self.embedding_cache = None
+        if embedding_cache_dir:
+            try:
+                self.embedding_cache = EmbeddingCache(embedding_cache_dir, model_name, self.feature_dim)
+            except Exception as e:
+                logger.warning(f"⚠️ 特征缓存初始化失败，将不使用缓存: {e}")
+        
+        # 批量编码时的缩略图生成（可选）
+        self.thumbnail_store = ThumbnailStore(thumbnail_dir) if thumbnail_dir else None
+        
+        # 文本特征缓存（可选持久化）
+        self.text_cache = None
+        if text_cache_size > 0:
+            persist_path = None
+            if embedding_cache_dir:
+                model_slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+                persist_path = os.path.join(embedding_cache_dir, model_slug, "text_cache.npz")
+            self.text_cache = TextEmbeddingCache(text_cache_size, persist_path, model_name)
+            if persist_path:
+                atexit.register(self.text_cache.save)
+        
+        # 在线查询的请求合并（可选）
+        self.text_batcher = None
+        self.image_batcher = None
+        if micro_batch_size > 1:
+            self.text_batcher = MicroBatcher(self._encode_text_batch, micro_batch_size,
+                                             micro_batch_wait_ms, name="clip-text-batcher")
+            self.image_batcher = MicroBatcher(self._encode_image_tensor_batch, micro_batch_size,
+                                              micro_batch_wait_ms, name="clip-image-batcher")
     
     def encode_image_from_path(self, image_path: str) -> Optional[np.ndarray]:
         """
@@ -357,19 +913,34 @@ class CLIPImageEncoder:
             
             # 加载和预处理图片
             image = Image.open(image_path).convert('RGB')
-            image_input = self.preprocess(image).unsqueeze(0).to(self.device)
+            image_input = self.preprocess(image)
             
-            # 编码图片
-            with torch.no_grad():
-                image_features = self.model.encode_image(image_input)
-                image_features = image_features / image_features.norm(dim=-1, keepdim=True)
-                
-            return image_features.cpu().numpy()[0]
+            # 并发请求合并为一次批量前向计算
+            if self.image_batcher is not None:
+                return self.image_batcher.submit(image_input)
+            
+            return self._encode_image_tensor_batch([image_input])[0]
             
         except Exception as e:
             logger.error(f"图片编码失败 {image_path}: {e}")
             return None
     
+    def _encode_image_tensor_batch(self, image_inputs: List[torch.Tensor]) -> List[np.ndarray]:
+        """对一批已预处理的图片张量做一次前向计算"""
+        image_batch = torch.stack(image_inputs).to(self.device)
+        with torch.no_grad():
+            image_features = self.model.encode_image(image_batch)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        return list(image_features.cpu().numpy())
+    
+    def _encode_text_batch(self, texts: List[str]) -> List[np.ndarray]:
+        """对一批文本做一次前向计算"""
+        text_tokens = clip.tokenize(texts, truncate=True).to(self.device)
+        with torch.no_grad():
+            text_features = self.model.encode_text(text_tokens)
+            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+        return list(text_features.cpu().numpy())
+    
     def encode_image(self, image_path: str) -> Optional[np.ndarray]:
         """
         编码单张图片（别名方法，用于以图搜图）
@@ -380,9 +951,16 @@ class CLIPImageEncoder:
         """
         return self.encode_image_from_path(image_path)
     
-    def encode_images_batch_from_paths(self, image_paths: List[str], batch_size: int = 32) -> Tuple[List[np.ndarray], List[str], List[Dict]]:
+    def encode_images_batch_from_paths(self, image_paths: List[str], batch_size: int = 32,
+                                       num_workers: Optional[int] = None,
+                                       prefetch_batches: Optional[int] = None) -> Tuple[List[np.ndarray], List[str], List[Dict]]:
         """
         批量从本地路径编码图片 - 增强版，返回详细错误信息
+        Args:
+            image_paths: 图片路径列表
+            batch_size: 批次大小
+            num_workers: 解码/预处理进程数 (None使用初始化配置，0为主线程串行)
+            prefetch_batches: 预取批次数上限 (None使用初始化配置)
         
         Returns:
             features: 特征向量列表
@@ -393,134 +971,21 @@ class CLIPImageEncoder:
         valid_paths = []
         error_details = []
         processed_count = 0
+        total_batches = (len(image_paths) - 1) // batch_size + 1 if image_paths else 0
         
-        for i in range(0, len(image_paths), batch_size):
-            batch_paths = image_paths[i:i+batch_size]
-            batch_images = []
-            batch_valid_paths = []
-            
-            # 预处理批次图片
-            for path in batch_paths:
-                try:
-                    if not os.path.exists(path):
-                        error_details.append({
-                            'path': path,
-                            'error': 'file_not_found',
-                            'message': '文件不存在'
-                        })
-                        continue
-                    
-                    # 检查文件大小
-                    try:
-                        file_size = os.path.getsize(path)
-                        if file_size == 0:
-                            error_details.append({
-                                'path': path,
-                                'error': 'empty_file',
-                                'message': '文件为空'
-                            })
-                            continue
-                        
-                        if file_size > 50 * 1024 * 1024:  # 50MB
-                            error_details.append({
-                                'path': path,
-                                'error': 'file_too_large',
-                                'message': f'文件过大: {file_size/1024/1024:.1f}MB'
-                            })
-                            continue
-                    except OSError as e:
-                        error_details.append({
-                            'path': path,
-                            'error': 'file_access_error',
-                            'message': f'文件访问错误: {str(e)}'
-                        })
-                        continue
-                    
-                    # 尝试加载图片
-                    try:
-                        image = Image.open(path).convert('RGB')
-                        
-                        # 检查图片尺寸
-                        width, height = image.size
-                        if width < 10 or height < 10:
-                            error_details.append({
-                                'path': path,
-                                'error': 'invalid_dimensions',
-                                'message': f'图片尺寸过小: {width}x{height}'
-                            })
-                            continue
-                        
-                        if width > 10000 or height > 10000:
-                            error_details.append({
-                                'path': path,
-                                'error': 'dimensions_too_large', 
-                                'message': f'图片尺寸过大: {width}x{height}'
-                            })
-                            continue
-                        
-                        # 预处理图片
-                        image_input = self.preprocess(image)
-                        batch_images.append(image_input)
-                        batch_valid_paths.append(path)
-                        
-                    except Exception as e:
-                        error_details.append({
-                            'path': path,
-                            'error': 'image_processing_failed',
-                            'message': f'图片处理失败: {str(e)}'
-                        })
-                        continue
-                        
-                except Exception as e:
-                    error_details.append({
-                        'path': path,
-                        'error': 'unexpected_error',
-                        'message': f'未知错误: {str(e)}'
-                    })
-                    continue
-            
-            if not batch_images:
-                continue
-            
-            # 批量编码
-            try:
-                batch_tensor = torch.stack(batch_images).to(self.device)
-                
-                with torch.no_grad():
-                    batch_features = self.model.encode_image(batch_tensor)
-                    batch_features = batch_features / batch_features.norm(dim=-1, keepdim=True)
-                
-                # 添加到结果列表
-                for j, feature in enumerate(batch_features.cpu().numpy()):
-                    features.append(feature)
-                    valid_paths.append(batch_valid_paths[j])
-                    processed_count += 1
-                
-                logger.info(f"批次 {i//batch_size + 1}/{(len(image_paths)-1)//batch_size + 1} 完成 - 成功: {processed_count}, 失败: {len(error_details)}")
-                
-            except Exception as e:
-                # 如果批量编码失败，尝试单张处理
-                logger.warning(f"批量编码失败，尝试单张处理: {e}")
-                
-                for j, (path, image_input) in enumerate(zip(batch_valid_paths, batch_images)):
-                    try:
-                        single_tensor = image_input.unsqueeze(0).to(self.device)
-                        
-                        with torch.no_grad():
-                            single_feature = self.model.encode_image(single_tensor)
-                            single_feature = single_feature / single_feature.norm(dim=-1, keepdim=True)
-                        
-                        features.append(single_feature.cpu().numpy()[0])
-                        valid_paths.append(path)
-                        processed_count += 1
-                        
-                    except Exception as single_error:
-                        error_details.append({
-                            'path': path,
-                            'error': 'encoding_failed',
-                            'message': f'编码失败: {str(single_error)}'
-                        })
-                        continue
+        batch_iter = self.iter_encoded_batches_from_paths(
+            image_paths, batch_size,
+            num_workers=num_workers,
+            prefetch_batches=prefetch_batches
+        )
+        for batch_index, (batch_features, batch_valid_paths, batch_errors) in enumerate(batch_iter):
+            features.extend(batch_features)
+            valid_paths.extend(batch_valid_paths)
+            error_details.extend(batch_errors)
+            processed_count += len(batch_features)
+            
+            if batch_features:
+                logger.info(f"批次 {batch_index + 1}/{total_batches} 完成 - 成功: {processed_count}, 失败: {len(error_details)}")
         
         # 统计错误类型
         error_stats = {}
@@ -531,6 +996,154 @@ class CLIPImageEncoder:
         logger.info(f"批量编码完成 - 总成功: {processed_count}, 总失败: {len(error_details)}")
         if error_stats:
             logger.info(f"错误统计: {error_stats}")
+        if self.embedding_cache is not None:
+            cache_stats = self.embedding_cache.get_stats()
+            logger.info(f"特征缓存: 命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']}, "
+                        f"命中率 {cache_stats['hit_rate']*100:.1f}%")
+        
+        return features, valid_paths, error_details
+    
+    def iter_encoded_batches_from_paths(self, image_paths: List[str], batch_size: int = 32,
+                                        num_workers: Optional[int] = None,
+                                        prefetch_batches: Optional[int] = None,
+                                        use_cache: bool = True):
+        """
+        逐批编码图片（生成器）
+        
+        num_workers > 0 时，解码和预处理在进程池中进行，并预取后续批次，
+        与当前批次的模型推理重叠执行。启用特征缓存时，命中缓存的图片
+        不再解码和推理。
+        
+        Yields:
+            (batch_features, batch_valid_paths, batch_errors)
+        """
+        batches = [image_paths[i:i+batch_size] for i in range(0, len(image_paths), batch_size)]
+        cache = self.embedding_cache if use_cache else None
+        
+        # 缓存命中结果，与预处理批次按顺序一一对应
+        cached_batches = deque()
+        
+        def uncached_batches():
+            for batch_paths in batches:
+                hits = cache.lookup(batch_paths) if cache is not None else {}
+                cached_batches.append((batch_paths, hits))
+                yield [path for path in batch_paths if path not in hits]
+        
+        for batch_images, batch_valid_paths, batch_errors, batch_signatures in self._iter_preprocessed_batches(
+                uncached_batches(), num_workers, prefetch_batches):
+            batch_paths, hits = cached_batches.popleft()
+            
+            encoded = {}
+            encode_errors = []
+            if batch_images:
+                encoded_features, encoded_paths, encode_errors = self._encode_preprocessed_batch(
+                    batch_images, batch_valid_paths
+                )
+                if cache is not None:
+                    cache.store(encoded_paths, encoded_features,
+                                signatures=dict(zip(batch_valid_paths, batch_signatures)))
+                encoded = dict(zip(encoded_paths, encoded_features))
+            
+            # 按原始顺序合并缓存结果与新编码结果
+            batch_features = []
+            result_paths = []
+            for path in batch_paths:
+                feature = hits.get(path)
+                if feature is None:
+                    feature = encoded.get(path)
+                if feature is not None:
+                    batch_features.append(feature)
+                    result_paths.append(path)
+            
+            yield batch_features, result_paths, batch_errors + encode_errors
+    
+    def _iter_preprocessed_batches(self, batches,
+                                   num_workers: Optional[int] = None,
+                                   prefetch_batches: Optional[int] = None):
+        """按顺序产出预处理完成的批次，可选进程池并行解码（batches可为惰性迭代器）"""
+        if num_workers is None:
+            num_workers = self.num_workers
+        if prefetch_batches is None:
+            prefetch_batches = self.prefetch_batches
+        
+        if num_workers <= 0:
+            for batch_paths in batches:
+                yield _preprocess_image_batch(batch_paths, self.preprocess, self.thumbnail_store)
+            return
+        
+        # 预取深度至少覆盖所有工作进程
+        max_in_flight = max(prefetch_batches or num_workers * 2, num_workers)
+        logger.info(f"并行预处理: {num_workers} 个进程, 预取深度 {max_in_flight} 个批次")
+        
+        executor = ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_preprocess_worker,
+            initargs=(self.preprocess, self.thumbnail_store)
+        )
+        batch_iter = iter(batches)
+        pending = deque()
+        exhausted = False
+        try:
+            while True:
+                # 补充预取队列
+                while not exhausted and len(pending) < max_in_flight:
+                    try:
+                        batch_paths = next(batch_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.append(executor.submit(_preprocess_batch_worker, batch_paths))
+                
+                if not pending:
+                    break
+                
+                future = pending.popleft()
+                yield future.result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+    
+    def _encode_preprocessed_batch(self, batch_images: List[np.ndarray],
+                                   batch_valid_paths: List[str]) -> Tuple[List[np.ndarray], List[str], List[Dict]]:
+        """对预处理后的批次执行模型推理，失败时回退为单张编码"""
+        features = []
+        valid_paths = []
+        error_details = []
+        
+        # 批量编码
+        try:
+            batch_tensor = torch.from_numpy(np.stack(batch_images)).to(self.device)
+            
+            with torch.no_grad():
+                batch_features = self.model.encode_image(batch_tensor)
+                batch_features = batch_features / batch_features.norm(dim=-1, keepdim=True)
+            
+            # 添加到结果列表
+            for j, feature in enumerate(batch_features.cpu().numpy()):
+                features.append(feature)
+                valid_paths.append(batch_valid_paths[j])
+            
+        except Exception as e:
+            # 如果批量编码失败，尝试单张处理
+            logger.warning(f"批量编码失败，尝试单张处理: {e}")
+            
+            for path, image_input in zip(batch_valid_paths, batch_images):
+                try:
+                    single_tensor = torch.from_numpy(image_input).unsqueeze(0).to(self.device)
+                    
+                    with torch.no_grad():
+                        single_feature = self.model.encode_image(single_tensor)
+                        single_feature = single_feature / single_feature.norm(dim=-1, keepdim=True)
+                    
+                    features.append(single_feature.cpu().numpy()[0])
+                    valid_paths.append(path)
+                    
+                except Exception as single_error:
+                    error_details.append({
+                        'path': path,
+                        'error': 'encoding_failed',
+                        'message': f'编码失败: {str(single_error)}'
+                    })
+                    continue
         
         return features, valid_paths, error_details
     
@@ -542,19 +1155,78 @@ class CLIPImageEncoder:
         Returns:
             文本特征向量
         """
+        if self.text_cache is not None:
+            cached = self.text_cache.get(text)
+            if cached is not None:
+                return cached
+        
         try:
-            text_tokens = clip.tokenize([text]).to(self.device)
-            
-            with torch.no_grad():
-                text_features = self.model.encode_text(text_tokens)
-                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            # 并发请求合并为一次批量前向计算
+            if self.text_batcher is not None:
+                features = self.text_batcher.submit(text)
+            else:
+                features = self._encode_text_batch([text])[0]
             
-            return text_features.cpu().numpy()[0]
+            if self.text_cache is not None:
+                self.text_cache.put(text, features)
+            return features
             
         except Exception as e:
             logger.error(f"文本编码失败: {e}")
             return None
     
+    def encode_texts(self, texts: List[str], batch_size: int = 64) -> List[Optional[np.ndarray]]:
+        """
+        批量编码文本（缓存命中的跳过，未命中的按批一次前向计算）
+        Args:
+            texts: 输入文本列表
+            batch_size: 每次前向计算的文本数
+        Returns:
+            与输入一一对应的特征向量列表，编码失败的位置为None
+        """
+        features = [None] * len(texts)
+        pending = {}  # 规范化文本 -> 输入位置列表
+        
+        for i, text in enumerate(texts):
+            cached = self.text_cache.get(text) if self.text_cache is not None else None
+            if cached is not None:
+                features[i] = cached
+            else:
+                key = TextEmbeddingCache.normalize(text)
+                pending.setdefault(key, []).append(i)
+        
+        pending_keys = list(pending)
+        for start in range(0, len(pending_keys), batch_size):
+            batch_keys = pending_keys[start:start + batch_size]
+            batch_texts = [texts[pending[key][0]] for key in batch_keys]
+            try:
+                for key, text, vector in zip(batch_keys, batch_texts, self._encode_text_batch(batch_texts)):
+                    if self.text_cache is not None:
+                        self.text_cache.put(text, vector)
+                    for i in pending[key]:
+                        features[i] = vector.copy()
+            except Exception as e:
+                logger.error(f"批量文本编码失败: {e}")
+        
+        return features
+    
+    def warm_up_text_cache(self, texts: List[str], batch_size: int = 64) -> int:
+        """
+        批量预编码文本写入缓存（已缓存的跳过）
+        Returns:
+            新编码的条数
+        """
+        if self.text_cache is None:
+            return 0
+        
+        pending = list(dict.fromkeys(
+            text for text in texts if text and text not in self.text_cache
+        ))
+        features = self.encode_texts(pending, batch_size)
+        
+        self.text_cache.save()
+        return sum(1 for vector in features if vector is not None)
+    
     def encode_image_from_pil(self, pil_image: Image.Image) -> Optional[np.ndarray]:
         """
         从PIL图片编码
@@ -600,15 +1272,20 @@ class MySQLDataProcessor:
         # 图片路径前缀
         self.image_path_prefix = "/home/ai/"
         
-        self.connection = None
+        self.pool = get_pool(self.db_config)  # 进程内共享的连接池
         self.dataset_df = None
         self.available_tag_fields = []
         self.schema_info = None
         self.file_mapping = None  # 延迟初始化
         self._file_mapping_built = False  # 添加标志
+        self.file_catalog = None  # scandir目录清单，存在性检查共用
+        self.file_catalog_file = "file_catalog.json.gz"  # 目录清单缓存，只重新扫描有变化的品牌目录
+        self._file_catalog_lock = threading.Lock()
+        self._reported_paths = None  # refresh_file_catalog上次返回时的路径集合
         
         # 添加数据库状态追踪
         self.last_known_count = None
+        self.last_known_max_id = None
         self.last_check_time = None
         self.status_file = "db_status.json"  # 状态文件
         
@@ -621,19 +1298,13 @@ class MySQLDataProcessor:
     def _test_connection(self):
         """测试数据库连接"""
         try:
-            connection = pymysql.connect(**self.db_config)
-            connection.close()
+            with self.pool.connection() as connection:
+                connection.ping(reconnect=False)
             logger.info(f"数据库连接测试成功 - {self.db_config['host']}:{self.db_config['port']}")
         except Exception as e:
             logger.error(f"数据库连接失败: {e}")
             raise
     
-    def _get_connection(self):
-        """获取数据库连接"""
-        if self.connection is None or not self.connection.open:
-            self.connection = pymysql.connect(**self.db_config)
-        return self.connection
-    
     def _load_status(self):
         """加载数据库状态"""
         try:
@@ -641,16 +1312,23 @@ class MySQLDataProcessor:
                 with open(self.status_file, 'r', encoding='utf-8') as f:
                     status = json.load(f)
                     self.last_known_count = status.get('count')
+                    self.last_known_max_id = status.get('max_id')
                     self.last_check_time = status.get('check_time')
                     logger.info(f"加载状态: 上次记录 {self.last_known_count} 条数据")
         except Exception as e:
             logger.warning(f"加载状态文件失败: {e}")
     
-    def _save_status(self, count: int):
-        """保存数据库状态"""
+    def _save_status(self, count: int, max_id: Optional[int] = None):
+        """
+        保存数据库状态
+        Args:
+            count: 记录数
+            max_id: 已同步的最大ID水位线
+        """
         try:
             status = {
                 'count': count,
+                'max_id': int(max_id) if max_id is not None else None,
                 'check_time': datetime.now().isoformat(),
                 'database': self.db_config['database'],
                 'table': 'work_copy428'
@@ -659,8 +1337,9 @@ class MySQLDataProcessor:
                 json.dump(status, f, ensure_ascii=False, indent=2)
             
             self.last_known_count = count
+            self.last_known_max_id = status['max_id']
             self.last_check_time = status['check_time']
-            logger.info(f"保存状态: {count} 条数据")
+            logger.info(f"保存状态: {count} 条数据, 最大ID: {status['max_id']}")
         except Exception as e:
             logger.warning(f"保存状态文件失败: {e}")
     
@@ -670,29 +1349,9 @@ class MySQLDataProcessor:
             # 加载上次状态
             self._load_status()
             
-            connection = self._get_connection()
-            
-            # 获取当前数据库记录数
-            base_fields = ['id', 'image_url']
-            tag_fields = []
-            
-            # 检查可用字段
+            # 检查可用字段并构建查询条件
             schema_info = self.check_database_schema()
-            if schema_info and schema_info['has_ai_tags']:
-                tag_fields.append('ai_tags')
-            if schema_info and schema_info['has_tags']:
-                tag_fields.append('tags')
-            
-            # 构建查询条件
-            where_conditions = ["image_url IS NOT NULL", "image_url != ''"]
-            
-            if tag_fields:
-                tag_conditions = []
-                for field in tag_fields:
-                    tag_conditions.append(f"({field} IS NOT NULL AND {field} != '')")
-                where_conditions.append(f"({' OR '.join(tag_conditions)})")
-            
-            where_clause = ' AND '.join(where_conditions)
+            _, _, where_clause = self._build_query_parts(schema_info)
             
             # 获取当前总数
             count_sql = f"""
@@ -701,9 +1360,10 @@ class MySQLDataProcessor:
                 WHERE {where_clause}
             """
             
-            with connection.cursor() as cursor:
-                cursor.execute(count_sql)
-                current_count = cursor.fetchone()[0]
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(count_sql)
+                    current_count = cursor.fetchone()[0]
             
             # 比较数据变化
             if self.last_known_count is None:
@@ -734,12 +1394,20 @@ class MySQLDataProcessor:
                     FROM work_copy428 
                     WHERE {where_clause}
                 """
-                with connection.cursor() as cursor:
-                    cursor.execute(timestamp_sql)
-                    latest_id = cursor.fetchone()[0]
+                with self.pool.connection() as connection:
+                    with connection.cursor() as cursor:
+                        cursor.execute(timestamp_sql)
+                        latest_id = cursor.fetchone()[0]
             except:
                 latest_id = None
             
+            # 数量不变但最大ID变化（新增与删除相抵）也视为有更新
+            if (change_type == 'no_change' and latest_id is not None
+                    and self.last_known_max_id is not None
+                    and int(latest_id) != int(self.last_known_max_id)):
+                change_type = 'modified'
+                message = f"数据库更新：记录数不变，最大ID变化 ({self.last_known_max_id} → {latest_id})"
+            
             return {
                 'has_updates': change_type != 'no_change',
                 'change_type': change_type,
@@ -747,6 +1415,7 @@ class MySQLDataProcessor:
                 'current_count': current_count,
                 'last_known_count': self.last_known_count,
                 'latest_id': latest_id,
+                'last_known_max_id': self.last_known_max_id,
                 'message': message,
                 'check_time': datetime.now().isoformat()
             }
@@ -766,14 +1435,13 @@ class MySQLDataProcessor:
     def check_database_schema(self):
         """检查数据库表结构"""
         try:
-            connection = self._get_connection()
-            
             # 检查表结构
             sql = "DESCRIBE work_copy428"
             
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
-                columns = cursor.fetchall()
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute(sql)
+                    columns = cursor.fetchall()
             
             logger.info("数据库表字段结构:")
             available_columns = []
@@ -804,78 +1472,33 @@ class MySQLDataProcessor:
     def load_data(self, limit: int = 183247, offset: int = 0, save_status: bool = True):
         """
         从数据库加载数据 - 动态适配字段
+        按主键分页流式读取并逐块清洗，不再一次性fetchall整个结果
         Args:
             limit: 限制加载的记录数 (默认183247)
             offset: 偏移量
             save_status: 是否保存状态
         """
         try:
-            # 先检查数据库结构
-            schema_info = self.check_database_schema()
-            if not schema_info:
-                raise Exception("无法获取数据库结构信息")
-            
-            connection = self._get_connection()
-            
-            # 根据存在的字段动态构建查询
-            base_fields = ['id', 'image_url']
-            tag_fields = []
-            
-            if schema_info['has_ai_tags']:
-                tag_fields.append('ai_tags')
-            if schema_info['has_tags']:
-                tag_fields.append('tags')
-            
-            if not tag_fields:
-                raise Exception("数据库中没有找到ai_tags或tags字段")
-            
-            all_fields = base_fields + tag_fields
-            fields_str = ', '.join(all_fields)
-            
-            # 构建WHERE条件 - 动态适配
-            where_conditions = ["image_url IS NOT NULL", "image_url != ''"]
-            
-            # 添加标签字段的条件
-            tag_conditions = []
-            for field in tag_fields:
-                tag_conditions.append(f"({field} IS NOT NULL AND {field} != '')")
-            
-            if tag_conditions:
-                where_conditions.append(f"({' OR '.join(tag_conditions)})")
-            
-            where_clause = ' AND '.join(where_conditions)
-            
-            sql = f"""
-                SELECT {fields_str}
-                FROM work_copy428 
-                WHERE {where_clause}
-                ORDER BY id
-                LIMIT %s OFFSET %s
-            """
+            after_id = None
+            if offset > 0:
+                after_id = self._id_at_offset(offset)
+                if after_id is None:
+                    logger.warning(f"偏移量 {offset} 超出记录数")
             
-            logger.info(f"动态SQL查询: {sql}")
-            logger.info(f"可用字段: {all_fields}")
             logger.info(f"执行查询: 限制 {limit} 条记录，偏移 {offset}")
+            chunks = list(self.iter_data_chunks(limit=limit, after_id=after_id))
             
-            # 执行查询
-            with connection.cursor() as cursor:
-                cursor.execute(sql, (limit, offset))
-                results = cursor.fetchall()
-            
-            # 转换为DataFrame
-            self.dataset_df = pd.DataFrame(results, columns=all_fields)
-            
-            # 保存字段信息
-            self.available_tag_fields = tag_fields
-            self.schema_info = schema_info
-            
-            # 数据清洗和处理
-            self._clean_data()
+            if chunks:
+                self.dataset_df = pd.concat(chunks, ignore_index=True)
+            else:
+                all_fields = self._build_query_parts(self.schema_info)[0]
+                self.dataset_df = self._clean_data(pd.DataFrame(columns=all_fields))
+            max_id = int(self.dataset_df['id'].max()) if len(self.dataset_df) > 0 else None
             
             # 保存状态（如果需要）
             if save_status:
                 current_count = len(self.dataset_df)
-                self._save_status(current_count)
+                self._save_status(current_count, max_id)
             
             logger.info(f"成功加载 {len(self.dataset_df)} 条数据")
             
@@ -883,6 +1506,210 @@ class MySQLDataProcessor:
             logger.error(f"数据加载失败: {e}")
             raise
     
+    def iter_data_chunks(self, limit: Optional[int] = 183247, after_id: Optional[int] = None,
+                         chunk_size: int = 20000, max_id: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """
+        按主键分页流式读取并清洗数据，逐块产出DataFrame（直接交给索引流水线）
+        Args:
+            limit: 最多读取的记录数，None表示不限制
+            after_id: 从该ID之后开始读取（续建）
+            chunk_size: 每块行数
+            max_id: 只读取到该ID为止（续建时沿用首次构建确定的上限）
+        Yields:
+            清洗后的DataFrame（按id升序）
+        """
+        schema_info = self.check_database_schema()
+        if not schema_info:
+            raise Exception("无法获取数据库结构信息")
+        
+        # 根据存在的字段动态构建查询
+        all_fields, tag_fields, where_clause = self._build_query_parts(schema_info)
+        if not tag_fields:
+            raise Exception("数据库中没有找到ai_tags或tags字段")
+        
+        # 保存字段信息
+        self.available_tag_fields = tag_fields
+        self.schema_info = schema_info
+        
+        # 进程启动后新增的图片也要能判定为存在
+        self._rescan_file_catalog()
+        
+        logger.info(f"流式读取: 字段 {all_fields}, 条件 {where_clause}, 每块 {chunk_size} 条, "
+                    f"起始ID {after_id}, 截止ID {max_id}, 限制 {limit}")
+        
+        loaded = 0
+        for rows in iter_keyset_pages(self.pool, all_fields, "work_copy428", where_clause,
+                                      page_size=chunk_size, after_id=after_id, limit=limit,
+                                      max_id=max_id):
+            loaded += len(rows)
+            chunk_df = pd.DataFrame(rows, columns=all_fields)
+            del rows
+            logger.info(f"读取数据块: {len(chunk_df)} 条 (累计 {loaded})")
+            yield self._clean_data(chunk_df)
+    
+    def count_records(self, limit: Optional[int] = None, after_id: Optional[int] = None,
+                      max_id: Optional[int] = None) -> Tuple[int, Optional[int]]:
+        """
+        统计满足索引条件的记录数与最大ID（只扫描id列）
+        Args:
+            limit: 只统计按ID排序的前limit条
+            after_id: 只统计该ID之后的记录
+            max_id: 只统计不超过该ID的记录
+        Returns:
+            (记录数, 最大ID)
+        """
+        schema_info = self.check_database_schema()
+        _, _, where_clause = self._build_query_parts(schema_info)
+        
+        params = []
+        if after_id is not None:
+            where_clause += " AND id > %s"
+            params.append(after_id)
+        if max_id is not None:
+            where_clause += " AND id <= %s"
+            params.append(max_id)
+        sql = f"SELECT id FROM work_copy428 WHERE {where_clause} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT %s"
+            params.append(limit)
+        
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*), MAX(id) FROM ({sql}) AS t", params)
+                count, max_id = cursor.fetchone()
+        return int(count), int(max_id) if max_id is not None else None
+    
+    def save_current_status(self, limit: Optional[int] = None):
+        """
+        记录当前数据库状态（与load_data(limit)保存的一致），不加载数据
+        """
+        count, max_id = self.count_records(limit=limit)
+        self._save_status(count, max_id)
+    
+    def _id_at_offset(self, offset: int) -> Optional[int]:
+        """按ID排序跳过offset条记录后的最后一个ID（用于把偏移量换算为分页起点）"""
+        schema_info = self.check_database_schema()
+        _, _, where_clause = self._build_query_parts(schema_info)
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT id FROM work_copy428 WHERE {where_clause} ORDER BY id LIMIT 1 OFFSET %s",
+                    (offset - 1,)
+                )
+                row = cursor.fetchone()
+        return int(row[0]) if row else None
+    
+    def _build_query_parts(self, schema_info: Optional[Dict]) -> Tuple[List[str], List[str], str]:
+        """
+        根据表结构构建查询字段与WHERE条件
+        Returns:
+            all_fields: 查询字段列表
+            tag_fields: 可用标签字段列表
+            where_clause: WHERE条件
+        """
+        base_fields = ['id', 'image_url']
+        tag_fields = []
+        
+        if schema_info and schema_info['has_ai_tags']:
+            tag_fields.append('ai_tags')
+        if schema_info and schema_info['has_tags']:
+            tag_fields.append('tags')
+        
+        # 构建WHERE条件 - 动态适配
+        where_conditions = ["image_url IS NOT NULL", "image_url != ''"]
+        
+        # 添加标签字段的条件
+        if tag_fields:
+            tag_conditions = []
+            for field in tag_fields:
+                tag_conditions.append(f"({field} IS NOT NULL AND {field} != '')")
+            where_conditions.append(f"({' OR '.join(tag_conditions)})")
+        
+        return base_fields + tag_fields, tag_fields, ' AND '.join(where_conditions)
+    
+    def fetch_valid_ids(self) -> set:
+        """获取所有满足索引条件的记录ID（只查询id列，用于增量同步）"""
+        schema_info = self.check_database_schema()
+        if not schema_info:
+            raise Exception("无法获取数据库结构信息")
+        
+        _, _, where_clause = self._build_query_parts(schema_info)
+        sql = f"""
+            SELECT id
+            FROM work_copy428 
+            WHERE {where_clause}
+        """
+        
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute(sql)
+                valid_ids = {int(row[0]) for row in cursor.fetchall()}
+        
+        logger.info(f"数据库中满足条件的记录: {len(valid_ids):,} 条")
+        return valid_ids
+    
+    def load_records_by_ids(self, record_ids: List[int], chunk_size: int = 1000) -> pd.DataFrame:
+        """
+        按ID加载并清洗指定记录（不影响已加载的dataset_df）
+        Args:
+            record_ids: 记录ID列表
+            chunk_size: 每次IN查询的ID数量
+        Returns:
+            清洗后的DataFrame
+        """
+        record_ids = sorted(int(record_id) for record_id in record_ids)
+        return self._load_records_where('id', record_ids, chunk_size)
+    
+    def load_records_by_image_urls(self, image_urls: List[str], chunk_size: int = 1000) -> pd.DataFrame:
+        """
+        按image_url加载并清洗指定记录（目录监听发现新文件时使用）
+        Args:
+            image_urls: image_url列表（如 /scraper_data/<品牌>/<文件名>）
+            chunk_size: 每次IN查询的URL数量
+        Returns:
+            清洗后的DataFrame
+        """
+        return self._load_records_where('image_url', sorted(set(image_urls)), chunk_size)
+    
+    def _load_records_where(self, column: str, values: List, chunk_size: int) -> pd.DataFrame:
+        """按某一列的取值分批IN查询满足索引条件的记录并清洗"""
+        schema_info = self.check_database_schema()
+        if not schema_info:
+            raise Exception("无法获取数据库结构信息")
+        
+        all_fields, tag_fields, where_clause = self._build_query_parts(schema_info)
+        if not tag_fields:
+            raise Exception("数据库中没有找到ai_tags或tags字段")
+        
+        self.available_tag_fields = tag_fields
+        self.schema_info = schema_info
+        self._rescan_file_catalog()
+        
+        fields_str = ', '.join(all_fields)
+        results = []
+        
+        with self.pool.connection() as connection:
+            for i in range(0, len(values), chunk_size):
+                chunk = values[i:i + chunk_size]
+                placeholders = ', '.join(['%s'] * len(chunk))
+                sql = f"""
+                    SELECT {fields_str}
+                    FROM work_copy428 
+                    WHERE {where_clause} AND {column} IN ({placeholders})
+                    ORDER BY id
+                """
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, chunk)
+                    results.extend(cursor.fetchall())
+        
+        logger.info(f"按{column}加载 {len(results)} 条记录（查询 {len(values)} 个值）")
+        
+        records_df = pd.DataFrame(results, columns=all_fields)
+        if len(records_df) == 0:
+            return records_df
+        
+        return self._clean_data(records_df)
+    
     def _build_file_mapping_once(self):
         """只构建一次文件映射表"""
         if self._file_mapping_built and self.file_mapping is not None:
@@ -890,29 +1717,53 @@ class MySQLDataProcessor:
             return
         
         logger.info("首次构建文件映射表...")
-        self.file_mapping = {}
-        scraper_base = f'{self.image_path_prefix}scraper_data/'
-        
-        if os.path.exists(scraper_base):
-            for brand_dir in os.listdir(scraper_base):
-                brand_path = os.path.join(scraper_base, brand_dir)
-                if os.path.isdir(brand_path):
-                    try:
-                        for filename in os.listdir(brand_path):
-                            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                                full_path = os.path.join(brand_path, filename)
-                                self.file_mapping[filename] = full_path
-                    except Exception as e:
-                        logger.warning(f"读取目录 {brand_dir} 失败: {e}")
+        self.file_catalog = FileCatalog(f'{self.image_path_prefix}scraper_data/',
+                                        cache_file=self.file_catalog_file).scan()
+        self.file_mapping = self.file_catalog.file_mapping
         
         self._file_mapping_built = True
         logger.info(f"文件映射表构建完成，映射了 {len(self.file_mapping)} 个文件")
     
-    def _clean_data(self):
-        """清洗和处理数据 - 优化版本"""
+    def _rescan_file_catalog(self):
+        """
+        刷新目录清单并更新文件映射表（只重新扫描修改时间变化的品牌目录）
+        常驻进程中清单不能只在启动时构建一次，否则之后新增的图片会被判定为不存在
+        """
+        with self._file_catalog_lock:
+            if not self._file_mapping_built or self.file_catalog is None:
+                self._build_file_mapping_once()
+                return
+            self.file_catalog.scan()
+            self.file_mapping = self.file_catalog.file_mapping
+    
+    def refresh_file_catalog(self) -> Tuple[List[str], List[str]]:
+        """
+        重新扫描目录清单并返回自上次调用以来的变化（目录监听使用）
+        与数据读取时的刷新互不影响：比对基准是本方法上次返回时的清单
+        Returns:
+            (新增文件路径列表, 删除文件路径列表)
+        """
+        self._rescan_file_catalog()
+        before = self._reported_paths if self._reported_paths is not None else self.file_catalog.paths
+        after = self.file_catalog.paths
+        self._reported_paths = after
+        return sorted(after - before), sorted(before - after)
+    
+    def _clean_data(self, df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        清洗和处理数据 - 优化版本
+        Args:
+            df: 待清洗的数据，默认为已加载的dataset_df（清洗结果会写回）
+        Returns:
+            清洗后的DataFrame
+        """
+        update_dataset = df is None
+        if update_dataset:
+            df = self.dataset_df
+        
         try:
-            initial_count = len(self.dataset_df)
-            self.dataset_df = self.dataset_df.dropna(subset=['image_url'])
+            initial_count = len(df)
+            df = df.dropna(subset=['image_url'])
             
             # 动态过滤空标签记录
             if hasattr(self, 'available_tag_fields'):
@@ -920,120 +1771,61 @@ class MySQLDataProcessor:
             else:
                 # 回退逻辑
                 tag_fields = []
-                if 'ai_tags' in self.dataset_df.columns:
+                if 'ai_tags' in df.columns:
                     tag_fields.append('ai_tags')
-                if 'tags' in self.dataset_df.columns:
+                if 'tags' in df.columns:
                     tag_fields.append('tags')
             
             logger.info(f"可用标签字段: {tag_fields}")
             
             # 过滤掉所有标签字段都为空的记录
             if tag_fields:
-                mask = pd.Series([False] * len(self.dataset_df), index=self.dataset_df.index)
+                mask = pd.Series([False] * len(df), index=df.index)
                 for field in tag_fields:
                     field_mask = (
-                        self.dataset_df[field].notna() & 
-                        (self.dataset_df[field] != '') &
-                        (self.dataset_df[field] != 'null')
+                        df[field].notna() & 
+                        (df[field] != '') &
+                        (df[field] != 'null')
                     )
                     mask = mask | field_mask
                 
-                self.dataset_df = self.dataset_df[mask]
-                logger.info(f"标签过滤后剩余: {len(self.dataset_df)} 条记录")
+                df = df[mask]
+                logger.info(f"标签过滤后剩余: {len(df)} 条记录")
             
             # 只在需要时构建文件映射表
             self._build_file_mapping_once()
             
-            # 处理图片路径（使用已有的映射表）
-            def process_image_path(image_url):
-                if pd.isna(image_url) or image_url == '':
-                    return ''
-                
-                clean_url = str(image_url).strip()
-                filename = os.path.basename(clean_url)
-                
-                if filename in self.file_mapping:
-                    return self.file_mapping[filename]
-                
-                if clean_url.startswith('/scraper_data/'):
-                    return clean_url.replace('/scraper_data/', f'{self.image_path_prefix}scraper_data/')
-                else:
-                    return os.path.join(self.image_path_prefix, clean_url.lstrip('/'))
-            
-            self.dataset_df['full_image_path'] = self.dataset_df['image_url'].apply(process_image_path)
+            # 处理图片路径（使用已有的映射表，整列计算）
+            df['full_image_path'] = resolve_image_paths(df['image_url'], self.file_mapping, self.image_path_prefix)
             
-            # 动态处理和合并标签
-            def process_and_merge_tags(row):
-                """动态处理并合并所有可用的标签字段"""
-                combined_tags = []
-                
-                # 遍历所有可用的标签字段
-                for field in tag_fields:
-                    if field in row and pd.notna(row[field]) and str(row[field]).strip():
-                        field_value = str(row[field]).strip()
-                        
-                        # 跳过明显的空值
-                        if field_value.lower() in ['null', 'none', '']:
-                            continue
-                        
-                        try:
-                            # 尝试解析JSON格式
-                            if field_value.startswith('[') or field_value.startswith('{'):
-                                parsed = json.loads(field_value)
-                                if isinstance(parsed, list):
-                                    parsed_tags = ', '.join(str(tag) for tag in parsed if tag)
-                                elif isinstance(parsed, dict):
-                                    parsed_tags = ', '.join(f"{k}: {v}" for k, v in parsed.items() if v)
-                                else:
-                                    parsed_tags = str(parsed)
-                                
-                                if parsed_tags:
-                                    combined_tags.append(parsed_tags)
-                            else:
-                                combined_tags.append(field_value)
-                                
-                        except (json.JSONDecodeError, Exception):
-                            # 如果不是JSON，直接使用原值
-                            combined_tags.append(field_value)
-                
-                return ' | '.join(combined_tags) if combined_tags else '无标签信息'
-            
-            # 应用标签合并处理
-            self.dataset_df['processed_tags'] = self.dataset_df.apply(process_and_merge_tags, axis=1)
+            # 动态处理和合并标签（JSON数组快速路径，其余按唯一值解析）
+            df['processed_tags'] = merge_tag_columns(df, tag_fields)
             
             # 添加文件名信息
-            self.dataset_df['filename'] = self.dataset_df['image_url'].apply(
-                lambda x: os.path.basename(x) if x else ''
-            )
+            df['filename'] = url_basenames(df['image_url'])
             
-            # 验证图片路径有效性
-            def path_exists_check(path):
-                try:
-                    return os.path.exists(path) if path else False
-                except:
-                    return False
-            
-            self.dataset_df['file_exists'] = self.dataset_df['full_image_path'].apply(path_exists_check)
-            valid_count = self.dataset_df['file_exists'].sum()
+            # 验证图片路径有效性（目录清单覆盖的路径无需再stat）
+            df['file_exists'] = check_paths_exist(df['full_image_path'], self.file_catalog)
+            valid_count = df['file_exists'].sum()
             
             # 统计标签字段
             tag_stats = {}
             for field in tag_fields:
-                if field in self.dataset_df.columns:
+                if field in df.columns:
                     non_empty = (
-                        self.dataset_df[field].notna() & 
-                        (self.dataset_df[field] != '') &
-                        (self.dataset_df[field] != 'null')
+                        df[field].notna() & 
+                        (df[field] != '') &
+                        (df[field] != 'null')
                     ).sum()
                     tag_stats[field] = int(non_empty)
             
             logger.info(f"标签合并和路径处理完成:")
-            logger.info(f"  总记录: {len(self.dataset_df)}")
+            logger.info(f"  总记录: {len(df)}")
             logger.info(f"  文件匹配成功: {valid_count}")
             logger.info(f"  标签统计: {tag_stats}")
             
             # 显示样本数据
-            sample_data = self.dataset_df[['id'] + tag_fields + ['processed_tags']].head(3)
+            sample_data = df[['id'] + tag_fields + ['processed_tags']].head(3)
             logger.info(f"标签样本数据:")
             for idx, row in sample_data.iterrows():
                 logger.info(f"  ID {row['id']}:")
@@ -1043,9 +1835,13 @@ class MySQLDataProcessor:
                 processed = str(row['processed_tags'])[:100]
                 logger.info(f"    processed_tags: {processed}")
             
-            cleaned_count = len(self.dataset_df)
+            cleaned_count = len(df)
             logger.info(f"数据清洗完成: {initial_count} -> {cleaned_count}")
             
+            if update_dataset:
+                self.dataset_df = df
+            return df
+            
         except Exception as e:
             logger.error(f"数据清洗失败: {e}")
             raise
@@ -1094,10 +1890,9 @@ class MySQLDataProcessor:
         }
 
     def close_connection(self):
-        """关闭数据库连接"""
-        if self.connection and self.connection.open:
-            self.connection.close()
-            logger.info("数据库连接已关闭")
+        """关闭连接池中的空闲连接"""
+        self.pool.close()
+        logger.info("数据库连接已关闭")
 
 class ChromaDBManager:
     """ChromaDB数据库管理器 - 增强版"""
@@ -1113,6 +1908,7 @@ class ChromaDBManager:
         self.client = None
         self.collection = None
         self.is_local_mode = False
+        self.version = 0  # 每次写入/删除/重置后递增，查询结果缓存据此失效
         
         self._connect()
         self._verify_persistence()
@@ -1176,22 +1972,34 @@ class ChromaDBManager:
         except Exception as e:
             logger.error(f"❌ 持久化验证失败: {e}")
     
-    def add_images(self, embeddings: List[List[float]], metadatas: List[Dict], 
-                   documents: List[str], ids: List[str], batch_size: int = 5000):
+    def add_images(self, embeddings: Union[List[List[float]], np.ndarray], metadatas: List[Dict], 
+                   documents: List[str], ids: List[str], batch_size: int = 5000,
+                   upsert: bool = True):
         """
         分批添加图片数据 - 增强版本
+        
+        插入数量在本地累计，不再逐批查询collection.count()；
+        默认使用upsert，重复写入同一批数据（如续建）不会报错或产生重复。
+        Args:
+            embeddings: 向量列表或 (N, dim) 的numpy数组（直接发送，不转换为Python列表）
+            upsert: 是否使用upsert写入
+        Returns:
+            成功插入的记录数
         """
         total_items = len(embeddings)
         
         if total_items == 0:
             logger.warning("没有数据需要添加")
-            return
+            return 0
         
         logger.info(f"开始分批插入 {total_items} 条数据，批次大小: {batch_size}")
         
+        write = self.collection.upsert if upsert else self.collection.add
         successful_batches = 0
         failed_batches = 0
         total_inserted = 0
+        total_seconds = 0.0
+        total_batches = (total_items + batch_size - 1) // batch_size
         
         try:
             for i in range(0, total_items, batch_size):
@@ -1203,55 +2011,57 @@ class ChromaDBManager:
                 batch_ids = ids[i:end_idx]
                 
                 batch_num = i // batch_size + 1
-                total_batches = (total_items + batch_size - 1) // batch_size
-                
-                logger.info(f"插入批次 {batch_num}/{total_batches}: {len(batch_embeddings)} 条记录")
                 
                 try:
-                    self.collection.add(
+                    batch_start = time.perf_counter()
+                    write(
                         embeddings=batch_embeddings,
                         metadatas=batch_metadatas,
                         documents=batch_documents,
                         ids=batch_ids
                     )
-                    
-                    # 立即验证写入
-                    new_count = self.collection.count()
-                    logger.info(f"✅ 批次 {batch_num} 插入成功, 当前总数: {new_count}")
+                    batch_seconds = time.perf_counter() - batch_start
                     
                     successful_batches += 1
-                    total_inserted += len(batch_embeddings)
+                    total_inserted += len(batch_ids)
+                    total_seconds += batch_seconds
+                    self.version += 1
+                    
+                    throughput = len(batch_ids) / batch_seconds if batch_seconds > 0 else 0
+                    logger.info(f"✅ 批次 {batch_num}/{total_batches} 写入 {len(batch_ids)} 条, "
+                                f"耗时 {batch_seconds:.2f}s ({throughput:,.0f} 向量/秒), 累计 {total_inserted}")
                     
                 except Exception as e:
                     logger.error(f"❌ 批次 {batch_num} 插入失败: {e}")
                     failed_batches += 1
                     continue
             
-            # 最终验证
-            final_count = self.collection.count()
-            logger.info(f"📊 最终验证: ChromaDB中共有 {final_count} 条记录")
-            
             logger.info(f"📊 分批插入完成:")
             logger.info(f"   总批次: {successful_batches + failed_batches}")
             logger.info(f"   成功批次: {successful_batches}")
             logger.info(f"   失败批次: {failed_batches}")
             logger.info(f"   成功插入: {total_inserted} 条记录")
+            if total_seconds > 0:
+                logger.info(f"   平均吞吐: {total_inserted / total_seconds:,.0f} 向量/秒")
             
             if failed_batches > 0:
                 logger.warning(f"有 {failed_batches} 个批次插入失败")
             
+            return total_inserted
+            
         except Exception as e:
             logger.error(f"分批插入过程中出错: {e}")
             raise
     
     def search_similar_images(self, query_vector: List[float], top_k: int = 10,
-                            where: Optional[Dict] = None) -> Dict:
+                            where: Optional[Dict] = None, nprobe: Optional[int] = None) -> Dict:
         """
         搜索相似图片
         Args:
             query_vector: 查询向量
             top_k: 返回结果数量
             where: 过滤条件
+            nprobe: 与NumpyVectorStore保持接口一致，ChromaDB的HNSW参数按集合配置，此处忽略
         Returns:
             搜索结果
         """
@@ -1267,6 +2077,24 @@ class ChromaDBManager:
             logger.error(f"相似图片搜索失败: {e}")
             return {}
     
+    def search_similar_images_batch(self, query_vectors: List[List[float]], top_k: int = 10,
+                                    where: Optional[Dict] = None, nprobe: Optional[int] = None) -> Dict:
+        """
+        批量搜索相似图片（一次请求提交多个查询向量）
+        Returns:
+            ChromaDB query格式的结果，ids/metadatas/distances按查询顺序排列
+        """
+        try:
+            return self.collection.query(
+                query_embeddings=[list(map(float, vector)) for vector in query_vectors],
+                n_results=top_k,
+                where=where,
+                include=['metadatas', 'documents', 'distances']
+            )
+        except Exception as e:
+            logger.error(f"批量相似图片搜索失败: {e}")
+            return {}
+    
     def get_collection_info(self) -> Dict:
         """获取集合信息"""
         try:
@@ -1288,14 +2116,36 @@ class ChromaDBManager:
                 name=self.collection_name,
                 metadata={"description": "CLIP本地图片向量集合"}
             )
+            self.version += 1
             logger.info("集合已重置")
         except Exception as e:
             logger.error(f"重置集合失败: {e}")
             
+    def with_collection(self, collection_name: str) -> 'ChromaDBManager':
+        """以相同连接配置打开另一个集合"""
+        return ChromaDBManager(self.host, self.port, collection_name, self.fallback_local_path)
+    
+    def delete_collection(self):
+        """删除整个集合"""
+        try:
+            self.client.delete_collection(self.collection_name)
+            self.version += 1
+            logger.info(f"🗑️ 已删除集合 {self.collection_name}")
+        except Exception as e:
+            logger.error(f"删除集合失败: {e}")
+    
     def get_all_existing_ids(self) -> set:
         """获取ChromaDB中所有已存在的ID - 修复版"""
+        return set(self.get_existing_id_paths().keys())
+    
+    def get_existing_id_paths(self) -> Dict[int, str]:
+        """
+        获取ChromaDB中所有已存在的ID及其图片路径
+        Raises:
+            RuntimeError: 任一批次读取失败（返回不完整的列表会让增量同步把已索引的记录当作新增）
+        """
         try:
-            existing_ids = set()
+            existing_ids = {}
             batch_size = 5000  # 减小批次大小
             
             # 先获取总数
@@ -1303,7 +2153,7 @@ class ChromaDBManager:
             logger.info(f"ChromaDB总记录数: {total_count}")
             
             if total_count == 0:
-                return set()
+                return {}
             
             # 分批获取所有数据
             processed = 0
@@ -1326,7 +2176,7 @@ class ChromaDBManager:
                     for metadata in results['metadatas']:
                         if 'id' in metadata:
                             try:
-                                existing_ids.add(int(metadata['id']))
+                                existing_ids[int(metadata['id'])] = metadata.get('image_path', '')
                             except (ValueError, TypeError):
                                 logger.warning(f"无效ID: {metadata.get('id')}")
                     
@@ -1337,16 +2187,170 @@ class ChromaDBManager:
                         break
                         
                 except Exception as e:
-                    logger.error(f"获取批次 {processed} 失败: {e}")
-                    processed += batch_size  # 跳过这个批次
-                    continue
+                    raise RuntimeError(f"获取批次 {processed} 失败: {e}") from e
             
             logger.info(f"成功获取 {len(existing_ids)} 个已存在的ID")
             return existing_ids
             
         except Exception as e:
             logger.error(f"获取已存在ID失败: {e}")
-            return set()
+            raise
+    
+    def delete_images_by_ids(self, image_ids: List[int], batch_size: int = 1000) -> int:
+        """
+        按MySQL记录ID删除向量
+        Args:
+            image_ids: MySQL记录ID列表（对应metadata中的id）
+            batch_size: 每批删除的ID数量
+        Returns:
+            提交删除的ID数量
+        """
+        image_ids = [int(image_id) for image_id in image_ids]
+        deleted = 0
+        
+        for i in range(0, len(image_ids), batch_size):
+            batch_ids = image_ids[i:i + batch_size]
+            try:
+                self.collection.delete(where={"id": {"$in": batch_ids}})
+                deleted += len(batch_ids)
+                self.version += 1
+            except Exception as e:
+                logger.error(f"删除批次 {i // batch_size + 1} 失败: {e}")
+        
+        logger.info(f"🗑️ 已删除 {deleted} 个ID对应的向量")
+        return deleted
+    
+    def get_images_by_ids(self, image_ids: List[int],
+                          include: Optional[List[str]] = None) -> Dict:
+        """
+        按MySQL记录ID获取数据
+        Args:
+            image_ids: MySQL记录ID列表（对应metadata中的id）
+            include: 需要返回的字段，默认只返回metadatas
+        Returns:
+            ChromaDB get格式的结果
+        """
+        image_ids = [int(image_id) for image_id in image_ids]
+        where = {"id": image_ids[0]} if len(image_ids) == 1 else {"id": {"$in": image_ids}}
+        return self.collection.get(where=where, include=include or ['metadatas'])
+    
+    def get_images_by_paths(self, image_paths: List[str],
+                            include: Optional[List[str]] = None) -> Dict:
+        """
+        按图片路径获取数据
+        Args:
+            image_paths: 图片路径列表（对应metadata中的image_path）
+            include: 需要返回的字段，默认只返回metadatas
+        Returns:
+            ChromaDB get格式的结果
+        """
+        image_paths = list(image_paths)
+        where = {"image_path": image_paths[0]} if len(image_paths) == 1 else {"image_path": {"$in": image_paths}}
+        return self.collection.get(where=where, include=include or ['metadatas'])
+
+def assemble_index_records(valid_df: pd.DataFrame, features: List[np.ndarray],
+                           valid_paths: List[str], clip_model: str,
+                           used_ids: Optional[set] = None,
+                           as_numpy: bool = False) -> Tuple[Union[List[List[float]], np.ndarray], List[Dict], List[str], List[str]]:
+    """
+    将编码结果与数据行关联，生成写入向量库的记录
+    
+    通过full_image_path建立一次路径索引，再按位置批量取列，
+    整体为线性复杂度（替代逐条DataFrame过滤）。
+    Args:
+        valid_df: 已按full_image_path去重的数据
+        features: 特征向量列表，与valid_paths一一对应
+        valid_paths: 编码成功的图片路径
+        clip_model: CLIP模型名称，写入metadata
+        used_ids: 已使用的向量ID集合（跨批次去重时传入，会被原地更新）
+        as_numpy: 以 (N, dim) float32 数组返回embeddings，而不是Python列表
+    Returns:
+        embeddings, metadatas, documents, ids
+    """
+    embeddings = []
+    metadatas = []
+    documents = []
+    ids = []
+    
+    if used_ids is None:
+        used_ids = set()
+    used_paths = set()
+    
+    if len(valid_paths) == 0 or len(valid_df) == 0:
+        return embeddings, metadatas, documents, ids
+    
+    # 路径 -> 行位置 (重复路径取第一条)
+    path_index = pd.Index(valid_df['full_image_path'])
+    if not path_index.is_unique:
+        keep_mask = ~path_index.duplicated(keep='first')
+        valid_df = valid_df[keep_mask]
+        path_index = path_index[keep_mask]
+    row_positions = path_index.get_indexer(valid_paths)
+    
+    # 预先取出列数组，避免逐行构造Series
+    def column_values(name):
+        if name in valid_df.columns:
+            return valid_df[name].to_numpy()
+        return None
+    
+    id_values = valid_df['id'].to_numpy()
+    url_values = valid_df['image_url'].to_numpy()
+    filename_values = valid_df['filename'].to_numpy()
+    tags_values = valid_df['processed_tags'].to_numpy()
+    ai_tags_values = column_values('ai_tags')
+    raw_tags_values = column_values('tags')
+    created_at = datetime.now().isoformat()
+    
+    for i, (path, pos) in enumerate(zip(valid_paths, row_positions)):
+        if pos < 0 or path in used_paths:
+            continue
+        
+        row_id = id_values[pos]
+        
+        # 生成唯一ID
+        vector_id = f"img_{row_id}"
+        
+        # 确保ID唯一
+        if vector_id in used_ids:
+            counter = 1
+            while f"{vector_id}_{counter}" in used_ids:
+                counter += 1
+            vector_id = f"{vector_id}_{counter}"
+        
+        embeddings.append(features[i] if as_numpy else features[i].tolist())
+        
+        filename = filename_values[pos]
+        processed_tags = tags_values[pos]
+        
+        # 清晰的字段命名
+        metadatas.append({
+            'id': int(row_id),
+            'image_path': path,
+            'original_url': url_values[pos],
+            'filename': filename,
+            'original_ai_tags': str(ai_tags_values[pos]) if ai_tags_values is not None else '',
+            'original_tags': str(raw_tags_values[pos]) if raw_tags_values is not None else '',
+            'combined_tags': str(processed_tags),
+            'display_tags': str(processed_tags),
+            'created_at': created_at,
+            'clip_model': clip_model
+        })
+        
+        # documents字段用于搜索
+        documents.append(f"图片: {filename}, 标签: {processed_tags}")
+        ids.append(vector_id)
+        
+        used_ids.add(vector_id)
+        used_paths.add(path)
+    
+    if as_numpy:
+        embeddings = (np.stack(embeddings).astype(np.float32, copy=False) if embeddings
+                      else np.empty((0, len(features[0]) if len(features) else 0), dtype=np.float32))
+    
+    return embeddings, metadatas, documents, ids
+
+class IndexBuildCancelled(Exception):
+    """由进度回调抛出，用于取消正在进行的索引构建/同步（检查点保留，可续建）"""
 
 class DatabaseImageRetrievalSystem:
     """基于数据库的本地图片检索系统"""
@@ -1355,14 +2359,54 @@ class DatabaseImageRetrievalSystem:
                  clip_model: str = "ViT-B/32",
                  chromadb_host: str = "localhost", 
                  chromadb_port: int = 6600,
-                 collection_name: str = "local_db_image_collection"):
-        """初始化数据库图片检索系统"""
+                 collection_name: str = "local_db_image_collection",
+                 preprocess_workers: int = 0,
+                 embedding_cache_dir: Optional[str] = None,
+                 vector_backend: str = "chromadb",
+                 numpy_index_dir: str = "./numpy_index",
+                 vector_ann: Optional[str] = None,
+                 vector_codec: Optional[str] = None,
+                 thumbnail_dir: Optional[str] = None,
+                 micro_batch_size: int = 0,
+                 micro_batch_wait_ms: float = 5.0):
+        """
+        初始化数据库图片检索系统
+        Args:
+            preprocess_workers: 构建索引时图片解码/预处理的进程数，0表示串行
+            embedding_cache_dir: 图片特征磁盘缓存目录，None表示不使用缓存
+            vector_backend: 向量库后端 chromadb / numpy（进程内暴力检索）
+            numpy_index_dir: numpy后端的存储目录
+            vector_ann: numpy后端的近似索引类型，None为精确检索，"ivf"为倒排索引
+            vector_codec: numpy后端的向量压缩编码，None为不压缩，"pq"/"int8"
+            thumbnail_dir: 构建索引时顺带生成缩略图的目录，None表示不生成
+            micro_batch_size: 在线查询编码请求合并的最大批大小，0表示不合并
+            micro_batch_wait_ms: 请求合并的最长等待时间（毫秒）
+        """
         logger.info("初始化本地图片检索系统...")
         
         # 初始化各个组件
-        self.clip_encoder = CLIPImageEncoder(clip_model)
-        self.chromadb = ChromaDBManager(chromadb_host, chromadb_port, collection_name)
+        self.clip_encoder = CLIPImageEncoder(
+            clip_model,
+            num_workers=preprocess_workers,
+            embedding_cache_dir=embedding_cache_dir,
+            thumbnail_dir=thumbnail_dir,
+            micro_batch_size=micro_batch_size,
+            micro_batch_wait_ms=micro_batch_wait_ms
+        )
+        # 全量重建写入带版本号的新集合，完成后切换；别名文件记录当前在线的集合
+        self.collection_name = collection_name
+        self.vector_backend = vector_backend
+        self.collection_alias_file = DEFAULT_ALIAS_FILE
+        live_collection = self._load_live_collection_name()
+        if vector_backend == "numpy":
+            self.chromadb = NumpyVectorStore(numpy_index_dir, live_collection,
+                                             ann=vector_ann, codec=vector_codec)
+        elif vector_backend == "chromadb":
+            self.chromadb = ChromaDBManager(chromadb_host, chromadb_port, live_collection)
+        else:
+            raise ValueError(f"不支持的向量库后端: {vector_backend}")
         self.db_processor = MySQLDataProcessor()
+        self.checkpoint_file = "index_checkpoint.json"  # 构建检查点文件
         self.tag_keywords = {
             "色彩": ["单色系", "对比色", "黑白", "金属色", "哑光色", "鲜艳色彩", "柔和色彩", "复古色彩", "梦幻色彩"],
             "色调":["冷色调", "暖色调", "中性色调", "高对比度", "低对比度", "明亮色调", "暗黑色调", "黄昏色调", "褪色效果", "夜景色调", "饱和色调"],
@@ -1375,6 +2419,12 @@ class DatabaseImageRetrievalSystem:
             "车型": ["轿车", "SUV", "越野", "房车", "MPV", "紧凑型轿车", "中型轿车", "豪华轿车", "跑车", "皮卡", "古典车", "电动车"],
         }
         
+        # 预编码所有标签，常用标签查询直接命中文本特征缓存
+        all_tags = [tag for tags in self.tag_keywords.values() for tag in tags]
+        warmed = self.clip_encoder.warm_up_text_cache(all_tags)
+        if warmed:
+            logger.info(f"🔥 文本特征缓存预热: {warmed} 个标签")
+        
         # 检查现有索引状态
         try:
             collection_info = self.chromadb.get_collection_info()
@@ -1394,43 +2444,297 @@ class DatabaseImageRetrievalSystem:
     
     def build_index(self, batch_size: int = 32, force_rebuild: bool = False, 
                    limit: int = 183247, only_existing_files: bool = True,
-                   chromadb_batch_size: int = 4000):
-        """构建图片索引 - 增强版"""
+                   chromadb_batch_size: int = 4000, num_workers: Optional[int] = None,
+                   resume: bool = True, writer_queue_size: int = 2,
+                   progress_callback: Optional[Callable[[Dict], None]] = None):
+        """
+        构建图片索引 - 增强版
+        
+        编码结果按批由后台线程写入向量库，并在每次写入后保存检查点；
+        构建中断后再次调用会从检查点记录的ID之后继续。
+        Args:
+            resume: 存在未完成的检查点时是否续建（False则丢弃检查点重新构建；force_rebuild时
+                只续建未完成的全量重建，原地写入在线集合的检查点会被丢弃）
+            writer_queue_size: 等待写入的批次上限
+            progress_callback: 进度回调，参数为 {'phase', 'processed', 'total', 'indexed', 'errors'}，
+                抛出IndexBuildCancelled可取消构建
+        """
+        checkpoint = self._load_checkpoint() if resume else None
+        if not resume:
+            self._clear_checkpoint()
+        
+        if checkpoint is not None and force_rebuild:
+            if checkpoint['collection'] == self.chromadb.collection_name:
+                # 原地写入在线集合的构建不是全量重建，丢弃后写入新版本集合
+                logger.warning(f"⚠️ 强制重建：丢弃写入在线集合 {checkpoint['collection']} 的未完成检查点 "
+                               f"(ID {checkpoint['last_id']})，从头写入新版本集合")
+                self._clear_checkpoint()
+                checkpoint = None
+            else:
+                logger.warning(f"⚠️ 强制重建：存在未完成的全量重建，继续写入 {checkpoint['collection']} "
+                               f"而不是从头开始（传入 resume=False 可丢弃检查点）")
+        
         # 检查是否需要重建
         collection_info = self.chromadb.get_collection_info()
-        if not force_rebuild and collection_info.get('count', 0) > 0:
+        if checkpoint is None and not force_rebuild and collection_info.get('count', 0) > 0:
             logger.info(f"检测到已存在 {collection_info['count']} 条数据，跳过构建")
             self.is_indexed = True
             return
         
-        if force_rebuild:
-            logger.info("强制重建索引...")
-            self.chromadb.reset_collection()
+        # 写入目标：全量重建写入新版本集合，查询在构建期间继续使用当前集合
+        target = self.chromadb
+        if checkpoint is not None:
+            if checkpoint['collection'] != self.chromadb.collection_name:
+                target = self.chromadb.with_collection(checkpoint['collection'])
+            logger.info(f"⏯️ 检测到未完成的构建，从ID {checkpoint['last_id']} 之后继续 "
+                        f"(集合 {target.collection_name}, 已处理 {checkpoint['processed']}, "
+                        f"已索引 {checkpoint['indexed']})")
+        else:
+            if force_rebuild:
+                target = self._create_staging_collection()
+                logger.info(f"强制重建索引，写入新集合 {target.collection_name}...")
+            checkpoint = self._new_checkpoint(target.collection_name)
         
         logger.info(f"开始构建图片索引 - 限制: {limit} 张图片...")
         
-        # 加载数据
-        if self.db_processor.dataset_df is None:
-            self.db_processor.load_data(limit=limit)
+        # 加载数据：已加载dataset_df时直接使用，否则按主键分页流式读取（续建从检查点ID之后开始），
+        # 每块数据清洗后直接送入编码/写入流水线，内存中只保留当前块
+        if progress_callback is not None:
+            progress_callback({'phase': 'loading'})
+        if self.db_processor.dataset_df is not None:
+            chunks = [self.db_processor.dataset_df]
+            total_rows = len(self.db_processor.dataset_df)
+        else:
+            # 首次构建时把前limit条的最大ID记入检查点，续建只读到该ID为止，不会在检查点之后再多读limit条
+            if checkpoint['last_id'] is None:
+                total_rows, checkpoint['max_id'] = self.db_processor.count_records(limit=limit)
+            max_id = checkpoint.get('max_id')
+            read_limit = limit if max_id is None else None
+            if checkpoint['last_id'] is not None:
+                total_rows, _ = self.db_processor.count_records(
+                    limit=read_limit, after_id=checkpoint['last_id'], max_id=max_id)
+            chunks = self.db_processor.iter_data_chunks(
+                limit=read_limit, after_id=checkpoint['last_id'], max_id=max_id)
         
-        # 获取数据
-        dataset_df = self.db_processor.dataset_df
-        if len(dataset_df) == 0:
-            logger.error("没有可用的数据")
-            return
+        rows_done = 0
+        chunk_rows = 0
+        indexed_before = 0
+        # 续建时目标集合中已有的路径与已记录编码失败的路径视为已处理，检查点之后的记录与之重复的不再写入
+        seen_paths = set()
+        if checkpoint['last_id'] is not None:
+            seen_paths.update(path for path in target.get_existing_id_paths().values() if path)
+            seen_paths.update(error.get('path') for error in self._load_error_report(
+                checkpoint['error_report_file'], checkpoint.get('error_count')))
         
-        # 获取图片路径
-        if only_existing_files:
-            valid_df = dataset_df[dataset_df['file_exists'] == True].copy()
-            logger.info(f"找到 {len(valid_df)} 个存在的图片文件")
-        else:
-            valid_df = dataset_df.copy()
-            logger.info(f"处理 {len(valid_df)} 个图片记录 (包括不存在的文件)")
+        def chunk_progress(progress: Dict):
+            # 块内进度换算为整体进度
+            if progress.get('total'):
+                progress = dict(
+                    progress,
+                    processed=rows_done + int(progress['processed'] * chunk_rows / progress['total']),
+                    total=total_rows,
+                    indexed=indexed_before + progress['indexed']
+                )
+            progress_callback(progress)
         
-        if len(valid_df) == 0:
+        # 构建期间不按最先写入的一批向量训练近似索引/压缩编码，写完后用全部向量统一训练
+        auto_train = getattr(target, 'auto_train', None)
+        if auto_train is not None:
+            target.auto_train = False
+        try:
+            for chunk_df in chunks:
+                chunk_rows = len(chunk_df)
+                
+                # 获取图片路径
+                if only_existing_files:
+                    valid_df = chunk_df[chunk_df['file_exists'] == True]
+                    logger.info(f"找到 {len(valid_df)} 个存在的图片文件")
+                else:
+                    valid_df = chunk_df
+                    logger.info(f"处理 {len(valid_df)} 个图片记录 (包括不存在的文件)")
+                
+                # 跳过检查点之前已处理的记录
+                if checkpoint['last_id'] is not None:
+                    valid_df = valid_df[valid_df['id'] > checkpoint['last_id']]
+                
+                # 跨块按文件路径去重，保留第一条记录
+                valid_df = valid_df[~valid_df['full_image_path'].isin(seen_paths)]
+                seen_paths.update(valid_df['full_image_path'])
+                
+                if len(valid_df) > 0:
+                    indexed_before = checkpoint['indexed']
+                    self._index_dataframe(
+                        valid_df.copy(), batch_size=batch_size,
+                        chromadb_batch_size=chromadb_batch_size,
+                        num_workers=num_workers,
+                        checkpoint=checkpoint,
+                        writer_queue_size=writer_queue_size,
+                        progress_callback=chunk_progress if progress_callback is not None else None,
+                        store=target
+                    )
+                rows_done += chunk_rows
+            if checkpoint['processed'] > 0 and hasattr(target, 'build_trained_indexes'):
+                target.build_trained_indexes()
+        finally:
+            if auto_train is not None:
+                target.auto_train = auto_train
+        
+        if checkpoint['processed'] == 0:
             logger.error("没有找到可用的图片文件")
+            if target is not self.chromadb:
+                target.delete_collection()
+            return
+        
+        # 先切换再删除检查点：两步之间中断时，续建会发现检查点指向在线集合且没有剩余记录
+        self._finish_build_target(target, checkpoint)
+        self._clear_checkpoint()
+        if checkpoint['indexed'] > 0:
+            logger.info(f"✅ 索引构建完成! 成功索引 {checkpoint['indexed']} 张图片")
+    
+    def _load_live_collection_name(self) -> str:
+        """读取别名文件中当前在线的集合名（没有记录时为基础集合名）"""
+        return load_live_collection_name(self.collection_name, self.vector_backend, self.collection_alias_file)
+    
+    def _save_live_collection_name(self, live_collection: str, previous_collection: Optional[str] = None):
+        """原子地更新别名文件"""
+        save_live_collection_name(self.collection_name, live_collection, self.vector_backend,
+                                  self.collection_alias_file, previous_collection)
+    
+    def _create_staging_collection(self):
+        """打开下一个版本号的空集合（如 local_db_image_collection_v3）用于全量重建"""
+        match = re.fullmatch(re.escape(self.collection_name) + r"_v(\d+)", self.chromadb.collection_name)
+        next_version = int(match.group(1)) + 1 if match else 1
+        staging = self.chromadb.with_collection(f"{self.collection_name}_v{next_version}")
+        
+        # 之前放弃的构建可能留下了数据
+        if staging.get_collection_info().get('count', 0) > 0:
+            staging.reset_collection()
+        return staging
+    
+    def _finish_build_target(self, target, checkpoint: Dict):
+        """构建完成：新版本集合有数据则切换为在线集合并回收旧集合，否则丢弃"""
+        if target is self.chromadb:
+            if checkpoint['indexed'] > 0:
+                self.is_indexed = True
+            return
+        
+        if target.get_collection_info().get('count', 0) == 0:
+            logger.error(f"新集合 {target.collection_name} 没有数据，保留当前集合 {self.chromadb.collection_name}")
+            target.delete_collection()
             return
         
+        self._swap_collection(target)
+        self.is_indexed = True
+    
+    def sync_live_collection(self) -> bool:
+        """
+        按别名文件同步在线集合（其他进程完成全量重建并切换后调用）
+        Returns:
+            是否发生了切换
+        """
+        live_collection = self._load_live_collection_name()
+        if live_collection == self.chromadb.collection_name:
+            return False
+        
+        logger.info(f"🔀 检测到在线集合已切换: {self.chromadb.collection_name} -> {live_collection}")
+        self.chromadb = self.chromadb.with_collection(live_collection)
+        return True
+    
+    def _swap_collection(self, new_store):
+        """
+        切换在线集合：先持久化别名，再替换引用（后续查询立即使用新集合）
+        被替换下来的集合保留到下一次切换，其他进程（如命令行重建后的Web服务）在
+        sync_live_collection跟随切换之前仍可查询；届时再删除更早的那一版
+        """
+        old_store = self.chromadb
+        stale_collection = load_previous_collection_name(self.collection_name, self.vector_backend,
+                                                         self.collection_alias_file)
+        self._save_live_collection_name(new_store.collection_name, previous_collection=old_store.collection_name)
+        self.chromadb = new_store
+        logger.info(f"🔀 在线集合已切换: {old_store.collection_name} -> {new_store.collection_name}"
+                    f"（保留 {old_store.collection_name} 至下次切换）")
+        
+        if stale_collection and stale_collection not in (old_store.collection_name, new_store.collection_name):
+            logger.info(f"🗑️ 回收上一版本集合 {stale_collection}")
+            new_store.with_collection(stale_collection).delete_collection()
+    
+    def _new_checkpoint(self, collection_name: Optional[str] = None) -> Dict:
+        """创建新的构建检查点（collection_name为写入的集合，默认当前在线集合）"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return {
+            'status': 'running',
+            'collection': collection_name or self.chromadb.collection_name,
+            'clip_model': self.clip_encoder.model_name,
+            'last_id': None,
+            'max_id': None,  # 本次构建读取的ID上限（首次读取数据时确定）
+            'processed': 0,
+            'indexed': 0,
+            'error_count': 0,
+            'error_report_file': f"encoding_errors_{timestamp}.jsonl",
+            'started_at': datetime.now().isoformat(),
+            'updated_at': datetime.now().isoformat()
+        }
+    
+    def _load_checkpoint(self) -> Optional[Dict]:
+        """加载与当前集合和模型匹配的未完成检查点"""
+        try:
+            if not os.path.exists(self.checkpoint_file):
+                return None
+            with open(self.checkpoint_file, 'r', encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except Exception as e:
+            logger.warning(f"加载构建检查点失败: {e}")
+            return None
+        
+        # 写入的可能是当前在线集合，也可能是全量重建中的新版本集合
+        collection = checkpoint.get('collection') or ''
+        if (checkpoint.get('status') != 'running'
+                or not (collection == self.chromadb.collection_name
+                        or re.fullmatch(re.escape(self.collection_name) + r"_v\d+", collection))
+                or checkpoint.get('clip_model') != self.clip_encoder.model_name):
+            logger.info("检查点与当前集合或模型不匹配，忽略")
+            return None
+        
+        return checkpoint
+    
+    def _save_checkpoint(self, checkpoint: Dict):
+        """原子地保存构建检查点"""
+        checkpoint['updated_at'] = datetime.now().isoformat()
+        tmp_file = f"{self.checkpoint_file}.tmp"
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_file, self.checkpoint_file)
+        except Exception as e:
+            logger.warning(f"保存构建检查点失败: {e}")
+    
+    def _clear_checkpoint(self):
+        """删除构建检查点"""
+        try:
+            if os.path.exists(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
+        except Exception as e:
+            logger.warning(f"删除构建检查点失败: {e}")
+    
+    def _index_dataframe(self, valid_df: pd.DataFrame, batch_size: int = 32,
+                         chromadb_batch_size: int = 4000,
+                         num_workers: Optional[int] = None,
+                         checkpoint: Optional[Dict] = None,
+                         writer_queue_size: int = 2,
+                         progress_callback: Optional[Callable[[Dict], None]] = None,
+                         store=None) -> int:
+        """
+        去重、编码并流式写入一批数据行
+        
+        按ID顺序编码，每累计chromadb_batch_size条交给后台写入线程，
+        写入与后续批次的编码重叠执行；队列最多缓存writer_queue_size个
+        写入批次，内存占用与数据总量无关。传入checkpoint时，每次写入
+        成功后更新并保存检查点（最后处理的ID、错误报告）。
+        progress_callback在每个编码批次后调用，抛出异常即中断构建。
+        store为写入的向量库，默认当前在线集合。
+        Returns:
+            成功写入的向量数
+        """
         # 去重处理
         logger.info("去除重复文件...")
         initial_count = len(valid_df)
@@ -1446,15 +2750,139 @@ class DatabaseImageRetrievalSystem:
         
         if len(valid_df) == 0:
             logger.error("去重后没有可用的数据")
-            return
+            return 0
         
-        # 获取唯一的图片路径
+        # 按ID顺序处理，检查点只需记录最后处理的ID
+        valid_df = valid_df.sort_values('id')
         image_paths = valid_df['full_image_path'].tolist()
+        row_ids = valid_df['id'].tolist()
+        total = len(image_paths)
+        
+        error_details = []
+        error_report_file = None
+        if checkpoint is not None:
+            error_report_file = checkpoint['error_report_file']
+            error_details = self._load_error_report(error_report_file, checkpoint.get('error_count'))
+        reported_errors = len(error_details)  # 已追加到错误报告中的条数
+        
+        pending_features = []
+        pending_paths = []
+        used_ids = set()
+        flushed_pos = 0
+        processed_pos = 0
+        encoded_count = 0
+        
+        store = store or self.chromadb
+        
+        # 写入线程：按顺序写入向量库并推进检查点，队列有界以限制内存
+        write_queue = queue.Queue(maxsize=max(1, writer_queue_size))
+        writer_state = {'error': None, 'indexed': 0}
+        
+        def writer():
+            while True:
+                item = write_queue.get()
+                try:
+                    if item is None:
+                        return
+                    if writer_state['error'] is not None:
+                        continue
+                    
+                    embeddings, metadatas, documents, ids, last_id, processed_delta, new_errors = item
+                    if len(embeddings) > 0:
+                        inserted = store.add_images(
+                            embeddings, metadatas, documents, ids, 
+                            batch_size=chromadb_batch_size
+                        )
+                        if inserted < len(embeddings):
+                            raise RuntimeError(f"向量写入不完整: {inserted}/{len(embeddings)}")
+                        writer_state['indexed'] += len(embeddings)
+                    
+                    if checkpoint is not None:
+                        checkpoint['last_id'] = last_id
+                        checkpoint['processed'] += processed_delta
+                        checkpoint['indexed'] += len(embeddings)
+                        checkpoint['error_count'] += len(new_errors)
+                        if new_errors:
+                            self._append_error_report(new_errors, error_report_file)
+                        self._save_checkpoint(checkpoint)
+                except BaseException as e:
+                    logger.error(f"写入线程出错: {e}")
+                    writer_state['error'] = e
+                finally:
+                    write_queue.task_done()
+        
+        writer_thread = threading.Thread(target=writer, name="index-writer", daemon=True)
+        writer_thread.start()
+        
+        def flush():
+            nonlocal flushed_pos, reported_errors
+            
+            if writer_state['error'] is not None:
+                raise writer_state['error']
+            
+            # 只关联本次写入范围内的数据行
+            chunk_df = valid_df.iloc[flushed_pos:processed_pos]
+            embeddings, metadatas, documents, ids = assemble_index_records(
+                chunk_df, pending_features, pending_paths,
+                self.clip_encoder.model_name, used_ids=used_ids, as_numpy=True
+            )
+            
+            # 队列满时阻塞，编码端不会领先写入端太多；错误报告只追加本批新增的错误
+            write_queue.put((
+                embeddings, metadatas, documents, ids,
+                int(row_ids[processed_pos - 1]),
+                processed_pos - flushed_pos,
+                error_details[reported_errors:]
+            ))
+            reported_errors = len(error_details)
+            
+            pending_features.clear()
+            pending_paths.clear()
+            flushed_pos = processed_pos
         
-        # 批量编码图片 - 使用增强版方法
-        features, valid_paths, error_details = self.clip_encoder.encode_images_batch_from_paths(
-            image_paths, batch_size
+        def report_progress(phase: str):
+            if progress_callback is not None:
+                progress_callback({
+                    'phase': phase,
+                    'processed': processed_pos,
+                    'total': total,
+                    'indexed': writer_state['indexed'],
+                    'errors': len(error_details)
+                })
+        
+        batch_iter = self.clip_encoder.iter_encoded_batches_from_paths(
+            image_paths, batch_size, num_workers=num_workers
         )
+        interrupted = False
+        try:
+            report_progress('encoding')
+            for batch_features, batch_paths, batch_errors in batch_iter:
+                processed_pos = min(processed_pos + batch_size, total)
+                pending_features.extend(batch_features)
+                pending_paths.extend(batch_paths)
+                error_details.extend(batch_errors)
+                encoded_count += len(batch_features)
+                
+                if len(pending_features) >= chromadb_batch_size or processed_pos == total:
+                    flush()
+                    logger.info(f"📦 已编码 {processed_pos}/{total}, 已写入 {writer_state['indexed']}, 失败 {len(error_details)}")
+                
+                report_progress('encoding')
+        except BaseException:
+            interrupted = True
+            raise
+        finally:
+            batch_iter.close()
+            # 等待已排队的批次写完
+            write_queue.put(None)
+            writer_thread.join()
+            if interrupted and checkpoint is not None:
+                logger.error(f"⚠️ 构建中断，检查点停在ID {checkpoint['last_id']}，重新运行将从此处继续")
+        
+        if writer_state['error'] is not None:
+            raise writer_state['error']
+        indexed_count = writer_state['indexed']
+        report_progress('encoding')
         
         # 详细分析错误
         if error_details:
@@ -1473,95 +2901,253 @@ class DatabaseImageRetrievalSystem:
             for i, error in enumerate(error_details[:10]):
                 logger.warning(f"   {i+1}. {os.path.basename(error['path'])}: {error['message']}")
             
-            # 保存错误报告
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            error_report_file = f"encoding_errors_{timestamp}.json"
-            try:
-                with open(error_report_file, 'w', encoding='utf-8') as f:
-                    json.dump(error_details, f, ensure_ascii=False, indent=2)
-                logger.info(f"错误报告已保存: {error_report_file}")
-            except:
-                pass
+            # 保存错误报告（有检查点时已由写入线程逐批追加）
+            if error_report_file is None:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                self._save_error_report(error_details, f"encoding_errors_{timestamp}.jsonl")
+            else:
+                logger.info(f"错误报告: {error_report_file}")
         
-        if not features:
+        if encoded_count == 0:
             logger.error("没有成功编码的图片")
-            return
+            return 0
         
         logger.info(f"📊 编码统计:")
-        logger.info(f"   总图片: {len(image_paths)}")
-        logger.info(f"   成功编码: {len(features)}")
-        logger.info(f"   编码失败: {len(error_details)}")
-        logger.info(f"   成功率: {len(features)/len(image_paths)*100:.2f}%")
+        logger.info(f"   总图片: {total}")
+        logger.info(f"   成功编码: {encoded_count}")
+        logger.info(f"   编码失败: {total - encoded_count}")
+        logger.info(f"   成功率: {encoded_count/total*100:.2f}%")
         
-        # 准备数据插入ChromaDB
-        embeddings = []
-        metadatas = []
-        documents = []
-        ids = []
-        
-        used_ids = set()
-        used_paths = set()
-        
-        for i, path in enumerate(valid_paths):
-            if path in used_paths:
-                continue
-            
-            matching_rows = valid_df[valid_df['full_image_path'] == path]
-            if len(matching_rows) == 0:
-                continue
-            
-            row = matching_rows.iloc[0]
-            
-            # 生成唯一ID
-            vector_id = f"img_{row['id']}"
-            
-            # 确保ID唯一
-            if vector_id in used_ids:
-                counter = 1
-                while f"{vector_id}_{counter}" in used_ids:
-                    counter += 1
-                vector_id = f"{vector_id}_{counter}"
-            
-            embeddings.append(features[i].tolist())
-            
-            # 清晰的字段命名
-            metadatas.append({
-                'id': int(row['id']),
-                'image_path': path,
-                'original_url': row['image_url'],
-                'filename': row['filename'],
-                'original_ai_tags': str(row.get('ai_tags', '')),
-                'original_tags': str(row.get('tags', '')),
-                'combined_tags': str(row['processed_tags']),
-                'display_tags': str(row['processed_tags']),
-                'created_at': datetime.now().isoformat(),
-                'clip_model': self.clip_encoder.model_name
-            })
-            
-            # documents字段用于搜索
-            documents.append(f"图片: {row['filename']}, 标签: {row['processed_tags']}")
-            ids.append(vector_id)
-            
-            used_ids.add(vector_id)
-            used_paths.add(path)
-        
-        # 插入数据库
+        return indexed_count
+    
+    def _load_error_report(self, error_report_file: str, error_count: Optional[int] = None) -> List[Dict]:
+        """
+        加载已有的错误报告（续建时沿用）
+        报告每行一条JSON；追加后、检查点保存前中断时文件中会多出检查点之后的错误，
+        按检查点记录的error_count截断并重写，续建时不会重复记录
+        """
         try:
-            self.chromadb.add_images(
-                embeddings, metadatas, documents, ids, 
-                batch_size=chromadb_batch_size
-            )
-            
-            self.is_indexed = True
-            logger.info(f"✅ 索引构建完成! 成功索引 {len(embeddings)} 张图片")
-            
+            if not error_report_file or not os.path.exists(error_report_file):
+                return []
+            with open(error_report_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if content.lstrip().startswith('['):
+                # 旧版报告为整个JSON数组，转换为逐行格式后才能继续追加
+                error_details = json.loads(content)
+                rewrite = True
+            else:
+                error_details = [json.loads(line) for line in content.splitlines() if line.strip()]
+                rewrite = False
+            if error_count is not None and len(error_details) > error_count:
+                error_details = error_details[:error_count]
+                rewrite = True
+            if rewrite:
+                self._save_error_report(error_details, error_report_file)
+            return error_details
         except Exception as e:
-            logger.error(f"数据插入失败: {e}")
-            raise
+            logger.warning(f"加载错误报告失败: {e}")
+        return []
+    
+    def _save_error_report(self, error_details: List[Dict], error_report_file: str):
+        """保存错误报告（每行一条JSON）"""
+        try:
+            with open(error_report_file, 'w', encoding='utf-8') as f:
+                for error in error_details:
+                    f.write(json.dumps(error, ensure_ascii=False) + '\n')
+            logger.info(f"错误报告已保存: {error_report_file}")
+        except Exception as e:
+            logger.warning(f"保存错误报告失败: {e}")
+    
+    def _append_error_report(self, errors: List[Dict], error_report_file: str):
+        """向错误报告追加一批错误（构建期间按批调用，不重写已有内容）"""
+        try:
+            with open(error_report_file, 'a', encoding='utf-8') as f:
+                for error in errors:
+                    f.write(json.dumps(error, ensure_ascii=False) + '\n')
+        except Exception as e:
+            logger.warning(f"追加错误报告失败: {e}")
+    
+    def incremental_sync(self, batch_size: int = 32, chromadb_batch_size: int = 4000,
+                         only_existing_files: bool = True,
+                         num_workers: Optional[int] = None,
+                         progress_callback: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """
+        增量同步索引
+        
+        对比MySQL中满足条件的ID与向量库中已有的ID：
+        只加载并编码新增记录，同时删除MySQL中已不存在的向量。
+        Args:
+            progress_callback: 进度回调（同build_index）
+        Returns:
+            同步结果统计
+        """
+        start_time = time.time()
+        logger.info("🔄 开始增量同步索引...")
+        
+        existing_id_paths = self.chromadb.get_existing_id_paths()
+        mysql_ids = self.db_processor.fetch_valid_ids()
+        
+        existing_ids = set(existing_id_paths.keys())
+        new_ids = sorted(mysql_ids - existing_ids)
+        removed_ids = sorted(existing_ids - mysql_ids)
+        
+        logger.info(f"   向量库已有: {len(existing_ids):,} 条")
+        logger.info(f"   数据库记录: {len(mysql_ids):,} 条")
+        logger.info(f"   待新增: {len(new_ids):,} 条, 待删除: {len(removed_ids):,} 条")
+        
+        # 删除已从MySQL中移除的记录
+        deleted_count = 0
+        if removed_ids:
+            if progress_callback is not None:
+                progress_callback({'phase': 'deleting', 'total': len(removed_ids)})
+            deleted_count = self.chromadb.delete_images_by_ids(removed_ids)
+        
+        # 编码并写入新增记录
+        added_count = 0
+        skipped_count = 0
+        if new_ids:
+            if progress_callback is not None:
+                progress_callback({'phase': 'loading', 'total': len(new_ids)})
+            new_df = self.db_processor.load_records_by_ids(new_ids)
+            candidate_count = len(new_df)
+            
+            if candidate_count > 0:
+                if only_existing_files:
+                    new_df = new_df[new_df['file_exists'] == True]
+                
+                # 跳过已被其他ID索引的图片文件
+                indexed_paths = set(existing_id_paths.values())
+                new_df = new_df[~new_df['full_image_path'].isin(indexed_paths)]
+                skipped_count = candidate_count - len(new_df)
+                
+                if len(new_df) > 0:
+                    added_count = self._index_dataframe(
+                        new_df, batch_size=batch_size,
+                        chromadb_batch_size=chromadb_batch_size,
+                        num_workers=num_workers,
+                        progress_callback=progress_callback
+                    )
+        
+        # 更新水位线
+        max_id = max(mysql_ids) if mysql_ids else None
+        self.db_processor._save_status(len(mysql_ids), max_id)
+        
+        collection_info = self.chromadb.get_collection_info()
+        self.is_indexed = collection_info.get('count', 0) > 0
+        
+        duration = time.time() - start_time
+        result = {
+            'added': added_count,
+            'deleted': deleted_count,
+            'skipped': skipped_count,
+            'new_ids': len(new_ids),
+            'removed_ids': len(removed_ids),
+            'indexed_count': collection_info.get('count', 0),
+            'database_count': len(mysql_ids),
+            'max_id': max_id,
+            'duration_seconds': round(duration, 2)
+        }
+        
+        logger.info(f"✅ 增量同步完成: 新增 {added_count}, 删除 {deleted_count}, "
+                    f"跳过 {skipped_count}, 耗时 {duration:.1f}s")
+        return result
+    
+    def sync_image_files(self, added_paths: List[str], removed_paths: List[str],
+                         batch_size: int = 16, lookup_chunk_size: int = 500) -> Dict:
+        """
+        按图片文件的新增/删除增量更新在线集合（目录监听使用）
+        
+        新增文件按 /scraper_data/<品牌>/<文件名> 匹配work_copy428记录，
+        小批量编码后写入（同ID已有向量先删除，即upsert）；删除的文件对应的向量从集合中移除。
+        还没有对应记录的文件（爬虫先写文件、后提交数据库记录）在结果的unmatched_paths中返回，由调用方稍后重试。
+        Args:
+            added_paths: 新增文件的完整路径
+            removed_paths: 删除文件的完整路径
+            batch_size: 编码与写入批大小（每批写入后即可被检索到）
+            lookup_chunk_size: 按路径/ID查询向量库时每批的数量
+        Returns:
+            同步结果统计
+        """
+        start_time = time.time()
+        store = self.chromadb
+        
+        def stored_ids(getter, values) -> List[int]:
+            ids = []
+            for i in range(0, len(values), lookup_chunk_size):
+                result = getter(values[i:i + lookup_chunk_size])
+                for metadata in result.get('metadatas') or []:
+                    if metadata and 'id' in metadata:
+                        ids.append(int(metadata['id']))
+            return ids
+        
+        # 删除已不存在的文件对应的向量
+        deleted_count = 0
+        if removed_paths:
+            removed_ids = stored_ids(store.get_images_by_paths, list(removed_paths))
+            if removed_ids:
+                deleted_count = store.delete_images_by_ids(removed_ids)
+        
+        # 新增文件匹配数据库记录
+        added_count = 0
+        matched_count = 0
+        unmatched_paths = []
+        if added_paths:
+            scraper_base = f'{self.db_processor.image_path_prefix}scraper_data/'
+            url_to_path = {
+                '/scraper_data/' + path[len(scraper_base):]: path
+                for path in added_paths if path.startswith(scraper_base)
+            }
+            new_df = (self.db_processor.load_records_by_image_urls(list(url_to_path))
+                      if url_to_path else pd.DataFrame())
+            
+            found_urls = set(new_df['image_url'].astype(str).str.strip()) if len(new_df) > 0 else set()
+            unmatched_paths = [path for url, path in url_to_path.items() if url not in found_urls]
+            
+            if len(new_df) > 0:
+                # 按image_url匹配新增文件；full_image_path按文件名映射解析，
+                # 不同品牌目录下的同名文件会解析到同一路径，因此直接使用监听到的路径
+                watched_paths = new_df['image_url'].astype(str).str.strip().map(url_to_path)
+                new_df = new_df[watched_paths.notna()].copy()
+                new_df['full_image_path'] = watched_paths[watched_paths.notna()]
+                new_df['file_exists'] = new_df['full_image_path'].map(os.path.exists)
+                new_df = new_df[new_df['file_exists'] == True]
+                matched_count = len(new_df)
+            
+            if matched_count > 0:
+                # 同ID已有向量（如文件被替换）先删除再写入
+                existing_ids = stored_ids(store.get_images_by_ids, [int(record_id) for record_id in new_df['id']])
+                if existing_ids:
+                    deleted_count += store.delete_images_by_ids(existing_ids)
+                
+                added_count = self._index_dataframe(
+                    new_df, batch_size=batch_size,
+                    chromadb_batch_size=batch_size,
+                    num_workers=0, store=store
+                )
+        
+        collection_info = store.get_collection_info()
+        self.is_indexed = collection_info.get('count', 0) > 0
+        
+        duration = time.time() - start_time
+        result = {
+            'added_files': len(added_paths),
+            'removed_files': len(removed_paths),
+            'matched': matched_count,
+            'unmatched_paths': unmatched_paths,
+            'added': added_count,
+            'deleted': deleted_count,
+            'indexed_count': collection_info.get('count', 0),
+            'duration_seconds': round(duration, 2)
+        }
+        
+        logger.info(f"📂 文件变化同步: 新增文件 {len(added_paths)}（匹配 {matched_count}，"
+                    f"暂无记录 {len(unmatched_paths)}，写入 {added_count}），"
+                    f"删除文件 {len(removed_paths)}，删除向量 {deleted_count}，耗时 {duration:.1f}s")
+        return result
     
     def search_by_text(self, query_text: str, top_k: int = 9, 
-                      search_mode: str = "original") -> List[Dict]:
-        """根据文本查询相似图片"""
+                      search_mode: str = "original", nprobe: Optional[int] = None) -> List[Dict]:
+        """根据文本查询相似图片（nprobe: 近似索引探测簇数量）"""
         collection_info = self.chromadb.get_collection_info()
         current_count = collection_info.get('count', 0)
         
@@ -1573,35 +3159,17 @@ class DatabaseImageRetrievalSystem:
             query_embedding = self.clip_encoder.encode_text(query_text)
             results = self.chromadb.search_similar_images(
                 query_embedding.tolist(), 
-                top_k=top_k
+                top_k=top_k,
+                nprobe=nprobe
             )
             
             if not results or not results['ids'] or len(results['ids'][0]) == 0:
                 logger.info("没有找到相似的图片")
                 return []
             
-            formatted_results = []
-            for i in range(len(results['ids'][0])):
-                metadata = results['metadatas'][0][i]
-                distance = results['distances'][0][i]
-                similarity = 1 / (1 + distance) if distance > 0 else 1.0
-                
-                result = {
-                    'id': metadata.get('id', ''),
-                    'image_path': metadata.get('image_path', ''),
-                    'original_url': metadata.get('original_url', ''),
-                    'filename': metadata.get('filename', ''),
-                    'original_ai_tags': metadata.get('original_ai_tags', ''),
-                    'original_tags': metadata.get('original_tags', ''),
-                    'combined_tags': metadata.get('combined_tags', ''),
-                    'display_tags': metadata.get('display_tags', ''),
-                    'similarity': float(similarity),
-                    'distance': float(distance),
-                    'clip_model': metadata.get('clip_model', ''),
-                    'created_at': metadata.get('created_at', ''),
-                    'search_type': search_mode
-                }
-                formatted_results.append(result)
+            formatted_results = self._format_query_results(results, 0)
+            for result in formatted_results:
+                result['search_type'] = search_mode
             
             logger.info(f"找到 {len(formatted_results)} 个相似结果")
             return formatted_results
@@ -1610,8 +3178,9 @@ class DatabaseImageRetrievalSystem:
             logger.error(f"文本搜索失败: {e}")
             return []
     
-    def search_by_image(self, image_path: str, top_k: int = 9) -> List[Dict]:
-        """根据图片查询相似图片"""
+    def search_by_image(self, image_path: str, top_k: int = 9,
+                        nprobe: Optional[int] = None) -> List[Dict]:
+        """根据图片查询相似图片（nprobe: 近似索引探测簇数量）"""
         collection_info = self.chromadb.get_collection_info()
         current_count = collection_info.get('count', 0)
         
@@ -1626,44 +3195,132 @@ class DatabaseImageRetrievalSystem:
             
             query_embedding = self.clip_encoder.encode_image(image_path)
             
-            results = self.chromadb.search_similar_images(
-                query_embedding.tolist(), 
-                top_k=top_k
-            )
+            return self._search_by_embedding(query_embedding, top_k, nprobe)
             
-            if not results or not results['ids'] or len(results['ids'][0]) == 0:
-                logger.info("没有找到相似的图片")
-                return []
+        except Exception as e:
+            logger.error(f"图片搜索失败: {e}")
+            return []
+    
+    def search_by_vector_id(self, image_id: int, top_k: int = 9,
+                            nprobe: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        用向量库中已存储的向量查询相似图片（不重新读取图片、不运行CLIP）
+        Returns:
+            结果列表；该ID未被索引时返回None，调用方可回退到search_by_image
+        """
+        try:
+            stored = self.chromadb.get_images_by_ids([int(image_id)], include=['embeddings'])
+            return self._search_by_stored_embedding(stored, top_k, nprobe)
+        except Exception as e:
+            logger.error(f"按向量ID搜索失败 {image_id}: {e}")
+            return None
+    
+    def search_by_indexed_path(self, image_path: str, top_k: int = 9,
+                               nprobe: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        图片路径已被索引时用已存储的向量查询
+        Returns:
+            结果列表；该路径未被索引时返回None
+        """
+        try:
+            stored = self.chromadb.get_images_by_paths([image_path], include=['embeddings'])
+            return self._search_by_stored_embedding(stored, top_k, nprobe)
+        except Exception as e:
+            logger.error(f"按已索引路径搜索失败 {image_path}: {e}")
+            return None
+    
+    def _search_by_stored_embedding(self, stored: Dict, top_k: int,
+                                    nprobe: Optional[int]) -> Optional[List[Dict]]:
+        """取get结果中的第一条向量进行查询"""
+        embeddings = stored.get('embeddings') if stored else None
+        if embeddings is None or len(embeddings) == 0:
+            return None
+        
+        return self._search_by_embedding(np.asarray(embeddings[0], dtype=np.float32), top_k, nprobe)
+    
+    def _search_by_embedding(self, query_embedding: np.ndarray, top_k: int,
+                             nprobe: Optional[int] = None) -> List[Dict]:
+        """用查询向量检索并格式化结果"""
+        results = self.chromadb.search_similar_images(
+            query_embedding.tolist(), 
+            top_k=top_k,
+            nprobe=nprobe
+        )
+        
+        if not results or not results['ids'] or len(results['ids'][0]) == 0:
+            logger.info("没有找到相似的图片")
+            return []
+        
+        formatted_results = self._format_query_results(results, 0)
+        logger.info(f"找到 {len(formatted_results)} 个相似结果")
+        return formatted_results
+    
+    def _format_query_results(self, results: Dict, query_index: int) -> List[Dict]:
+        """将向量库query结果中第query_index个查询的命中转换为结果字典"""
+        formatted_results = []
+        for i in range(len(results['ids'][query_index])):
+            metadata = results['metadatas'][query_index][i]
+            distance = results['distances'][query_index][i]
+            
+            similarity = 1 / (1 + distance) if distance > 0 else 1.0
+            
+            result = {
+                'id': metadata.get('id', ''),
+                'image_path': metadata.get('image_path', ''),
+                'original_url': metadata.get('original_url', ''),
+                'filename': metadata.get('filename', ''),
+                'original_ai_tags': metadata.get('original_ai_tags', ''),
+                'original_tags': metadata.get('original_tags', ''),
+                'combined_tags': metadata.get('combined_tags', ''),
+                'display_tags': metadata.get('display_tags', ''),
+                'similarity': float(similarity),
+                'distance': float(distance),
+                'clip_model': metadata.get('clip_model', ''),
+                'created_at': metadata.get('created_at', '')
+            }
+            formatted_results.append(result)
+        
+        return formatted_results
+    
+    def search_by_texts(self, query_texts: List[str], top_k: int = 9,
+                        nprobe: Optional[int] = None) -> List[List[Dict]]:
+        """
+        批量文本查询：一次批量编码 + 一次批量检索
+        Returns:
+            与query_texts一一对应的结果列表（编码失败的查询为空列表）
+        """
+        if not query_texts:
+            return []
+        
+        collection_info = self.chromadb.get_collection_info()
+        if collection_info.get('count', 0) == 0:
+            logger.warning("ChromaDB中没有数据，请先构建索引")
+            return [[] for _ in query_texts]
+        
+        try:
+            query_embeddings = self.clip_encoder.encode_texts(query_texts)
+            encoded_positions = [i for i, vector in enumerate(query_embeddings) if vector is not None]
+            all_results = [[] for _ in query_texts]
+            if not encoded_positions:
+                return all_results
+            
+            results = self.chromadb.search_similar_images_batch(
+                [query_embeddings[i] for i in encoded_positions],
+                top_k=top_k,
+                nprobe=nprobe
+            )
+            if not results or not results.get('ids'):
+                return all_results
             
-            formatted_results = []
-            for i in range(len(results['ids'][0])):
-                metadata = results['metadatas'][0][i]
-                distance = results['distances'][0][i]
-                
-                similarity = 1 / (1 + distance) if distance > 0 else 1.0
-                
-                result = {
-                    'id': metadata.get('id', ''),
-                    'image_path': metadata.get('image_path', ''),
-                    'original_url': metadata.get('original_url', ''),
-                    'filename': metadata.get('filename', ''),
-                    'original_ai_tags': metadata.get('original_ai_tags', ''),
-                    'original_tags': metadata.get('original_tags', ''),
-                    'combined_tags': metadata.get('combined_tags', ''),
-                    'display_tags': metadata.get('display_tags', ''),
-                    'similarity': float(similarity),
-                    'distance': float(distance),
-                    'clip_model': metadata.get('clip_model', ''),
-                    'created_at': metadata.get('created_at', '')
-                }
-                formatted_results.append(result)
+            for query_index, position in enumerate(encoded_positions):
+                all_results[position] = self._format_query_results(results, query_index)
             
-            logger.info(f"找到 {len(formatted_results)} 个相似结果")
-            return formatted_results
+            logger.info(f"批量搜索完成: {len(query_texts)} 个查询")
+            return all_results
             
         except Exception as e:
-            logger.error(f"图片搜索失败: {e}")
-            return []
+            logger.error(f"批量文本搜索失败: {e}")
+            return [[] for _ in query_texts]
     
     def get_system_info(self) -> Dict:
         """获取系统信息"""
@@ -1680,6 +3337,22 @@ class DatabaseImageRetrievalSystem:
                 'collection': collection_info
             }
             
+            if self.clip_encoder.embedding_cache is not None:
+                system_info['embedding_cache'] = self.clip_encoder.embedding_cache.get_stats()
+            
+            if self.clip_encoder.text_cache is not None:
+                system_info['text_cache'] = self.clip_encoder.text_cache.get_stats()
+            
+            if self.clip_encoder.text_batcher is not None:
+                system_info['micro_batching'] = {
+                    'text': self.clip_encoder.text_batcher.get_stats(),
+                    'image': self.clip_encoder.image_batcher.get_stats()
+                }
+            
+            # 编码器的缩略图计数分散在预处理子进程中，这里只报告磁盘上的数量
+            if self.clip_encoder.thumbnail_store is not None:
+                system_info['thumbnails'] = self.clip_encoder.thumbnail_store.get_disk_stats()
+            
             if hasattr(self.db_processor, 'dataset_df') and self.db_processor.dataset_df is not None:
                 dataset_info = self.db_processor.get_dataset_info()
                 system_info['dataset'] = dataset_info
@@ -1710,15 +3383,42 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
                  chromadb_port: int = 6600,
                  collection_name: str = "local_db_image_collection",
                  openrouter_api_key: str = None,
-                 openrouter_model: str = "anthropic/claude-3-haiku"):
+                 openrouter_model: str = "anthropic/claude-3-haiku",
+                 preprocess_workers: int = 0,
+                 embedding_cache_dir: Optional[str] = None,
+                 vector_backend: str = "chromadb",
+                 numpy_index_dir: str = "./numpy_index",
+                 vector_ann: Optional[str] = None,
+                 vector_codec: Optional[str] = None,
+                 thumbnail_dir: Optional[str] = None,
+                 micro_batch_size: int = 0,
+                 micro_batch_wait_ms: float = 5.0):
         """
         初始化增强检索系统
         Args:
             openrouter_api_key: OpenRouter API密钥
             openrouter_model: 使用的模型
+            preprocess_workers: 构建索引时图片解码/预处理的进程数
+            embedding_cache_dir: 图片特征磁盘缓存目录
+            vector_backend: 向量库后端 chromadb / numpy
+            numpy_index_dir: numpy后端的存储目录
+            vector_ann: numpy后端的近似索引类型
+            vector_codec: numpy后端的向量压缩编码
+            thumbnail_dir: 构建索引时顺带生成缩略图的目录
+            micro_batch_size: 在线查询编码请求合并的最大批大小
+            micro_batch_wait_ms: 请求合并的最长等待时间（毫秒）
         """
         # 调用父类初始化
-        super().__init__(clip_model, chromadb_host, chromadb_port, collection_name)
+        super().__init__(clip_model, chromadb_host, chromadb_port, collection_name,
+                         preprocess_workers=preprocess_workers,
+                         embedding_cache_dir=embedding_cache_dir,
+                         vector_backend=vector_backend,
+                         numpy_index_dir=numpy_index_dir,
+                         vector_ann=vector_ann,
+                         vector_codec=vector_codec,
+                         thumbnail_dir=thumbnail_dir,
+                         micro_batch_size=micro_batch_size,
+                         micro_batch_wait_ms=micro_batch_wait_ms)
         
         # 初始化OpenRouter处理器
         self.openrouter = None
@@ -1983,10 +3683,22 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
             
     def smart_index_management(self, force_rebuild: bool = False, 
                               limit: int = 183247, batch_size: int = 32,
-                              chromadb_batch_size: int = 4000) -> bool:
-        """智能索引管理"""
+                              chromadb_batch_size: int = 4000,
+                              incremental: bool = True,
+                              interactive: bool = True,
+                              progress_callback: Optional[Callable[[Dict], None]] = None) -> bool:
+        """
+        智能索引管理
+        Args:
+            force_rebuild: 强制全量重建
+            incremental: 已有索引且数据库有变化时，优先执行增量同步
+            interactive: 需要重建时是否在终端询问确认；False时直接重建（后台任务使用）
+            progress_callback: 进度回调（同build_index），抛出IndexBuildCancelled可取消
+        """
         try:
             print("\n🔍 检查索引状态...")
+            if progress_callback is not None:
+                progress_callback({'phase': 'checking'})
             
             status = self.check_index_status()
             
@@ -2009,6 +3721,21 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
             elif not status['need_rebuild']:
                 print("✅ 索引状态良好，无需重建")
                 return True
+            elif incremental and status['indexed_count'] > 0:
+                print(f"\n🔄 检测到数据变化，执行增量同步:")
+                for reason in status['rebuild_reason']:
+                    print(f"   • {reason}")
+                
+                sync_result = self.incremental_sync(
+                    batch_size=batch_size,
+                    chromadb_batch_size=chromadb_batch_size,
+                    progress_callback=progress_callback
+                )
+                print(f"\n✅ 增量同步完成:")
+                print(f"   新增: {sync_result['added']:,} 条, 删除: {sync_result['deleted']:,} 条")
+                print(f"   当前索引量: {sync_result['indexed_count']:,} 条")
+                print(f"   耗时: {sync_result['duration_seconds']}s")
+                return True
             else:
                 print(f"\n⚠️ 检测到需要重建索引:")
                 for reason in status['rebuild_reason']:
@@ -2022,9 +3749,12 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
                 elif update_info['change_type'] == 'initial':
                     print(f"   初始化，需要索引 {update_info['current_count']:,} 条记录")
                 
-                # 询问用户
-                response = input("\n🤔 是否重建索引? (y/n): ").lower().strip()
-                should_rebuild = response in ['y', 'yes', '是']
+                # 询问用户（非交互调用视为已确认）
+                if interactive:
+                    response = input("\n🤔 是否重建索引? (y/n): ").lower().strip()
+                    should_rebuild = response in ['y', 'yes', '是']
+                else:
+                    should_rebuild = True
                 
                 if not should_rebuild:
                     print("⏭️ 跳过索引重建，使用现有索引")
@@ -2034,14 +3764,10 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
             if should_rebuild:
                 print(f"\n🚀 开始重建索引 (限制: {limit:,} 条记录)...")
                 
-                # 重置集合
-                if status['indexed_count'] > 0:
-                    print("🗑️ 清理现有索引...")
-                    self.chromadb.reset_collection()
-                
-                # 加载数据（会自动保存状态）
-                print("📊 加载数据库数据...")
-                self.db_processor.load_data(limit=limit, save_status=True)
+                # 记录数据库状态；数据在构建时按块流式读取，不再整体加载
+                print("📊 记录数据库状态...")
+                self.db_processor.save_current_status(limit=limit)
+                self.db_processor.dataset_df = None
                 
                 # 构建索引
                 print("🔨 构建新索引...")
@@ -2049,7 +3775,8 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
                     batch_size=batch_size, 
                     force_rebuild=True, 
                     limit=limit,
-                    chromadb_batch_size=chromadb_batch_size
+                    chromadb_batch_size=chromadb_batch_size,
+                    progress_callback=progress_callback
                 )
                 
                 # 验证结果
@@ -2062,6 +3789,9 @@ class EnhancedDatabaseImageRetrievalSystem(DatabaseImageRetrievalSystem):
             
             return False
             
+        except IndexBuildCancelled:
+            logger.warning("⏹️ 索引管理已取消")
+            raise
         except Exception as e:
             logger.error(f"智能索引管理失败: {e}")
             print(f"❌ 索引管理失败: {e}")
@@ -2288,7 +4018,9 @@ def main():
             clip_model=clip_model,
             chromadb_port=6600,
             openrouter_api_key=openrouter_api_key,
-            openrouter_model=openrouter_model
+            openrouter_model=openrouter_model,
+            embedding_cache_dir="./embedding_cache",
+            thumbnail_dir="./thumbnails"
         )
         
         # 智能索引管理
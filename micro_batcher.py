@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求合并调度器
+并发请求线程各自提交单条输入，后台线程把在短时间窗口内到达的输入
+合并成一次批量计算，再把结果分发回各请求线程。
+"""
+
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """动态微批调度器"""
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 16,
+                 max_wait_ms: float = 5.0, name: str = "micro-batcher", metrics_window: int = 2048):
+        """
+        Args:
+            batch_fn: 批量计算函数，输入列表，返回等长的结果列表
+            max_batch_size: 单批最大条数
+            max_wait_ms: 收到第一条后等待更多输入的最长时间（毫秒）
+            name: 后台线程名
+            metrics_window: 延迟统计保留的最近请求数
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._metrics_lock = threading.Lock()
+        self._latencies_ms = deque(maxlen=metrics_window)
+        self._batch_sizes = deque(maxlen=metrics_window)
+        self.total_requests = 0
+        self.total_batches = 0
+
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any, timeout: float = None) -> Any:
+        """提交一条输入并等待其结果（批量计算异常会在调用线程重新抛出）"""
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future.result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._process(batch)
+
+    def _process(self, batch: List):
+        items = [item for item, _, _ in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(f"批量函数返回 {len(results)} 条结果，期望 {len(items)} 条")
+        except Exception as e:
+            logger.error(f"{self.name} 批量计算失败: {e}")
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        finished = time.perf_counter()
+        for (_, future, submitted), result in zip(batch, results):
+            future.set_result(result)
+
+        with self._metrics_lock:
+            self.total_requests += len(batch)
+            self.total_batches += 1
+            self._batch_sizes.append(len(batch))
+            self._latencies_ms.extend((finished - submitted) * 1000 for _, _, submitted in batch)
+
+    def get_stats(self) -> Dict:
+        """延迟分位数（提交到结果就绪，含排队时间）与批大小统计"""
+        with self._metrics_lock:
+            latencies = np.asarray(self._latencies_ms, dtype=np.float64)
+            batch_sizes = np.asarray(self._batch_sizes, dtype=np.float64)
+            total_requests = self.total_requests
+            total_batches = self.total_batches
+
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000,
+            'total_requests': total_requests,
+            'total_batches': total_batches,
+            'avg_batch_size': float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'queue_depth': self._queue.qsize()
+        }
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MySQL连接池与流式读取
+同一进程内相同配置共用一个连接池（MySQLDataProcessor、DataConsistencyChecker），
+每次使用时借出独立连接，后台检查线程与请求线程不再共享同一个连接。
+大表按主键分页（WHERE id > last_id ORDER BY id LIMIT n）并用SSCursor逐批取行，
+客户端一次只持有一页数据。
+"""
+
+import time
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pymysql
+import pymysql.cursors
+
+logger = logging.getLogger(__name__)
+
+class MySQLConnectionPool:
+    """线程安全的pymysql连接池"""
+
+    def __init__(self, db_config: Dict, max_size: int = 8, timeout: float = 30.0,
+                 ping_after_seconds: float = 30.0):
+        """
+        Args:
+            db_config: pymysql.connect参数
+            max_size: 最多同时存在的连接数
+            timeout: 连接耗尽时等待归还的最长时间（秒）
+            ping_after_seconds: 连接空闲超过该时间后借出前先ping（断线自动重连）
+        """
+        self.db_config = dict(db_config)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.ping_after_seconds = ping_after_seconds
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.total_checkouts = 0
+
+    def _acquire(self) -> pymysql.Connection:
+        try:
+            connection, idle_since = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.max_size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    return pymysql.connect(**self.db_config)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                connection, idle_since = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError(f"等待MySQL连接超时（{self.timeout}s，上限 {self.max_size} 个连接）")
+
+        if time.monotonic() - idle_since > self.ping_after_seconds:
+            try:
+                connection.ping(reconnect=True)
+            except Exception:
+                self._discard(connection)
+                raise
+        return connection
+
+    def _release(self, connection: pymysql.Connection):
+        if connection.open:
+            self._idle.put((connection, time.monotonic()))
+        else:
+            self._discard(connection)
+
+    def _discard(self, connection: pymysql.Connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self) -> Iterator[pymysql.Connection]:
+        """
+        借出一个连接，退出时归还
+        使用中抛出数据库异常时连接直接丢弃，避免把状态异常的连接还回池中
+        """
+        connection = self._acquire()
+        with self._lock:
+            self.total_checkouts += 1
+        try:
+            yield connection
+        except pymysql.MySQLError:
+            self._discard(connection)
+            raise
+        except BaseException:
+            self._release(connection)
+            raise
+        else:
+            self._release(connection)
+
+    def close(self):
+        """关闭所有空闲连接（借出中的连接归还后仍可继续使用）"""
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(connection)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'created': self._created,
+                'idle': self._idle.qsize(),
+                'total_checkouts': self.total_checkouts
+            }
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_config: Dict, max_size: int = 8) -> MySQLConnectionPool:
+    """获取（或创建）与配置对应的进程内共享连接池"""
+    key = (db_config.get('host'), db_config.get('port'), db_config.get('user'), db_config.get('database'))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = MySQLConnectionPool(db_config, max_size=max_size)
+            _pools[key] = pool
+        return pool
+
+def iter_keyset_pages(pool: MySQLConnectionPool, fields: List[str], table: str, where_clause: str,
+                      page_size: int = 20000, after_id: Optional[int] = None,
+                      limit: Optional[int] = None, fetch_size: int = 2000,
+                      max_id: Optional[int] = None) -> Iterator[List[Tuple]]:
+    """
+    按主键分页流式读取
+    每页单独借出连接并用SSCursor逐批取行，取完即归还连接，
+    调用方处理这一页（如编码图片）期间不占用连接、也不保持服务端结果集。
+    Args:
+        fields: 查询字段（必须包含id）
+        where_clause: 过滤条件（不含 id > last_id）
+        page_size: 每页行数
+        after_id: 从该ID之后开始（续读）
+        limit: 最多读取的总行数
+        fetch_size: 每次从服务端取回的行数
+        max_id: 只读取到该ID为止（含）
+    Yields:
+        每页的行元组列表（按id升序）
+    """
+    id_pos = fields.index('id')
+    fields_str = ', '.join(fields)
+    read = 0
+
+    while limit is None or read < limit:
+        page_limit = page_size if limit is None else min(page_size, limit - read)
+        conditions = [f"({where_clause})"] if where_clause else []
+        params = []
+        if after_id is not None:
+            conditions.append("id > %s")
+            params.append(after_id)
+        if max_id is not None:
+            conditions.append("id <= %s")
+            params.append(max_id)
+        sql = f"SELECT {fields_str} FROM {table}"
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += " ORDER BY id LIMIT %s"
+        params.append(page_limit)
+
+        rows = []
+        with pool.connection() as connection:
+            with connection.cursor(pymysql.cursors.SSCursor) as cursor:
+                cursor.execute(sql, params)
+                while True:
+                    batch = cursor.fetchmany(fetch_size)
+                    if not batch:
+                        break
+                    rows.extend(batch)
+
+        if not rows:
+            return
+
+        read += len(rows)
+        after_id = rows[-1][id_pos]
+        yield rows
+
+        if len(rows) < page_limit:
+            return
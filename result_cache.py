@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存
+相同查询（同一接口、归一化后的查询文本、参数）在有效期内直接返回已格式化的结果，
+向量库版本变化（重建、增量同步等写入）后整体失效。
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class SearchResultCache:
+    """带过期时间的LRU查询结果缓存"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        """
+        Args:
+            max_entries: 最多缓存的结果条数，0表示禁用
+            ttl_seconds: 单条结果的有效期（秒），用于兜底其他进程对向量库的写入
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._stats = {}
+        self.invalidations = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return ' '.join(str(text).split()).lower()
+
+    def _check_version(self, version: Hashable):
+        # 调用方已持有锁
+        if version != self._version:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._version = version
+
+    def _count(self, endpoint: str, outcome: str):
+        # 调用方已持有锁
+        stats = self._stats.setdefault(endpoint, {'hits': 0, 'misses': 0, 'expired': 0})
+        stats[outcome] += 1
+
+    def get(self, endpoint: str, key: Hashable, version: Hashable) -> Optional[Any]:
+        """
+        查询缓存
+        Args:
+            endpoint: 接口名，统计按接口分开
+            key: 归一化后的查询参数
+            version: 当前向量库版本
+        Returns:
+            缓存的结果，未命中返回None
+        """
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get((endpoint, key))
+            if entry is None:
+                self._count(endpoint, 'misses')
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[(endpoint, key)]
+                self._count(endpoint, 'expired')
+                self._count(endpoint, 'misses')
+                return None
+
+            self._entries.move_to_end((endpoint, key))
+            self._count(endpoint, 'hits')
+            return value
+
+    def put(self, endpoint: str, key: Hashable, version: Hashable, value: Any):
+        """写入缓存（版本已变化时丢弃旧结果）"""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._check_version(version)
+            self._entries[(endpoint, key)] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end((endpoint, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in self._stats.items():
+                lookups = stats['hits'] + stats['misses']
+                endpoints[endpoint] = dict(stats, hit_rate=stats['hits'] / lookups if lookups else 0.0)
+
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'invalidations': self.invalidations,
+                'endpoints': endpoints
+            }
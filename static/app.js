@@ -1542,8 +1542,8 @@ class ImageSearchApp {
         card.style.opacity = '0';
         card.style.transform = 'translateY(30px)';
 
-        const imageHtml = result.image_base64 ? 
-            `<img src="${result.image_base64}" alt="${result.filename}" class="w-full h-48 object-cover cursor-pointer group-hover:scale-105 transition-transform duration-300" onclick="app.showImageDetail(${index})">` :
+        const imageHtml = result.thumbnail_url ? 
+            `<img src="${result.thumbnail_url}" alt="${result.filename}" loading="lazy" class="w-full h-48 object-cover cursor-pointer group-hover:scale-105 transition-transform duration-300" onclick="app.showImageDetail(${index})">` :
             `<div class="w-full h-48 bg-gradient-to-br from-gray-200 to-gray-300 flex items-center justify-center cursor-pointer group-hover:scale-105 transition-transform duration-300" onclick="app.showImageDetail(${index})">
                 <div class="text-center">
                     <i class="fas fa-image text-4xl text-gray-400"></i>
@@ -1714,7 +1714,7 @@ class ImageSearchApp {
         const similarSearchBtn = document.getElementById('similarSearchBtn');
         
         if (modalImage) {
-            modalImage.src = result.image_base64 || '';
+            modalImage.src = result.thumbnail_url || '';
             modalImage.style.cursor = 'zoom-in';
             modalImage.title = '点击放大查看';
             
@@ -1725,8 +1725,8 @@ class ImageSearchApp {
             // 添加新的点击事件监听器
             newModalImage.addEventListener('click', () => {
                 console.log('模态框图片被点击');
-                if (this.fullscreenViewer && result.image_base64) {
-                    this.fullscreenViewer.show(result.image_base64, result);
+                if (this.fullscreenViewer && result.thumbnail_url) {
+                    this.fullscreenViewer.show(result.thumbnail_url, result);
                 } else {
                     console.error('全屏查看器未初始化或图片数据缺失');
                 }
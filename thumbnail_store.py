@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缩略图存储
+缩略图只生成一次（构建索引时或首次请求时），按文件签名寻址保存在分片目录中，
+查询路径直接读取小文件，不再打开原图。
+"""
+
+import os
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Optional, Tuple, Dict
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+def to_rgb_image(img: Image.Image) -> Image.Image:
+    """将各种模式的图片转换为RGB（透明部分合成到白色背景）"""
+    mode = img.mode
+
+    if mode in ('RGBA', 'LA') or (mode == 'P' and 'transparency' in img.info):
+        img_rgba = img.convert('RGBA')
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        background.paste(img_rgba, mask=img_rgba.split()[-1])
+        return background
+
+    if mode == 'RGB':
+        return img.copy()
+
+    if mode not in ('P', 'L', '1', 'CMYK'):
+        logger.warning(f"未知图片模式 {mode}，强制转换为RGB")
+    return img.convert('RGB')
+
+class ThumbnailStore:
+    """磁盘缩略图存储"""
+
+    def __init__(self, thumb_dir: str = "./thumbnails", max_size: Tuple[int, int] = (300, 300),
+                 quality: int = 85):
+        """
+        Args:
+            thumb_dir: 缩略图根目录（按键的前4位分两级子目录）
+            max_size: 缩略图最大尺寸
+            quality: JPEG质量
+        """
+        self.thumb_dir = Path(thumb_dir)
+        self.max_size = tuple(max_size)
+        self.quality = quality
+        self.thumb_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.generated = 0
+        self.served = 0
+
+    def key_for(self, image_path: str) -> Optional[str]:
+        """
+        根据原图签名（路径、大小、修改时间）和缩略图参数生成键
+        原图被替换后键随之变化，旧缩略图自然失效
+        Returns:
+            键，原图不存在时返回None
+        """
+        try:
+            stat = os.stat(image_path)
+        except OSError:
+            return None
+
+        signature = (f"{os.path.abspath(image_path)}|{stat.st_size}|{stat.st_mtime_ns}|"
+                     f"{self.max_size[0]}x{self.max_size[1]}|q{self.quality}")
+        return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+    def path_for_key(self, key: str) -> Path:
+        return self.thumb_dir / key[:2] / key[2:4] / f"{key}.jpg"
+
+    def render(self, img: Image.Image) -> bytes:
+        """将已解码的图片生成JPEG缩略图字节"""
+        thumb = to_rgb_image(img)
+        thumb.thumbnail(self.max_size, Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        thumb.save(buffer, format='JPEG', quality=self.quality, optimize=True)
+        return buffer.getvalue()
+
+    def save_image(self, image_path: str, img: Image.Image, key: Optional[str] = None) -> Optional[str]:
+        """
+        用已解码的图片写入缩略图（已存在则跳过）
+        Returns:
+            缩略图键，失败返回None
+        """
+        key = key or self.key_for(image_path)
+        if key is None:
+            return None
+
+        thumb_path = self.path_for_key(key)
+        if thumb_path.exists():
+            return key
+
+        try:
+            self._write(thumb_path, self.render(img))
+            return key
+        except Exception as e:
+            logger.warning(f"缩略图生成失败 {image_path}: {e}")
+            return None
+
+    def get(self, image_path: str) -> Optional[Tuple[Path, str]]:
+        """
+        获取缩略图，不存在时从原图生成
+        Returns:
+            (缩略图路径, 键)，原图不存在或无法解码时返回None
+        """
+        key = self.key_for(image_path)
+        if key is None:
+            return None
+
+        thumb_path = self.path_for_key(key)
+        if not thumb_path.exists():
+            try:
+                with Image.open(image_path) as img:
+                    self._write(thumb_path, self.render(img))
+            except Exception as e:
+                logger.error(f"图片处理失败 {image_path}: {e}")
+                return None
+
+        with self._lock:
+            self.served += 1
+        return thumb_path, key
+
+    def _write(self, thumb_path: Path, data: bytes):
+        """原子写入缩略图文件"""
+        thumb_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = thumb_path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, thumb_path)
+        with self._lock:
+            self.generated += 1
+
+    def __getstate__(self):
+        # 构建索引时随进程池传给子进程，锁不可序列化
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_disk_stats(self) -> Dict:
+        """
+        统计分片目录中的缩略图文件数与总字节数
+        与进程无关：构建索引的子进程各持有一份计数器副本，只有磁盘上的数量可以汇总
+        """
+        files = 0
+        total_bytes = 0
+        for level1 in os.scandir(self.thumb_dir):
+            if not level1.is_dir():
+                continue
+            for level2 in os.scandir(level1.path):
+                if not level2.is_dir():
+                    continue
+                for entry in os.scandir(level2.path):
+                    if entry.name.endswith('.jpg'):
+                        files += 1
+                        total_bytes += entry.stat().st_size
+        return {
+            'thumb_dir': str(self.thumb_dir),
+            'files': files,
+            'total_bytes': total_bytes
+        }
+
+    def get_stats(self) -> Dict:
+        """本进程内的生成/命中计数（子进程中的计数不会汇总到这里）"""
+        return {
+            'thumb_dir': str(self.thumb_dir),
+            'max_size': list(self.max_size),
+            'generated': self.generated,
+            'served': self.served
+        }
@@ -0,0 +1,1079 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+进程内向量存储
+提供与ChromaDBManager相同接口的NumPy暴力检索后端：
+向量保存在内存映射的.npy矩阵中，元数据保存在SQLite中，
+查询时一次矩阵-向量乘法 + argpartition，不经过HTTP。
+可选IVF近似索引，按请求的nprobe在召回率与延迟之间取舍；
+可选PQ/int8压缩编码，查询在压缩码上粗排后从原始向量精确重排。
+"""
+
+import os
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import List, Dict, Optional, Union, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class IVFIndex:
+    """
+    倒排文件(IVF)近似检索索引
+    k-means粗量化器将向量划分到nlist个簇，查询时只扫描距离最近的nprobe个簇。
+    簇分配以行号对齐保存，新写入的向量直接分配到已有簇（增量构建）。
+    """
+
+    def __init__(self, index_dir: Path, nlist: Optional[int] = None, default_nprobe: int = 8):
+        """
+        Args:
+            index_dir: 索引文件目录
+            nlist: 簇数量，None表示训练时按 4*sqrt(N) 自动确定
+            default_nprobe: 默认探测的簇数量
+        """
+        self.index_dir = Path(index_dir)
+        self.nlist = nlist
+        self.default_nprobe = default_nprobe
+        self.centroids_path = self.index_dir / "ivf_centroids.npy"
+        self.assign_path = self.index_dir / "ivf_assign.npy"
+
+        self.centroids = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self._lists = None  # (按簇排序的行号, 每个簇的起止位置)，写入后惰性重建
+
+        if self.centroids_path.exists() and self.assign_path.exists():
+            self.centroids = np.load(self.centroids_path)
+            self.assign = np.load(self.assign_path)
+            self.nlist = len(self.centroids)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, iterations: int = 20,
+              max_points_per_centroid: int = 256, seed: int = 0):
+        """
+        在向量样本上训练k-means粗量化器
+        Args:
+            vectors: 训练向量 (N, D)
+            iterations: Lloyd迭代次数
+            max_points_per_centroid: 每个簇最多使用的训练样本数
+        """
+        n = len(vectors)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+        nlist = min(nlist, n)
+        rng = np.random.default_rng(seed)
+
+        sample_size = min(n, nlist * max_points_per_centroid)
+        sample = vectors[np.sort(rng.choice(n, sample_size, replace=False))] if sample_size < n else vectors
+        sample = np.asarray(sample, dtype=np.float32)
+
+        self.centroids = _kmeans(sample, nlist, iterations, rng)
+        self.nlist = nlist
+        self.assign = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """将向量分配到最近的簇"""
+        if not self.is_trained or len(rows) == 0:
+            return
+
+        required = int(rows.max()) + 1
+        if required > len(self.assign):
+            grown = np.full(required, -1, dtype=np.int32)
+            grown[:len(self.assign)] = self.assign
+            self.assign = grown
+
+        self.assign[rows] = _nearest_centroids(np.asarray(vectors, dtype=np.float32), self.centroids)
+        self._lists = None
+
+    def candidate_rows(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """返回最近nprobe个簇中的全部行号（升序）"""
+        nprobe = max(1, min(nprobe or self.default_nprobe, self.nlist))
+
+        if self._lists is None:
+            order = np.argsort(self.assign, kind='stable')
+            bounds = np.searchsorted(self.assign[order], np.arange(-1, self.nlist + 1))
+            self._lists = (order, bounds)
+        order, bounds = self._lists
+
+        centroid_distances = (self.centroids ** 2).sum(axis=1) - 2.0 * (self.centroids @ query)
+        probes = np.argpartition(centroid_distances, nprobe - 1)[:nprobe]
+        # bounds[c + 1]:bounds[c + 2] 为簇c的范围（-1表示未分配）
+        # 各簇行号拼接后无序，排序后读取向量/编码时按行号顺序访问
+        return np.sort(np.concatenate([order[bounds[c + 1]:bounds[c + 2]] for c in probes]))
+
+    def save(self):
+        """持久化簇中心与分配结果"""
+        if not self.is_trained:
+            return
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        for path, array in ((self.centroids_path, self.centroids), (self.assign_path, self.assign)):
+            tmp_path = path.with_suffix('.tmp.npy')
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+
+    def reset(self):
+        """删除索引"""
+        for path in (self.centroids_path, self.assign_path):
+            if path.exists():
+                path.unlink()
+        self.centroids = None
+        self.assign = np.zeros(0, dtype=np.int32)
+        self._lists = None
+
+    def get_info(self) -> Dict:
+        return {
+            "type": "ivf",
+            "trained": self.is_trained,
+            "nlist": self.nlist,
+            "default_nprobe": self.default_nprobe
+        }
+
+class VectorCodec(ABC):
+    """
+    压缩向量编码基类
+    编码按行号与向量文件对齐保存在codes文件中，查询时用非对称距离(ADC)
+    在压缩码上粗排，再从原始向量文件精确重排少量候选。
+    """
+
+    name = ""
+
+    def __init__(self, index_dir: Path, initial_capacity: int = 4096):
+        self.index_dir = Path(index_dir)
+        self.initial_capacity = initial_capacity
+        self.params_path = self.index_dir / f"{self.name}_params.npz"
+        self.codes_path = self.index_dir / f"{self.name}_codes.npy"
+        self.codes = None
+        self.coded_rows = 0  # 已编码的行数上界
+
+        if self.params_path.exists() and self.codes_path.exists():
+            with np.load(self.params_path) as params:
+                self._load_params(params)
+                self.coded_rows = int(params['coded_rows'])
+            self.codes = np.load(self.codes_path, mmap_mode='r+')
+
+    @property
+    @abstractmethod
+    def is_trained(self) -> bool:
+        """是否已训练（已加载编码参数）"""
+
+    @property
+    @abstractmethod
+    def code_size(self) -> int:
+        """每个向量的编码字节数"""
+
+    @abstractmethod
+    def train(self, vectors: np.ndarray, seed: int = 0):
+        """用样本向量训练编码参数"""
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """将一批向量编码为 (n, code_size) 的uint8数组"""
+
+    @abstractmethod
+    def prepare_query(self, query: np.ndarray):
+        """预计算查询相关的数据（如ADC距离表）"""
+
+    @abstractmethod
+    def distances(self, prepared, codes: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        """
+        查询到一批编码的近似平方L2距离
+        Args:
+            sq_norms: 对应行原始向量的平方范数（部分编码可借此省去解码）
+        """
+
+    @abstractmethod
+    def _params(self) -> Dict[str, np.ndarray]:
+        """需要持久化的编码参数"""
+
+    @abstractmethod
+    def _load_params(self, params):
+        """从持久化参数恢复（params为空时清空参数）"""
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray):
+        """编码并写入指定行"""
+        if not self.is_trained or len(rows) == 0:
+            return
+
+        required = int(rows.max()) + 1
+        self.codes = _grow_memmap(self.codes_path, self.codes, required, self.coded_rows,
+                                  (self.code_size,), np.uint8, self.initial_capacity)
+        for i in range(0, len(rows), 65536):
+            self.codes[rows[i:i + 65536]] = self.encode(vectors[i:i + 65536])
+        self.coded_rows = max(self.coded_rows, required)
+
+    def save(self):
+        """持久化编码参数并落盘编码"""
+        if not self.is_trained:
+            return
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        if self.codes is not None:
+            self.codes.flush()
+        tmp_path = self.params_path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, coded_rows=np.int64(self.coded_rows), **self._params())
+        os.replace(tmp_path, self.params_path)
+
+    def reset(self):
+        """删除编码"""
+        self.codes = None
+        for path in (self.params_path, self.codes_path):
+            if path.exists():
+                path.unlink()
+        self.coded_rows = 0
+        self._load_params({})
+
+    def get_info(self) -> Dict:
+        return {
+            "type": self.name,
+            "trained": self.is_trained,
+            "bytes_per_vector": self.code_size if self.is_trained else None
+        }
+
+class ProductQuantizer(VectorCodec):
+    """乘积量化：向量切分为m段，每段用256个中心编码为1字节"""
+
+    name = "pq"
+
+    def __init__(self, index_dir: Path, m: int = 128, initial_capacity: int = 4096):
+        """
+        Args:
+            m: 子空间数量（每个向量m字节），需整除向量维度
+        """
+        self.m = m
+        self.codebooks = None  # (m, 256, dsub)
+        super().__init__(index_dir, initial_capacity)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+
+    @property
+    def code_size(self) -> int:
+        return self.m
+
+    def train(self, vectors: np.ndarray, seed: int = 0, iterations: int = 12,
+              max_training_points: int = 16384):
+        n, dim = vectors.shape
+        if dim % self.m != 0:
+            raise ValueError(f"PQ子空间数 {self.m} 无法整除向量维度 {dim}")
+        if n < 256:
+            raise ValueError(f"PQ训练至少需要256个向量，当前 {n}")
+
+        rng = np.random.default_rng(seed)
+        if n > max_training_points:
+            vectors = vectors[np.sort(rng.choice(n, max_training_points, replace=False))]
+        sample = np.asarray(vectors, dtype=np.float32)
+
+        dsub = dim // self.m
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(sample[:, j * dsub:(j + 1) * dsub]), 256, iterations, rng)
+            for j in range(self.m)
+        ])
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dsub = self.codebooks.shape[2]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _nearest_centroids(vectors[:, j * dsub:(j + 1) * dsub], self.codebooks[j])
+        return codes
+
+    def prepare_query(self, query: np.ndarray) -> np.ndarray:
+        dsub = self.codebooks.shape[2]
+        sub_queries = query.reshape(self.m, 1, dsub)
+        return ((self.codebooks - sub_queries) ** 2).sum(axis=2).astype(np.float32)  # (m, 256)
+
+    def distances(self, table: np.ndarray, codes: np.ndarray, sq_norms: np.ndarray) -> np.ndarray:
+        # 展平距离表后一次性按 j*256+code 取值，避免逐列的跨步访问；
+        # 下标直接用intp，np.take不必再转换类型
+        flat_index = codes.astype(np.intp) + self._table_offsets
+        return np.take(table.ravel(), flat_index).sum(axis=1, dtype=np.float32)
+
+    def _params(self) -> Dict[str, np.ndarray]:
+        return {'codebooks': self.codebooks}
+
+    @property
+    def _table_offsets(self) -> np.ndarray:
+        return np.arange(self.m, dtype=np.intp) * 256
+
+    def _load_params(self, params):
+        self.codebooks = params['codebooks'] if 'codebooks' in params else None
+        if self.codebooks is not None:
+            self.m = self.codebooks.shape[0]
+
+class ScalarQuantizer(VectorCodec):
+    """标量量化：每个维度按训练集的取值范围线性映射到uint8"""
+
+    name = "int8"
+
+    def __init__(self, index_dir: Path, initial_capacity: int = 4096):
+        self.offset = None
+        self.scale = None
+        super().__init__(index_dir, initial_capacity)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.offset is not None
+
+    @property
+    def code_size(self) -> int:
+        return len(self.offset)
+
+    def train(self, vectors: np.ndarray, seed: int = 0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        low = vectors.min(axis=0)
+        high = vectors.max(axis=0)
+        self.offset = low
+        self.scale = np.maximum(high - low, 1e-12) / 255.0
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        scaled = (np.asarray(vectors, dtype=np.float32) - self.offset) / self.scale
+        return np.clip(np.rint(scaled), 0, 255).astype(np.uint8)
+
+    def prepare_query(self, query: np.ndarray) -> Tuple[np.ndarray, float]:
+        # q·x̂ = (q*scale)·code + q·offset，无需逐元素解码
+        return (query * self.scale).astype(np.float32), float(query @ query - 2.0 * (query @ self.offset))
+
+    def distances(self, prepared: Tuple[np.ndarray, float], codes: np.ndarray,
+                  sq_norms: np.ndarray) -> np.ndarray:
+        scaled_query, constant = prepared
+        # |q - x|² ≈ |x|² + |q|² - 2(q·x̂)，|x|²使用精确值
+        return sq_norms - 2.0 * (codes.astype(np.float32) @ scaled_query) + constant
+
+    def _params(self) -> Dict[str, np.ndarray]:
+        return {'offset': self.offset, 'scale': self.scale}
+
+    def _load_params(self, params):
+        self.offset = params['offset'] if 'offset' in params else None
+        self.scale = params['scale'] if 'scale' in params else None
+
+class NumpyVectorStore:
+    """NumPy暴力检索向量库（ChromaDBManager兼容接口）"""
+
+    def __init__(self, index_dir: str = "./numpy_index",
+                 collection_name: str = "local_image_collection",
+                 dtype: str = 'float32', initial_capacity: int = 4096,
+                 score_chunk_size: int = 65536, ann: Optional[str] = None,
+                 nlist: Optional[int] = None, default_nprobe: int = 8,
+                 ann_min_train_size: int = 10000, codec: Optional[str] = None,
+                 pq_m: int = 128, rerank_factor: int = 10):
+        """
+        初始化向量库
+        Args:
+            index_dir: 存储根目录
+            collection_name: 集合名称（对应子目录）
+            dtype: 向量存储精度 float32 / float16（float16内存减半，查询时分块转换）
+            initial_capacity: 初始行容量
+            score_chunk_size: 查询时每次参与计算的行数
+            ann: 近似检索索引类型，None为精确检索，"ivf"为倒排索引
+            nlist: IVF簇数量，None表示自动确定
+            default_nprobe: 查询未指定nprobe时探测的簇数量
+            ann_min_train_size: 有效向量数达到该值后自动训练IVF/压缩编码，之前使用精确检索
+            codec: 压缩编码类型，None为不压缩，"pq"为乘积量化，"int8"为标量量化
+            pq_m: PQ子空间数量（每个向量的编码字节数）
+            rerank_factor: 压缩编码粗排保留 top_k * rerank_factor 个候选做精确重排
+        """
+        self.index_dir = Path(index_dir)
+        self.collection_name = collection_name
+        self.dtype = np.dtype(dtype)
+        self.initial_capacity = initial_capacity
+        self.score_chunk_size = score_chunk_size
+        self.is_local_mode = True
+        self.ann_type = ann
+        self.nlist = nlist
+        self.default_nprobe = default_nprobe
+        self.ann_min_train_size = ann_min_train_size
+
+        self.codec_type = codec
+        self.pq_m = pq_m
+        self.rerank_factor = rerank_factor
+
+        if ann not in (None, "ivf"):
+            raise ValueError(f"不支持的近似索引类型: {ann}")
+        if codec not in (None, "pq", "int8"):
+            raise ValueError(f"不支持的压缩编码类型: {codec}")
+
+        # 为False时写入不触发首次训练（全量构建期间关闭，写完后由 build_trained_indexes 统一训练）
+        self.auto_train = True
+
+        self._lock = threading.RLock()
+        self.version = 0  # 每次写入/删除/重置/重新训练后递增，查询结果缓存据此失效
+        self._open_collection()
+
+    def _open_collection(self):
+        """打开（或创建）集合目录"""
+        self.collection_dir = self.index_dir / self.collection_name
+        self.collection_dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.collection_dir / "embeddings.npy"
+        self.meta_path = self.collection_dir / "metadata.sqlite"
+
+        self._conn = sqlite3.connect(str(self.meta_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS records (
+                row INTEGER PRIMARY KEY,
+                vector_id TEXT UNIQUE NOT NULL,
+                image_id INTEGER,
+                image_path TEXT,
+                metadata TEXT NOT NULL,
+                document TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_image_id ON records(image_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_image_path ON records(image_path)")
+        self._conn.commit()
+
+        self._row_count = self._conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM records").fetchone()[0]
+
+        if self.vectors_path.exists():
+            self._vectors = np.load(self.vectors_path, mmap_mode='r+')
+        else:
+            self._vectors = None
+
+        # 有效行掩码与平方范数常驻内存
+        self._valid = np.zeros(max(self._row_count, 0), dtype=bool)
+        for (row,) in self._conn.execute("SELECT row FROM records"):
+            self._valid[row] = True
+        self._sq_norms = self._compute_sq_norms(0, self._row_count)
+
+        self.ann = None
+        if self.ann_type == "ivf":
+            self.ann = IVFIndex(self.collection_dir, self.nlist, self.default_nprobe)
+            # 补齐上次持久化之后写入的行
+            if self.ann.is_trained and len(self.ann.assign) < self._row_count:
+                missing = np.arange(len(self.ann.assign), self._row_count)
+                self.ann.add(missing, self._vectors[missing])
+                self.ann.save()
+
+        self.codec = None
+        if self.codec_type == "pq":
+            self.codec = ProductQuantizer(self.collection_dir, self.pq_m, self.initial_capacity)
+        elif self.codec_type == "int8":
+            self.codec = ScalarQuantizer(self.collection_dir, self.initial_capacity)
+        if self.codec is not None and self.codec.is_trained and self.codec.coded_rows < self._row_count:
+            missing = np.arange(self.codec.coded_rows, self._row_count)
+            self.codec.add(missing, np.asarray(self._vectors[missing], dtype=np.float32))
+            self.codec.save()
+
+        logger.info(f"NumPy向量库: {self.collection_dir} ({int(self._valid.sum())} 条有效记录)")
+
+    def _compute_sq_norms(self, start: int, end: int) -> np.ndarray:
+        """分块计算向量平方范数"""
+        if self._vectors is None or end <= start:
+            return np.zeros(0, dtype=np.float32)
+
+        norms = np.empty(end - start, dtype=np.float32)
+        for i in range(start, end, self.score_chunk_size):
+            chunk = np.asarray(self._vectors[i:min(i + self.score_chunk_size, end)], dtype=np.float32)
+            norms[i - start:i - start + len(chunk)] = np.einsum('ij,ij->i', chunk, chunk)
+        return norms
+
+    def _ensure_capacity(self, required_rows: int, dim: int):
+        """容量不足时按倍数扩容向量文件"""
+        if self._vectors is not None and self._vectors.shape[1] != dim:
+            raise ValueError(f"向量维度不匹配: 期望 {self._vectors.shape[1]}, 实际 {dim}")
+
+        self._vectors = _grow_memmap(self.vectors_path, self._vectors, required_rows, self._row_count,
+                                     (dim,), self.dtype, self.initial_capacity)
+
+    def add_images(self, embeddings: Union[List[List[float]], np.ndarray], metadatas: List[Dict],
+                   documents: List[str], ids: List[str], batch_size: int = 5000,
+                   upsert: bool = True) -> int:
+        """
+        添加图片数据（已存在的向量ID会被原地覆盖）
+        Returns:
+            成功写入的记录数
+        """
+        total_items = len(embeddings)
+        if total_items == 0:
+            logger.warning("没有数据需要添加")
+            return 0
+
+        vectors = np.asarray(embeddings, dtype=np.float32)
+
+        with self._lock:
+            existing_rows = {}
+            for i in range(0, len(ids), 900):
+                chunk = list(ids[i:i + 900])
+                placeholders = ', '.join(['?'] * len(chunk))
+                for vector_id, row in self._conn.execute(
+                        f"SELECT vector_id, row FROM records WHERE vector_id IN ({placeholders})", chunk):
+                    existing_rows[vector_id] = row
+
+            if existing_rows and not upsert:
+                raise ValueError(f"向量ID已存在: {list(existing_rows)[:5]}")
+
+            # 分配行号
+            rows = np.empty(total_items, dtype=np.int64)
+            next_row = self._row_count
+            for i, vector_id in enumerate(ids):
+                if vector_id in existing_rows:
+                    rows[i] = existing_rows[vector_id]
+                else:
+                    rows[i] = next_row
+                    next_row += 1
+
+            self._ensure_capacity(next_row, vectors.shape[1])
+            self._vectors[rows] = vectors.astype(self.dtype, copy=False)
+            self._vectors.flush()
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (row, vector_id, image_id, image_path, metadata, document) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (int(row), vector_id, _as_int(metadata.get('id')), metadata.get('image_path', ''),
+                     json.dumps(metadata, ensure_ascii=False), document)
+                    for row, vector_id, metadata, document in zip(rows, ids, metadatas, documents)
+                ]
+            )
+            self._conn.commit()
+
+            # 更新内存中的掩码和范数
+            if next_row > self._row_count:
+                self._valid = np.concatenate([self._valid, np.zeros(next_row - self._row_count, dtype=bool)])
+                self._sq_norms = np.concatenate([self._sq_norms, np.zeros(next_row - self._row_count, dtype=np.float32)])
+                self._row_count = next_row
+            self._valid[rows] = True
+            stored = np.asarray(self._vectors[rows], dtype=np.float32)
+            self._sq_norms[rows] = np.einsum('ij,ij->i', stored, stored)
+
+            if self.ann is not None:
+                if self.ann.is_trained:
+                    self.ann.add(rows, stored)
+                    self.ann.save()
+                elif self.auto_train and int(self._valid.sum()) >= self.ann_min_train_size:
+                    self.build_ann_index()
+
+            if self.codec is not None:
+                if self.codec.is_trained:
+                    self.codec.add(rows, stored)
+                    self.codec.save()
+                elif self.auto_train and int(self._valid.sum()) >= self.ann_min_train_size:
+                    self.build_codec()
+            self.version += 1
+
+        logger.info(f"✅ NumPy向量库写入 {total_items} 条, 当前有效记录 {int(self._valid.sum())}")
+        return total_items
+
+    def _rows_matching(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """将where条件转换为行号数组（None表示不过滤）"""
+        if not where:
+            return None
+
+        clause, params = _where_to_sql(where)
+        rows = [row for (row,) in self._conn.execute(
+            f"SELECT row FROM records WHERE {clause}", params)]
+        return np.asarray(rows, dtype=np.int64)
+
+    def _snapshot(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int]:
+        """
+        取查询所需状态的快照（调用方持有锁）
+        扩容时向量矩阵与范数数组整体替换为新对象，旧引用仍可读；删除只修改有效行掩码，
+        因此复制掩码后即可在锁外扫描，查询与写入互不阻塞
+        Returns:
+            (向量矩阵, 有效行掩码, 平方范数, 行数)
+        """
+        row_count = self._row_count
+        return self._vectors, self._valid[:row_count].copy(), self._sq_norms, row_count
+
+    def _score_rows(self, query: np.ndarray, candidate_rows: Optional[np.ndarray],
+                    snapshot: Tuple) -> Tuple[np.ndarray, np.ndarray]:
+        """计算候选行的平方L2距离"""
+        vectors, valid, sq_norms, row_count = snapshot
+        if candidate_rows is None:
+            scores = np.empty(row_count, dtype=np.float32)
+            for i in range(0, row_count, self.score_chunk_size):
+                end = min(i + self.score_chunk_size, row_count)
+                chunk = vectors[i:end]
+                if chunk.dtype != np.float32:
+                    chunk = chunk.astype(np.float32)
+                scores[i:end] = chunk @ query
+            rows = np.flatnonzero(valid)
+            scores = scores[rows]
+        else:
+            rows = candidate_rows
+            scores = np.asarray(vectors[rows], dtype=np.float32) @ query
+
+        distances = sq_norms[rows] + float(query @ query) - 2.0 * scores
+        return rows, np.maximum(distances, 0.0)
+
+    def _codec_candidates(self, query: np.ndarray, candidate_rows: Optional[np.ndarray],
+                          top_k: int, snapshot: Tuple, codec: 'VectorCodec', codes: np.ndarray) -> np.ndarray:
+        """在压缩编码上用ADC粗排，返回需要精确重排的行号"""
+        _, valid, sq_norms, _ = snapshot
+        prepared = codec.prepare_query(query)
+        if candidate_rows is None:
+            candidate_rows = np.flatnonzero(valid)
+
+        approx = np.empty(len(candidate_rows), dtype=np.float32)
+        # 每块的临时数组（int8转float32、PQ的查表下标）约1MB，留在L2缓存内；
+        # 块过大时临时数组落到内存，粗排反而比精确检索还慢
+        chunk_size = max(256, (256 * 1024) // codec.code_size)
+        for i in range(0, len(candidate_rows), chunk_size):
+            chunk_rows = candidate_rows[i:i + chunk_size]
+            approx[i:i + len(chunk_rows)] = codec.distances(
+                prepared, self._codes_for(codes, chunk_rows), sq_norms[chunk_rows]
+            )
+
+        keep = min(len(candidate_rows), top_k * self.rerank_factor)
+        if keep == len(candidate_rows):
+            return candidate_rows
+        return np.sort(candidate_rows[np.argpartition(approx, keep - 1)[:keep]])
+
+    @staticmethod
+    def _codes_for(codes: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """按行号取压缩编码（严格连续递增的区间直接切片，避免随机读）"""
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and np.all(np.diff(rows) == 1):
+            return codes[rows[0]:rows[-1] + 1]
+        return codes[rows]
+
+    def search_similar_images(self, query_vector: List[float], top_k: int = 10,
+                              where: Optional[Dict] = None, nprobe: Optional[int] = None,
+                              exact: bool = False) -> Dict:
+        """
+        搜索相似图片（返回格式与ChromaDB query一致，距离为平方L2）
+        锁内只做过滤与IVF探测并取快照，向量/编码扫描在锁外进行，最后再加锁取回元数据
+        Args:
+            nprobe: IVF探测簇数量，越大召回越高、越慢；None使用默认值
+            exact: 忽略近似索引和压缩编码，强制精确检索
+        """
+        empty = {'ids': [[]], 'metadatas': [[]], 'documents': [[]], 'distances': [[]]}
+        try:
+            query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+
+            with self._lock:
+                if self._vectors is None or self._row_count == 0:
+                    return empty
+
+                snapshot = self._snapshot()
+                valid, row_count = snapshot[1], snapshot[3]
+                candidate_rows = self._rows_matching(where)
+                if candidate_rows is not None:
+                    candidate_rows = candidate_rows[candidate_rows < row_count]
+                if not exact and self.ann is not None and self.ann.is_trained:
+                    probed = self.ann.candidate_rows(query, nprobe)
+                    # 末尾行删除后行号会被复用，分配表可能长于当前行数
+                    probed = probed[probed < row_count]
+                    probed = probed[valid[probed]]
+                    if candidate_rows is not None:
+                        probed = probed[np.isin(probed, candidate_rows)]
+                    candidate_rows = probed
+                codec = None
+                if not exact and self.codec is not None and self.codec.is_trained:
+                    codec, codes = self.codec, self.codec.codes
+
+            if codec is not None:
+                candidate_rows = self._codec_candidates(query, candidate_rows, top_k, snapshot, codec, codes)
+
+            rows, distances = self._score_rows(query, candidate_rows, snapshot)
+            if len(rows) == 0:
+                return empty
+
+            k = min(top_k, len(rows))
+            top = np.argpartition(distances, k - 1)[:k]
+            top = top[np.argsort(distances[top])]
+
+            with self._lock:
+                records = self._fetch_records(rows[top])
+
+            # 扫描期间被删除的记录跳过
+            found = [(record, float(distance)) for record, distance in zip(records, distances[top])
+                     if record is not None]
+            return {
+                'ids': [[record[0] for record, _ in found]],
+                'metadatas': [[record[1] for record, _ in found]],
+                'documents': [[record[2] for record, _ in found]],
+                'distances': [[distance for _, distance in found]]
+            }
+        except Exception as e:
+            logger.error(f"相似图片搜索失败: {e}")
+            return {}
+
+    def search_similar_images_batch(self, query_vectors: List[List[float]], top_k: int = 10,
+                                    where: Optional[Dict] = None, nprobe: Optional[int] = None) -> Dict:
+        """
+        批量搜索相似图片（返回格式与ChromaDB批量query一致）
+        精确检索时按块做矩阵-矩阵乘法，所有查询共享一次向量扫描（同样在锁外扫描快照）
+        """
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(len(query_vectors), -1)
+        approximate = ((self.ann is not None and self.ann.is_trained) or
+                       (self.codec is not None and self.codec.is_trained))
+        if where or approximate:
+            merged = {'ids': [], 'metadatas': [], 'documents': [], 'distances': []}
+            for query in queries:
+                result = self.search_similar_images(query, top_k, where=where, nprobe=nprobe) or {}
+                for key in merged:
+                    merged[key].append((result.get(key) or [[]])[0])
+            return merged
+
+        try:
+            with self._lock:
+                if self._vectors is None or self._row_count == 0 or top_k <= 0:
+                    return {key: [[] for _ in queries] for key in ('ids', 'metadatas', 'documents', 'distances')}
+                vectors, valid, sq_norms, row_count = self._snapshot()
+
+            query_sq_norms = np.einsum('ij,ij->i', queries, queries)
+            best_distances = np.empty((0, len(queries)), dtype=np.float32)
+            best_rows = np.empty((0, len(queries)), dtype=np.int64)
+
+            for start in range(0, row_count, self.score_chunk_size):
+                end = min(start + self.score_chunk_size, row_count)
+                chunk = np.asarray(vectors[start:end], dtype=np.float32)
+                distances = (sq_norms[start:end, None] + query_sq_norms[None, :]
+                             - 2.0 * (chunk @ queries.T))
+                distances[~valid[start:end]] = np.inf
+
+                k = min(top_k, end - start)
+                top = np.argpartition(distances, k - 1, axis=0)[:k]
+                candidate_distances = np.vstack([best_distances, np.take_along_axis(distances, top, axis=0)])
+                candidate_rows = np.vstack([best_rows, top + start])
+
+                keep = min(top_k, len(candidate_distances))
+                order = np.argpartition(candidate_distances, keep - 1, axis=0)[:keep]
+                best_distances = np.take_along_axis(candidate_distances, order, axis=0)
+                best_rows = np.take_along_axis(candidate_rows, order, axis=0)
+
+            merged = {'ids': [], 'metadatas': [], 'documents': [], 'distances': []}
+            with self._lock:
+                for q in range(len(queries)):
+                    order = np.argsort(best_distances[:, q])
+                    order = order[np.isfinite(best_distances[order, q])]
+                    records = self._fetch_records(best_rows[order, q]) if len(order) else []
+                    found = [(record, float(max(d, 0.0))) for record, d in zip(records, best_distances[order, q])
+                             if record is not None]
+                    merged['ids'].append([record[0] for record, _ in found])
+                    merged['metadatas'].append([record[1] for record, _ in found])
+                    merged['documents'].append([record[2] for record, _ in found])
+                    merged['distances'].append([distance for _, distance in found])
+
+            return merged
+        except Exception as e:
+            logger.error(f"批量相似图片搜索失败: {e}")
+            return {}
+
+    def _fetch_records(self, rows: np.ndarray) -> List[Optional[Tuple[str, Dict, str]]]:
+        """按行号顺序取回 (vector_id, metadata, document)，已删除的行为None"""
+        row_list = [int(row) for row in rows]
+        placeholders = ', '.join(['?'] * len(row_list))
+        fetched = {
+            row: (vector_id, json.loads(metadata), document)
+            for row, vector_id, metadata, document in self._conn.execute(
+                f"SELECT row, vector_id, metadata, document FROM records WHERE row IN ({placeholders})",
+                row_list
+            )
+        }
+        return [fetched.get(row) for row in row_list]
+
+    def build_ann_index(self, nlist: Optional[int] = None, iterations: int = 20):
+        """
+        （重新）训练近似检索索引并分配全部有效向量
+        数据分布明显变化后可调用以重新划分簇
+        """
+        if self.ann is None:
+            logger.warning("未启用近似检索索引")
+            return
+
+        with self._lock:
+            rows = np.flatnonzero(self._valid)
+            if len(rows) == 0:
+                logger.warning("没有向量可用于训练近似索引")
+                return
+
+            start_time = time.time()
+            if nlist:
+                self.ann.nlist = nlist
+            vectors = np.asarray(self._vectors[rows], dtype=np.float32)
+            self.ann.train(vectors, iterations=iterations)
+            self.ann.add(rows, vectors)
+            self.ann.save()
+            self.version += 1
+
+        logger.info(f"✅ IVF索引训练完成: {len(rows)} 个向量, nlist={self.ann.nlist}, "
+                    f"耗时 {time.time() - start_time:.1f}s")
+
+    def build_codec(self):
+        """
+        （重新）训练压缩编码并编码全部向量
+        训练后查询只扫描常驻内存的压缩编码，原始向量仅用于少量候选的精确重排
+        """
+        if self.codec is None:
+            logger.warning("未启用压缩编码")
+            return
+
+        with self._lock:
+            valid_rows = np.flatnonzero(self._valid)
+            if len(valid_rows) == 0:
+                logger.warning("没有向量可用于训练压缩编码")
+                return
+
+            start_time = time.time()
+            self.codec.train(np.asarray(self._vectors[valid_rows], dtype=np.float32))
+            self.codec.coded_rows = 0
+            all_rows = np.arange(self._row_count)
+            for i in range(0, self._row_count, self.score_chunk_size):
+                chunk_rows = all_rows[i:i + self.score_chunk_size]
+                self.codec.add(chunk_rows, np.asarray(self._vectors[chunk_rows[0]:chunk_rows[-1] + 1], dtype=np.float32))
+            self.codec.save()
+            self.version += 1
+
+        logger.info(f"✅ {self.codec.name}编码训练完成: {len(valid_rows)} 个向量, "
+                    f"每向量 {self.codec.code_size} 字节, 耗时 {time.time() - start_time:.1f}s")
+
+    def build_trained_indexes(self):
+        """
+        用全部有效向量（重新）训练已启用的IVF索引与压缩编码
+        全量构建写完后调用，避免只用最先写入的一批向量训练；有效向量数不足
+        ann_min_train_size 时跳过，继续使用精确检索
+        """
+        if self.ann is None and self.codec is None:
+            return
+        valid_count = int(self._valid.sum())
+        if valid_count < self.ann_min_train_size:
+            logger.info(f"有效向量 {valid_count} 条，不足 {self.ann_min_train_size}，暂不训练近似索引/压缩编码")
+            return
+        if self.ann is not None:
+            self.build_ann_index()
+        if self.codec is not None:
+            self.build_codec()
+
+    def get_images_by_ids(self, image_ids: List[int],
+                          include: Optional[List[str]] = None) -> Dict:
+        """
+        按MySQL记录ID获取数据（返回格式与ChromaDB get一致）
+        """
+        return self._get_records("image_id", [int(image_id) for image_id in image_ids], include)
+
+    def get_images_by_paths(self, image_paths: List[str],
+                            include: Optional[List[str]] = None) -> Dict:
+        """
+        按图片路径获取数据（返回格式与ChromaDB get一致）
+        """
+        return self._get_records("image_path", list(image_paths), include)
+
+    def _get_records(self, column: str, values: List, include: Optional[List[str]]) -> Dict:
+        """按指定列取回记录"""
+        include = include or ['metadatas']
+        result = {'ids': [], 'metadatas': [], 'documents': [], 'embeddings': []}
+        if not values:
+            return result
+
+        with self._lock:
+            placeholders = ', '.join(['?'] * len(values))
+            rows = self._conn.execute(
+                f"SELECT row, vector_id, metadata, document FROM records "
+                f"WHERE {column} IN ({placeholders}) ORDER BY row",
+                values
+            ).fetchall()
+
+            for row, vector_id, metadata, document in rows:
+                result['ids'].append(vector_id)
+                result['metadatas'].append(json.loads(metadata))
+                result['documents'].append(document)
+                if 'embeddings' in include:
+                    result['embeddings'].append(np.asarray(self._vectors[row], dtype=np.float32))
+
+        return result
+
+    def get_collection_info(self) -> Dict:
+        """获取集合信息"""
+        with self._lock:
+            count = int(self._valid.sum())
+        info = {
+            "name": self.collection_name,
+            "count": count,
+            "mode": "numpy"
+        }
+        if self.ann is not None:
+            info["ann"] = self.ann.get_info()
+        if self.codec is not None:
+            info["codec"] = self.codec.get_info()
+        return info
+
+    def reset_collection(self):
+        """重置集合"""
+        try:
+            with self._lock:
+                self._conn.close()
+                self._vectors = None
+                if self.ann is not None:
+                    self.ann.reset()
+                if self.codec is not None:
+                    self.codec.reset()
+                for path in (self.vectors_path, self.meta_path):
+                    if path.exists():
+                        path.unlink()
+                self._open_collection()
+                self.version += 1
+            logger.info("集合已重置")
+        except Exception as e:
+            logger.error(f"重置集合失败: {e}")
+
+    def with_collection(self, collection_name: str) -> 'NumpyVectorStore':
+        """以相同配置打开同一目录下的另一个集合"""
+        return NumpyVectorStore(
+            self.index_dir, collection_name, dtype=self.dtype,
+            initial_capacity=self.initial_capacity, score_chunk_size=self.score_chunk_size,
+            ann=self.ann_type, nlist=self.nlist, default_nprobe=self.default_nprobe,
+            ann_min_train_size=self.ann_min_train_size, codec=self.codec_type,
+            pq_m=self.pq_m, rerank_factor=self.rerank_factor
+        )
+
+    def delete_collection(self):
+        """
+        删除整个集合目录
+        已打开的内存映射和SQLite连接不关闭，切换前发出的查询仍可读完
+        """
+        with self._lock:
+            shutil.rmtree(self.collection_dir, ignore_errors=True)
+            self.version += 1
+        logger.info(f"🗑️ 已删除集合 {self.collection_name}")
+
+    def get_all_existing_ids(self) -> set:
+        """获取所有已存在的MySQL记录ID"""
+        return set(self.get_existing_id_paths().keys())
+
+    def get_existing_id_paths(self) -> Dict[int, str]:
+        """获取所有已存在的ID及其图片路径"""
+        with self._lock:
+            return {
+                int(image_id): image_path
+                for image_id, image_path in self._conn.execute(
+                    "SELECT image_id, image_path FROM records WHERE image_id IS NOT NULL"
+                )
+            }
+
+    def delete_images_by_ids(self, image_ids: List[int], batch_size: int = 1000) -> int:
+        """按MySQL记录ID删除向量"""
+        image_ids = [int(image_id) for image_id in image_ids]
+        deleted = 0
+
+        with self._lock:
+            for i in range(0, len(image_ids), batch_size):
+                batch_ids = image_ids[i:i + batch_size]
+                placeholders = ', '.join(['?'] * len(batch_ids))
+                rows = [row for (row,) in self._conn.execute(
+                    f"SELECT row FROM records WHERE image_id IN ({placeholders})", batch_ids)]
+                # 删除的记录释放向量ID，行号保留为空洞
+                self._conn.execute(f"DELETE FROM records WHERE image_id IN ({placeholders})", batch_ids)
+                if rows:
+                    self._valid[np.asarray(rows, dtype=np.int64)] = False
+                deleted += len(batch_ids)
+            self._conn.commit()
+            self.version += 1
+
+        logger.info(f"🗑️ 已删除 {deleted} 个ID对应的向量")
+        return deleted
+
+def _grow_memmap(path: Path, array: Optional[np.memmap], required_rows: int, used_rows: int,
+                 row_shape: Tuple[int, ...], dtype, initial_capacity: int) -> np.memmap:
+    """按需创建或倍增扩容按行存储的.npy内存映射文件，返回新的映射"""
+    if array is None:
+        capacity = max(initial_capacity, required_rows)
+        return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(capacity,) + row_shape)
+
+    capacity = array.shape[0]
+    if required_rows <= capacity:
+        return array
+
+    new_capacity = max(capacity, 1)
+    while new_capacity < required_rows:
+        new_capacity *= 2
+
+    tmp_path = path.with_suffix('.tmp.npy')
+    grown = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(new_capacity,) + row_shape)
+    grown[:used_rows] = array[:used_rows]
+    grown.flush()
+    del grown
+
+    array.flush()
+    del array
+    os.replace(tmp_path, path)
+    logger.info(f"扩容 {path.name}: {capacity} -> {new_capacity} 行")
+    return np.load(path, mmap_mode='r+')
+
+def _kmeans(sample: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd k-means，返回簇中心"""
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _nearest_centroids(sample, centroids)
+        order = np.argsort(labels, kind='stable')
+        present, starts = np.unique(labels[order], return_index=True)
+        sums = np.zeros_like(centroids)
+        sums[present] = np.add.reduceat(sample[order], starts, axis=0)
+        counts = np.bincount(labels, minlength=k)
+
+        nonempty = counts > 0
+        centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+        # 空簇用随机样本重新初始化
+        empty = np.flatnonzero(~nonempty)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+def _nearest_centroids(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+    """分块计算每个向量最近的簇中心"""
+    centroid_sq_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for i in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[i:i + chunk_size], dtype=np.float32)
+        labels[i:i + len(chunk)] = np.argmin(centroid_sq_norms - 2.0 * (chunk @ centroids.T), axis=1)
+    return labels
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _where_to_sql(where: Dict) -> Tuple[str, List]:
+    """
+    将ChromaDB风格的where条件转换为SQL
+    支持: {"key": value}, {"key": {"$eq"/"$ne"/"$in"/"$nin"/"$gt"/"$gte"/"$lt"/"$lte": ...}}, {"$and"/"$or": [...]}
+    """
+    clauses = []
+    params = []
+
+    for key, condition in where.items():
+        if key in ('$and', '$or'):
+            sub_clauses = []
+            for sub_where in condition:
+                sub_clause, sub_params = _where_to_sql(sub_where)
+                sub_clauses.append(f"({sub_clause})")
+                params.extend(sub_params)
+            joiner = ' AND ' if key == '$and' else ' OR '
+            clauses.append(joiner.join(sub_clauses))
+            continue
+
+        column = "image_id" if key == 'id' else "json_extract(metadata, ?)"
+        column_params = [] if key == 'id' else [f"$.{key}"]
+
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+
+        for operator, value in condition.items():
+            if operator in ('$in', '$nin'):
+                values = list(value)
+                if not values:
+                    clauses.append("0" if operator == '$in' else "1")
+                    continue
+                placeholders = ', '.join(['?'] * len(values))
+                negate = 'NOT ' if operator == '$nin' else ''
+                clauses.append(f"{column} {negate}IN ({placeholders})")
+                params.extend(column_params + values)
+            else:
+                sql_operator = {
+                    '$eq': '=', '$ne': '!=', '$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='
+                }.get(operator)
+                if sql_operator is None:
+                    raise ValueError(f"不支持的where操作符: {operator}")
+                clauses.append(f"{column} {sql_operator} ?")
+                params.extend(column_params + [value])
+
+    return ' AND '.join(clauses) if clauses else '1', params